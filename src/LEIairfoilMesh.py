@@ -1,5 +1,5 @@
+import foamMesh
 import numpy as np
-import gmsh
 
 # Interpolation function for creating smooth transitions between points
 # Input: 
@@ -9,100 +9,193 @@ import gmsh
 # Output:
 #   points - List of interpolated points [[x1, y1], [x2, y2], ...]
 def interpolation(P1, P2, t1, t2, n=20):
-    x1 = P1[0]
-    x2 = P2[0]
-    y1 = P1[1]
-    y2 = P2[1]
-    b = np.array([y1, y2, np.tan(t1), np.tan(t2)])
-    A = np.array([[x1 ** 3, x1 ** 2, x1, 1],
-                  [x2 ** 3, x2 ** 2, x2, 1],
-                  [3 * x1 ** 2, 2 * x1, 1, 0],
-                  [3 * x2 ** 2, 2 * x2, 1, 0]])
-    C = np.linalg.solve(A, b)
-    x1 = np.linspace(x1, x2, n)
-    y1 = C[0] * x1 ** 3 + C[1] * x1 ** 2 + C[2] * x1 + C[3]
-    points = np.transpose(np.vstack((x1, y1)))
-    return points   
+    return interpolation_batch(np.array([P1]), np.array([P2]), t1, t2, n)[0]
 
 
-# Function to create and mesh an LEI airfoil with given parameters
-def mesh_LEI_airfoil(Corde_length, Depth, tube_size, at, Seam_angle, TE_angle, nb_pts, lc_prof, lc_edge, xmax, ymax, ep, yh):
+# Interpolation function for a batch of profiles: the cubic of each profile is
+# found with one batched 4x4 solve
+# Input:
+#   P1, P2 - Coordinates of the two ends, arrays (B, 2)
+#   t1, t2 - Tangent slopes at the two ends, scalars or arrays (B,)
+#   n - Number of points of each profile
+# Output:
+#   points - Array (B, n, 2)
+def interpolation_batch(P1, P2, t1, t2, n=20):
+    x1, y1 = P1[:, 0], P1[:, 1]
+    x2, y2 = P2[:, 0], P2[:, 1]
+    t1 = np.broadcast_to(t1, x1.shape)
+    t2 = np.broadcast_to(t2, x1.shape)
+    zero = np.zeros_like(x1)
+    one = np.ones_like(x1)
+    b = np.stack([y1, y2, np.tan(t1), np.tan(t2)], axis=-1)
+    A = np.stack([np.stack([x1 ** 3, x1 ** 2, x1, one], axis=-1),
+                  np.stack([x2 ** 3, x2 ** 2, x2, one], axis=-1),
+                  np.stack([3 * x1 ** 2, 2 * x1, one, zero], axis=-1),
+                  np.stack([3 * x2 ** 2, 2 * x2, one, zero], axis=-1)], axis=1)
+    C = np.linalg.solve(A, b[..., None])[..., 0]
+    x = np.linspace(x1, x2, n, axis=1)
+    y = C[:, 0:1] * x ** 3 + C[:, 1:2] * x ** 2 + C[:, 2:3] * x + C[:, 3:4]
+    return np.stack((x, y), axis=-1)
 
-    output = True  # mesh.msh output
-    gmsh_GUI = False  # gmsh GUI
 
-    # Calculate number of points for each segment based on the given parameters
+# Function to compute the number of points of each segment of the profile
+# Output:
+#   n1 - points of the tube arc, n2 - points of the front membrane, n3 - points of the rear membrane
+def segment_points(nb_pts, tube_size, at):
     n1 = np.int_(nb_pts * (6 * tube_size) / (6 * tube_size + 200))
     n2 = np.int_(nb_pts * (2 * at) / (6 * tube_size + 200))
     n3 = np.int_(nb_pts * (2 * (100 - at)) / (6 * tube_size + 200))
+    return int(n1), int(n2), int(n3)
+
+
+# Function to build a batch of LEI airfoil profiles without gmsh
+# Input:
+#   Corde_length, Depth, tube_size, at, Seam_angle, TE_angle - Scalars or arrays (B,)
+#   nb_pts - Number of points to define a profile
+#   n_segments - Points of the segments (n1, n2, n3), shared by the whole batch
+#                (default: segment_points for the median tube size and camber position)
+# Output:
+#   profiles - Dictionary with
+#       points - Points of the profiles, array (B, N, 2)
+#       P3, P33, P34 - Trailing edge points, arrays (B, 2)
+#       n_segments - (n1, n2, n3)
+def LEI_profiles(Corde_length, Depth, tube_size, at, Seam_angle, TE_angle, nb_pts=100, n_segments=None):
+    Corde_length, Depth, tube_size, at, Seam_angle, TE_angle = np.broadcast_arrays(
+        *[np.atleast_1d(np.asarray(v, dtype=float)) for v in (Corde_length, Depth, tube_size, at, Seam_angle, TE_angle)])
+    if n_segments is None:
+        n_segments = segment_points(nb_pts, np.median(tube_size), np.median(at))
+    n1, n2, n3 = n_segments
 
     # Convert angles from degrees to radians
     Seam_angle = np.pi * Seam_angle / 180
     TE_angle = np.pi * TE_angle / 180
     radius = tube_size * Corde_length / 100 / 2  # Radius of the tube
-    Origin_Circle = [radius, 0]
 
     e = 0.5  # Thickness, default to 0.5% of the chord length
     e = Corde_length * e / 100
-    delta_Seam_angle = np.pi  
+    delta_Seam_angle = np.pi
 
     # Generate points for the circular arc at the leading edge
-    theta = np.linspace(3 * np.pi - Seam_angle - delta_Seam_angle, np.pi - Seam_angle, n1)
-    x_cr = Origin_Circle[0] + radius * np.cos(theta)
-    y_cr = Origin_Circle[1] + radius * np.sin(theta)
-    points0 = np.transpose(np.array([x_cr, y_cr]))
+    theta = np.linspace(3 * np.pi - Seam_angle - delta_Seam_angle, np.pi - Seam_angle, n1, axis=1)
+    points0 = np.stack((radius[:, None] + radius[:, None] * np.cos(theta), radius[:, None] * np.sin(theta)), axis=-1)
 
     # Define key points on the airfoil
-    P1 = [radius * (1 - np.cos(Seam_angle)), radius * np.sin(Seam_angle)]
-    P2 = [at / 100 * Corde_length, Depth / 100 * Corde_length]
-    P22 = [at / 100 * Corde_length, Depth / 100 * Corde_length - e]
-    P3 = [Corde_length, 0]
+    P1 = np.stack([radius * (1 - np.cos(Seam_angle)), radius * np.sin(Seam_angle)], axis=-1)
+    P2 = np.stack([at / 100 * Corde_length, Depth / 100 * Corde_length], axis=-1)
+    P22 = np.stack([at / 100 * Corde_length, Depth / 100 * Corde_length - e], axis=-1)
+    P3 = np.stack([Corde_length, np.zeros_like(Corde_length)], axis=-1)
     r1 = e * 0.2
-    P31 = [P3[0] + r1 * np.sin(TE_angle), P3[1] + r1 * np.cos(TE_angle)]
-    P32 = [P3[0] - r1 * np.sin(TE_angle), P3[1] - r1 * np.cos(TE_angle)]
-    P33 = [P3[0] + r1 * np.sin(TE_angle + np.pi / 180 * 5), P3[1] + r1 * np.cos(TE_angle + np.pi / 180 * 5)]
-    P34 = [P3[0] + r1 * np.sin(TE_angle + np.pi / 180 * 175), P3[1] + r1 * np.cos(TE_angle + np.pi / 180 * 175)]
+    P31 = np.stack([P3[:, 0] + r1 * np.sin(TE_angle), P3[:, 1] + r1 * np.cos(TE_angle)], axis=-1)
+    P32 = np.stack([P3[:, 0] - r1 * np.sin(TE_angle), P3[:, 1] - r1 * np.cos(TE_angle)], axis=-1)
+    P33 = np.stack([P3[:, 0] + r1 * np.sin(TE_angle + np.pi / 180 * 5), P3[:, 1] + r1 * np.cos(TE_angle + np.pi / 180 * 5)], axis=-1)
+    P34 = np.stack([P3[:, 0] + r1 * np.sin(TE_angle + np.pi / 180 * 175), P3[:, 1] + r1 * np.cos(TE_angle + np.pi / 180 * 175)], axis=-1)
 
     # Smooth the profile with additional points
     r = 0.06
     beta = Seam_angle
-    P4 = [radius + (radius + r) * (-np.cos(Seam_angle + delta_Seam_angle)), (radius + r) * np.sin(Seam_angle + delta_Seam_angle)]
-    P5 = [P4[0] - r * np.cos(beta), P4[1] + r * np.sin(beta)]
-    ls_beta = np.linspace(np.pi - beta, 2 * np.pi - Seam_angle - delta_Seam_angle, 20)  # 20 points for the circle
-    x_cr_1 = P4[0] + r * np.cos(ls_beta)
-    y_cr_1 = P4[1] + r * np.sin(ls_beta)
-    points5 = np.transpose(np.array([x_cr_1, y_cr_1]))
+    P4 = np.stack([radius + (radius + r) * (-np.cos(Seam_angle + delta_Seam_angle)), (radius + r) * np.sin(Seam_angle + delta_Seam_angle)], axis=-1)
+    P5 = np.stack([P4[:, 0] - r * np.cos(beta), P4[:, 1] + r * np.sin(beta)], axis=-1)
+    ls_beta = np.linspace(np.pi - beta, 2 * np.pi - Seam_angle - delta_Seam_angle, 20, axis=1)  # 20 points for the circle
+    points5 = np.stack((P4[:, 0:1] + r * np.cos(ls_beta), P4[:, 1:2] + r * np.sin(ls_beta)), axis=-1)
 
     # Create points for each segment using interpolation
-    points1 = interpolation(P1, P2, (np.pi / 2) - Seam_angle, 0, n2)
-    points2 = interpolation(P2, P31, 0, -TE_angle, n3)
-    points3 = interpolation(P32, P22, -TE_angle, 0, n3)
-    points4 = interpolation(P22, P5, 0, (np.pi / 2) - Seam_angle, n2)
+    points1 = interpolation_batch(P1, P2, (np.pi / 2) - Seam_angle, 0, n2)
+    points2 = interpolation_batch(P2, P31, 0, -TE_angle, n3)
+    points3 = interpolation_batch(P32, P22, -TE_angle, 0, n3)
+    points4 = interpolation_batch(P22, P5, 0, (np.pi / 2) - Seam_angle, n2)
 
     # Combine all points into a single array
-    points = np.vstack((points0, points1[1:], points2[1:], points3[:], points4[1:], points5[1:-1]))
+    points = np.concatenate((points0, points1[:, 1:], points2[:, 1:], points3, points4[:, 1:], points5[:, 1:-1]), axis=1)
+    return {"points": points, "P3": P3, "P33": P33, "P34": P34, "n_segments": (n1, n2, n3)}
+
+
+# Function to compute the derived quantities of a batch of profiles
+# The upper and lower surfaces are the highest and lowest crossings of the
+# closed profile at each x station.
+# Input:
+#   points - Points of the profiles, array (B, N, 2) (see LEI_profiles)
+#   n_x - Number of x stations for the thickness and camber distributions
+# Output:
+#   properties - Dictionary of arrays: x (B, n_x), thickness and camber (B, n_x),
+#                area, max_thickness, x_max_thickness, max_camber, x_max_camber (B,)
+def profile_properties(points, n_x=50):
+    x0 = points[:, :, 0]
+    y0 = points[:, :, 1]
+    x1 = np.roll(x0, -1, axis=1)
+    y1 = np.roll(y0, -1, axis=1)
+    # Area of the closed profile (shoelace formula)
+    area = 0.5 * np.abs(np.sum(x0 * y1 - x1 * y0, axis=1))
+
+    # x stations, the crossings of each edge are scattered on the stations it spans
+    x_min = x0.min(axis=1, keepdims=True)
+    dx = (x0.max(axis=1, keepdims=True) - x_min) / (n_x + 1)
+    x = x_min + dx * np.arange(1, n_x + 1)
+    k_lo = np.ceil((np.minimum(x0, x1) - x_min) / dx).astype(int)
+    k_hi = np.floor((np.maximum(x0, x1) - x_min) / dx).astype(int)
+    k_lo = np.clip(k_lo, 1, n_x + 1)
+    k_hi = np.clip(k_hi, 0, n_x)
+    upper = np.full(x.shape, -np.inf)
+    lower = np.full(x.shape, np.inf)
+    batch = np.broadcast_to(np.arange(len(points))[:, None], x0.shape)
+    for j in range(max(int(np.max(k_hi - k_lo)) + 1, 0)):
+        k = k_lo + j
+        valid = k <= k_hi
+        xs = x_min + dx * k
+        with np.errstate(divide='ignore', invalid='ignore'):
+            t = np.where(x1 != x0, (xs - x0) / (x1 - x0), 0)
+        y = y0 + t * (y1 - y0)
+        np.maximum.at(upper, (batch[valid], k[valid] - 1), y[valid])
+        np.minimum.at(lower, (batch[valid], k[valid] - 1), y[valid])
+    thickness = upper - lower
+    camber = (upper + lower) / 2
+    rows = np.arange(len(points))
+    i_t = np.argmax(thickness, axis=1)
+    i_c = np.argmax(camber, axis=1)
+    return {"x": x, "thickness": thickness, "camber": camber, "area": area,
+            "max_thickness": thickness[rows, i_t], "x_max_thickness": x[rows, i_t],
+            "max_camber": camber[rows, i_c], "x_max_camber": x[rows, i_c]}
+
+
+# Function to create and mesh an LEI airfoil with given parameters
+#   mesh_file - gmsh mesh written (.msh, format 2.2, None for no file)
+#   n_threads - Threads of gmsh (None: gmsh default)
+#   mesh_case - Case where the polyMesh is written directly (binary, see foamMesh), None for no polyMesh
+def mesh_LEI_airfoil(Corde_length, Depth, tube_size, at, Seam_angle, TE_angle, nb_pts, lc_prof, lc_edge, xmax, ymax, ep, yh, mesh_file="data/mesh.msh", n_threads=None, mesh_case=None):
+    import gmsh
+
+    output = True  # mesh.msh output
+    gmsh_GUI = False  # gmsh GUI
+
+    # Profile of the airfoil, with the number of points of each segment based on the given parameters
+    profile = LEI_profiles(Corde_length, Depth, tube_size, at, Seam_angle, TE_angle, nb_pts,
+                           segment_points(nb_pts, tube_size, at))
+    points = profile["points"][0]
+    P3, P33, P34 = profile["P3"][0], profile["P33"][0], profile["P34"][0]
+    n1, n2, n3 = profile["n_segments"]  # points of the segments, used to number the gmsh points
 
     if output:
         # Write mesh to file using gmsh
         gmsh.initialize()
         gmsh.option.setNumber("General.ExpertMode", 1)  # Enable expert mode (to disable all the messages meant for inexperienced users)
+        if n_threads is not None:
+            gmsh.option.setNumber("General.NumThreads", n_threads)  # threads of this gmsh instance (0: all the cores)
         gmsh.model.add("mesh")
 
         # Add points to the gmsh model
-        for i in range(1, len(points0) + 1):
+        for i in range(1, n1 + 1):
             gmsh.model.geo.addPoint(points[i][0], points[i][1], 0, lc_prof)  # leading edge
-        for i in range(len(points0) + 1, len(points)):
+        for i in range(n1 + 1, len(points)):
             gmsh.model.geo.addPoint(points[i][0], points[i][1], 0, lc_prof)
         gmsh.model.geo.addPoint(P33[0], P33[1], 0, lc_prof / 10, 10000)  # P33
         gmsh.model.geo.addPoint(P34[0], P34[1], 0, lc_prof / 10, 10002)  # P34
         gmsh.model.geo.addPoint(P3[0], P3[1], 0, lc_prof, 10001)  # P3
 
         # Create splines and arcs to form the airfoil shape
-        gmsh.model.geo.addSpline(np.arange(1, len(points0) + len(points1) + len(points2) - 2))
-        gmsh.model.geo.addCircleArc(len(points0) + len(points1) + len(points2) - 3, 10001, 10000)
+        gmsh.model.geo.addSpline(np.arange(1, n1 + n2 + n3 - 2))
+        gmsh.model.geo.addCircleArc(n1 + n2 + n3 - 3, 10001, 10000)
         gmsh.model.geo.addCircleArc(10000, 10001, 10002)
-        gmsh.model.geo.addCircleArc(10002, 10001, len(points0) + len(points1) + len(points2) - 2)
-        gmsh.model.geo.addSpline(np.hstack((np.arange(len(points0) + len(points1) + len(points2) - 2, len(points)), [1])))
+        gmsh.model.geo.addCircleArc(10002, 10001, n1 + n2 + n3 - 2)
+        gmsh.model.geo.addSpline(np.hstack((np.arange(n1 + n2 + n3 - 2, len(points)), [1])))
         gmsh.model.geo.addCurveLoop([1, 2, 3, 4, 5])
 
         # creation of the fluid domain
@@ -138,8 +231,12 @@ def mesh_LEI_airfoil(Corde_length, Depth, tube_size, at, Seam_angle, TE_angle, n
         # Finalization and file output
         gmsh.model.geo.synchronize()
         gmsh.model.mesh.generate()
-        gmsh.option.setNumber("Mesh.MshFileVersion",2.2)   
-        gmsh.write("data/mesh.msh")
+        if mesh_case is not None:
+            # polyMesh written from the arrays of gmsh, without .msh file nor gmshToFoam
+            foamMesh.write(foamMesh.from_gmsh(), mesh_case)
+        if mesh_file is not None:
+            gmsh.option.setNumber("Mesh.MshFileVersion",2.2)   
+            gmsh.write(mesh_file)
         if gmsh_GUI:
             gmsh.fltk.run()
         gmsh.finalize()
@@ -157,16 +254,36 @@ def computeRe(Va, L, nu):
 def computeU_eq(Re, nu):
     return Re*nu         
 
-# Function to compute boundary layer thickness
+# Function to compute the height of the first cell of the boundary layer for a target y+
 def compute_deltay(Re, U, rho, nu, yplus=1) :
     Cf = 0.0576*(Re)**(-1/5)  # Empirical relation for skin friction coefficient Cf
-    print(Cf)
     tau = 0.5*rho*Cf*U**2
     utau = np.sqrt(tau/rho)
-    print(utau)
     return yplus * nu / utau
 
 # Empirical relation for the turbulent boundary layer thickness at the trailing edge
 def compute_delta_te(Re):
-    return 0.38*Re**(-1/5)*1 
+    return 0.38*Re**(-1/5)*1
 
+# Function to group Reynolds numbers into bands meshed with the same boundary layer
+# The first cell height of a band is the one of its highest Re (y+ <= yplus at every Re of the band),
+# a band spans first cell heights within a factor spread, so that y+ stays above yplus / spread.
+# The boundary layer thickness is the one of its lowest Re (the thickest).
+# Input:
+#   Re_values - Reynolds numbers (chord of 1, see computeU_eq)
+#   rho, nu - Density and kinematic viscosity of the air
+#   yplus - Target y+ of the first cell
+#   spread - Ratio of the first cell heights of the lowest and highest Re of a band
+# Output:
+#   bands - List of (Reynolds numbers of the band, yh, ep), by increasing Re
+def reynolds_bands(Re_values, rho, nu, yplus=1, spread=2):
+    bands = []
+    for Re in sorted(set(Re_values)):
+        yh = float(compute_deltay(Re, computeU_eq(Re, nu), rho, nu, yplus))
+        if bands and bands[-1][1] / yh <= spread:
+            bands[-1][0].append(Re)
+            bands[-1][2] = yh
+        else:
+            # Reynolds numbers, yh of the lowest Re, yh of the highest Re
+            bands.append([[Re], yh, yh])
+    return [(Res, yh, compute_delta_te(Res[0])) for Res, _, yh in bands]
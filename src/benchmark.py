@@ -0,0 +1,322 @@
+import LEIairfoilMesh
+import caseManager
+import designSweep
+import foamStub
+import gridStudy
+import meshCache
+import polarStore
+import runOpenFoam
+import argparse
+import csv
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import numpy as np
+
+BENCH_DIR = "results/benchmarks"
+WORK_DIR = "openFoam/benchmark"
+
+# Reference geometries of the benchmark (overriding designSweep.DEFAULTS)
+REFERENCE_GEOMETRIES = {
+    "default": {},
+    "thin-tube": {"tube_size": 6, "Depth": 8, "TE_angle": 5},
+    "deep": {"tube_size": 11, "Depth": 13, "at": 30},
+}
+RATIOS = [1]            # mesh refinement ratios of each geometry (see gridStudy.refine)
+ALPHAS = [4, 12]        # angles of attack solved on each mesh
+STAGES = ["mesh", "convert", "setup", "solve", "post"]
+METRICS = ["wall_time", "peak_rss", "bytes_written", "disk_usage"]
+THRESHOLD = 0.1         # relative increase reported as a regression by compare
+# Differences below which a metric is not compared (timer and allocator noise)
+MIN_DIFFERENCES = {"wall_time": 0.1, "peak_rss": 10e6, "bytes_written": 1e6, "disk_usage": 1e6}
+# Modules whose import time is measured by startup, and the heavy dependencies reported when an import loads them
+STARTUP_MODULES = ["polarPipeline", "main_compute_polars", "plot_polars", "test_mesh", "polarStore", "polarReport",
+                   "runOpenFoam", "meshCache", "designSweep"]
+HEAVY_MODULES = ["numpy", "gmsh", "matplotlib"]
+
+
+# Stages of the pipeline, each one is run in its own process by measure
+# With native, the polyMesh is written by the mesh stage and the convert stage only sets the patch types
+def mesh_stage(params, mesh_file, mesh_case, native):
+    if native:
+        LEIairfoilMesh.mesh_LEI_airfoil(*[params[name] for name in meshCache.MESH_PARAMETERS], mesh_file=None,
+                                        mesh_case=mesh_case)
+        return None
+    LEIairfoilMesh.mesh_LEI_airfoil(*[params[name] for name in meshCache.MESH_PARAMETERS], mesh_file=mesh_file)
+    return msh_elements(mesh_file)
+
+
+def convert_stage(mesh_file, mesh_case, native):
+    runOpenFoam.prepare_mesh(None if native else mesh_file, mesh_case)
+    return runOpenFoam.cell_count(mesh_case)
+
+
+def setup_stage(U, alphas, mesh_case, case_root, storage, conv_window):
+    return [runOpenFoam.setup_case(U, alpha, mesh_case, case_root, storage, conv_window) for alpha in alphas]
+
+
+def solve_stage(case_dirs, conv_window, conv_tol):
+    return [runOpenFoam.run_solver(case_dir, 1, conv_window, conv_tol) for case_dir in case_dirs]
+
+
+def post_stage(params, alphas, case_dirs, window_values, case_root):
+    rows = [runOpenFoam.read_result(case_dir, alpha, values) for alpha, case_dir, values in zip(alphas, case_dirs, window_values)]
+    with open(case_root + "/polar.csv", 'w', newline='') as f:
+        csv.writer(f).writerows(rows)
+    polarStore.append([polarStore.record(params, row, case_name="benchmark") for row in rows], case_root + "/polars")
+    for case_dir in case_dirs:
+        caseManager.finalize(case_dir, cases_dir=case_root)
+    return rows
+
+
+# Function to read the number of elements of a gmsh mesh (.msh, format 2.2)
+def msh_elements(mesh_file):
+    with open(mesh_file, 'rb') as f:
+        for line in f:
+            if line.startswith(b'$Elements'):
+                return int(f.readline())
+    return 0
+
+
+def _run_stage(connection, function, args):
+    start = time.perf_counter()
+    try:
+        result, error = function(*args), None
+    except Exception as e:
+        result, error = None, repr(e)
+    wall_time = time.perf_counter() - start
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    # ru_maxrss is in kB, ru_oublock in blocks of 512 bytes (Linux)
+    connection.send({"wall_time": wall_time, "peak_rss": 1024 * max(own.ru_maxrss, children.ru_maxrss),
+                     "bytes_written": 512 * (own.ru_oublock + children.ru_oublock), "result": result, "error": error})
+    connection.close()
+
+
+# Function to run a stage in a new process and measure it
+# Input:
+#   function, args - Stage and its arguments
+#   work_dir - Directory whose growth is the disk usage of the stage
+# Output:
+#   stats - Dictionary: wall_time (s), peak_rss (bytes, largest process of the stage), bytes_written
+#           (by the stage and its subprocesses), disk_usage (bytes) and result of the stage
+def measure(function, args, work_dir):
+    size = meshCache.dir_size(work_dir)
+    context = multiprocessing.get_context("fork")
+    receiver, sender = context.Pipe(duplex=False)
+    process = context.Process(target=_run_stage, args=(sender, function, args))
+    process.start()
+    sender.close()
+    stats = receiver.recv()
+    process.join()
+    error = stats.pop("error")
+    if error is not None:
+        raise RuntimeError(function.__name__ + " failed: " + error)
+    stats["disk_usage"] = meshCache.dir_size(work_dir) - size
+    return stats
+
+
+# Function to describe the machine and the version of the code
+def metadata(stub):
+    git = lambda *args: subprocess.run(["git"] + list(args), capture_output=True, text=True).stdout.strip()
+    try:
+        gmsh_version = meshCache.gmsh_version()
+    except (ImportError, OSError):
+        # gmsh not installed or its library not loadable (the startup benchmark does not need it)
+        gmsh_version = None
+    return {"commit": git("rev-parse", "HEAD") or None,
+            "dirty": bool(git("status", "--porcelain", "--untracked-files=no")),
+            "date": time.strftime("%Y-%m-%dT%H:%M:%S"), "host": platform.node(), "platform": platform.platform(),
+            "cpus": os.cpu_count(), "python": platform.python_version(), "numpy": np.__version__,
+            "gmsh": gmsh_version, "stub": stub}
+
+
+# Function to benchmark the pipeline mesh -> convert -> setup -> solve -> post
+# Each stage of each mesh is run in its own process: wall time, peak RSS, bytes written and disk usage.
+# Input:
+#   geometries - Dictionary {name: sample} of the geometries
+#   ratios - Refinement ratios of the meshes of each geometry
+#   alphas - Angles of attack solved on each mesh (one after the other on one core)
+#   storage, conv_window, conv_tol - see runOpenFoam.compute_alpha (conv_window None: run to endTime)
+#   native - Write the polyMesh from gmsh (see meshCache.NATIVE_EXPORT), else mesh.msh and gmshToFoam
+#   stub - Use the OpenFoam stubs of foamStub (replay of the template case, no OpenFoam needed)
+#   output - Result file (default results/benchmarks/<date>-<commit>.json)
+#   keep - Keep the cases of the benchmark in openFoam/benchmark
+# Output:
+#   report - Dictionary with the metadata and an entry per mesh
+def run_benchmark(geometries=REFERENCE_GEOMETRIES, ratios=RATIOS, alphas=ALPHAS, storage="compressed", conv_window=None,
+                  conv_tol=1e-3, native=meshCache.NATIVE_EXPORT, stub=False, output=None, keep=False):
+    if stub:
+        bin_dir = foamStub.install(tempfile.mkdtemp(prefix="foamStub-"))
+        os.environ["PATH"] = bin_dir + os.pathsep + os.environ["PATH"]
+    report = {"meta": metadata(stub), "settings": {"alphas": list(alphas), "storage": storage, "conv_window": conv_window,
+                                                   "conv_tol": conv_tol, "native": native}, "entries": []}
+    print(f"{'geometry':>12s} {'ratio':>5s} {'cells':>8s}  " + "  ".join(f"{stage:>8s}" for stage in STAGES)
+          + "  (wall time s)")
+    for name, sample in geometries.items():
+        for ratio in ratios:
+            params = designSweep.geometry_params(gridStudy.refine(sample, ratio))
+            work_dir = f"{WORK_DIR}/{name}-{ratio:g}"
+            shutil.rmtree(work_dir, ignore_errors=True)
+            os.makedirs(work_dir)
+            mesh_file = work_dir + "/mesh.msh"
+            mesh_case = work_dir + "/mesh"
+            case_root = work_dir + "/cases"
+
+            stages = {}
+            stages["mesh"] = measure(mesh_stage, (params, mesh_file, mesh_case, native), work_dir)
+            stages["convert"] = measure(convert_stage, (mesh_file, mesh_case, native), work_dir)
+            stages["setup"] = measure(setup_stage, (params["U"], alphas, mesh_case, case_root, storage, conv_window), work_dir)
+            case_dirs = stages["setup"]["result"]
+            stages["solve"] = measure(solve_stage, (case_dirs, conv_window, conv_tol), work_dir)
+            stages["post"] = measure(post_stage, (params, alphas, case_dirs, stages["solve"]["result"], case_root), work_dir)
+
+            entry = {"geometry": name, "ratio": ratio, "msh_elements": stages["mesh"]["result"],
+                     "cells": stages["convert"]["result"],
+                     "iterations": [row[1] for row in stages["post"]["result"]],
+                     "stages": {stage: {metric: stats[metric] for metric in METRICS} for stage, stats in stages.items()}}
+            entry["wall_time"] = sum(stats["wall_time"] for stats in entry["stages"].values())
+            report["entries"].append(entry)
+            print(f"{name:>12s} {ratio:5g} {entry['cells']:8d}  "
+                  + "  ".join(f"{entry['stages'][stage]['wall_time']:8.2f}" for stage in STAGES))
+            if not keep:
+                shutil.rmtree(work_dir, ignore_errors=True)
+
+    if output is None:
+        commit = (report["meta"]["commit"] or "nogit")[:8] + ("-dirty" if report["meta"]["dirty"] else "")
+        output = BENCH_DIR + "/" + time.strftime("%Y%m%d-%H%M%S") + "-" + commit + ".json"
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=1, default=float)
+    print("Benchmark written in " + output)
+    return report
+
+
+# Function to measure the import time of modules, each imported in a new interpreter as when a script is run
+# or the pipeline is called from another program
+# Input:
+#   modules - Modules of src to import
+#   repeat - Imports of each module, the median wall time is kept
+#   output - Result file (default results/benchmarks/startup-<date>-<commit>.json)
+# Output:
+#   report - Dictionary with the metadata and an entry per module: wall time of the import (s, start-up of the
+#            interpreter removed), number of modules imported, and cumulative import time (s) of the heavy
+#            modules it loads (python -X importtime)
+def run_startup(modules=STARTUP_MODULES, repeat=5, output=None):
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join([os.path.dirname(os.path.abspath(__file__))]
+                                                      + ([os.environ["PYTHONPATH"]] if "PYTHONPATH" in os.environ else [])))
+
+    def median_time(statement):
+        times = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            subprocess.run([sys.executable, "-c", statement], env=env, check=True, capture_output=True)
+            times.append(time.perf_counter() - start)
+        return float(np.median(times))
+
+    interpreter = median_time("pass")
+    report = {"meta": metadata(False), "settings": {"repeat": repeat, "interpreter": interpreter}, "entries": []}
+    print(f"{'module':>20s} {'import s':>9s} {'modules':>8s}  heavy modules loaded (cumulative import s)")
+    for module in modules:
+        wall_time = median_time("import " + module) - interpreter
+        # Lines of -X importtime: "import time: <self us> | <cumulative us> | <indented module name>"
+        process = subprocess.run([sys.executable, "-X", "importtime", "-c", "import " + module], env=env, check=True,
+                                 capture_output=True, text=True)
+        imports = [line.split("|") for line in process.stderr.splitlines() if line.startswith("import time:")]
+        imports = [(name.strip(), int(cumulative)) for _, cumulative, name in imports if cumulative.strip().isdigit()]
+        heavy = {name: 1e-6 * cumulative for name, cumulative in imports if name in HEAVY_MODULES}
+        entry = {"module": module, "wall_time": wall_time, "modules": len(imports), "heavy": heavy}
+        report["entries"].append(entry)
+        print(f"{module:>20s} {wall_time:9.3f} {len(imports):8d}  "
+              + (" ".join(f"{name} ({seconds:.3f})" for name, seconds in heavy.items()) or "-"))
+
+    if output is None:
+        commit = (report["meta"]["commit"] or "nogit")[:8] + ("-dirty" if report["meta"]["dirty"] else "")
+        output = BENCH_DIR + "/startup-" + time.strftime("%Y%m%d-%H%M%S") + "-" + commit + ".json"
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=1, default=float)
+    print("Startup benchmark written in " + output)
+    return report
+
+
+# Function to compare two benchmark results
+# The entries are matched by geometry and ratio, a metric of a stage is a regression when it
+# grows by more than threshold (relative) and MIN_DIFFERENCES (absolute).
+# Output:
+#   regressions - List of (geometry, ratio, stage, metric, base value, new value)
+def compare(base_file, new_file, threshold=THRESHOLD):
+    with open(base_file, 'r') as f:
+        base = json.load(f)
+    with open(new_file, 'r') as f:
+        new = json.load(f)
+    print(f"base {base['meta']['commit']} ({base['meta']['host']}), new {new['meta']['commit']} ({new['meta']['host']})")
+    if base["meta"]["host"] != new["meta"]["host"] or base["meta"]["stub"] != new["meta"]["stub"]:
+        print("Warning: the results come from different machines or solvers")
+    base_entries = {(entry["geometry"], entry["ratio"]): entry for entry in base["entries"]}
+    regressions = []
+    for entry in new["entries"]:
+        key = (entry["geometry"], entry["ratio"])
+        if key not in base_entries:
+            continue
+        reference = base_entries[key]
+        if reference["cells"] != entry["cells"]:
+            print(f"Warning: {key[0]} ratio {key[1]:g} has {reference['cells']} cells in the base and {entry['cells']} now")
+        for stage in STAGES:
+            changes = []
+            for metric in METRICS:
+                old_value = reference["stages"][stage][metric]
+                new_value = entry["stages"][stage][metric]
+                change = new_value / old_value - 1 if old_value > 0 else 0.0
+                flag = ""
+                if change > threshold and new_value - old_value > MIN_DIFFERENCES[metric]:
+                    regressions.append((key[0], key[1], stage, metric, old_value, new_value))
+                    flag = "!"
+                changes.append(f"{metric} {change:+7.1%}{flag}")
+            print(f"{key[0]:>12s} {key[1]:5g} {stage:>8s}  " + "  ".join(changes))
+    for geometry, ratio, stage, metric, old_value, new_value in regressions:
+        print(f"Regression: {geometry} ratio {ratio:g} {stage} {metric} {old_value:.4g} -> {new_value:.4g}")
+    return regressions
+
+
+# Command line interface:
+#   python src/benchmark.py run [--stub] [--geometries default deep] [--ratios 1 2] [--alphas 4 12] [--output file]
+#   python src/benchmark.py startup [--modules polarPipeline meshCache] [--repeat 5] [--output file]
+#   python src/benchmark.py compare base.json new.json [--threshold 0.1]
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark of the mesh, convert, setup, solve and post stages")
+    commands = parser.add_subparsers(dest="command", required=True)
+    run = commands.add_parser("run")
+    run.add_argument("--stub", action="store_true", help="replay the template case instead of running OpenFoam")
+    run.add_argument("--geometries", nargs="+", default=list(REFERENCE_GEOMETRIES), choices=list(REFERENCE_GEOMETRIES))
+    run.add_argument("--ratios", nargs="+", type=float, default=RATIOS)
+    run.add_argument("--alphas", nargs="+", type=float, default=ALPHAS)
+    run.add_argument("--storage", default="compressed", choices=list(runOpenFoam.STORAGE_PROFILES))
+    run.add_argument("--conv-window", type=int, default=None)
+    run.add_argument("--output", default=None)
+    run.add_argument("--keep", action="store_true")
+    run.add_argument("--msh", action="store_true", help="convert mesh.msh with gmshToFoam instead of the native export")
+    startup = commands.add_parser("startup", help="import time of the modules")
+    startup.add_argument("--modules", nargs="+", default=STARTUP_MODULES)
+    startup.add_argument("--repeat", type=int, default=5)
+    startup.add_argument("--output", default=None)
+    comparison = commands.add_parser("compare")
+    comparison.add_argument("base")
+    comparison.add_argument("new")
+    comparison.add_argument("--threshold", type=float, default=THRESHOLD)
+    args = parser.parse_args()
+    if args.command == "run":
+        run_benchmark({name: REFERENCE_GEOMETRIES[name] for name in args.geometries}, args.ratios,
+                      [int(alpha) if alpha == int(alpha) else alpha for alpha in args.alphas], args.storage,
+                      args.conv_window, native=not args.msh, stub=args.stub, output=args.output, keep=args.keep)
+    elif args.command == "startup":
+        run_startup(args.modules, args.repeat, args.output)
+    else:
+        sys.exit(1 if compare(args.base, args.new, args.threshold) else 0)
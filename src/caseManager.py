@@ -0,0 +1,196 @@
+import polarStore
+import argparse
+import fcntl
+import json
+import os
+import shutil
+import tarfile
+import time
+
+# Case directories of the solved angles of attack: namespaced by geometry hash and Re
+# (openFoam/cases/<geometry hash>/Re_<Re>/AOA_<alpha>), reduced to their artifacts once finished,
+# archived, and removed oldest first above a disk quota.
+CASES_DIR = "openFoam/cases"
+# Artifacts kept when a case is finished:
+#   final_time - last time directory (fields, seed of the neighbouring angles of attack)
+#   postProcessing - force coefficients and residuals
+#   logs - log files and status.json
+#   setup - system and constant (the polyMesh is a link to the mesh case)
+RETAIN = ["final_time", "postProcessing", "logs", "setup"]
+ARCHIVE = "tar.gz"      # finished cases packed in AOA_<alpha>.tar.gz ("tar" without compression, None to keep the directory)
+QUOTA = 50e9            # size of the finished cases above which the oldest are removed (bytes)
+ARCHIVE_MODES = {"tar.gz": "w:gz", "tar": "w"}
+
+
+# Function to get the directory of the cases of a geometry and Re number
+# Input:
+#   params - Geometry, mesh and flow parameters (see polarStore.geometry_hash)
+def case_root(params, cases_dir=CASES_DIR):
+    return f"{cases_dir}/{polarStore.geometry_hash(params)}/Re_{params['Re']:.6g}"
+
+
+# Function to read, modify and write the index of the finished cases under a lock (see meshCache.update_index)
+# Input:
+#   update - Function modifying the index dictionary {case directory: entry} in place
+def update_index(update, cases_dir=CASES_DIR):
+    os.makedirs(cases_dir, exist_ok=True)
+    with open(cases_dir + "/index.lock", 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        index = {}
+        if os.path.exists(cases_dir + "/index.json"):
+            with open(cases_dir + "/index.json", 'r') as f:
+                index = json.load(f)
+        result = update(index)
+        with open(cases_dir + "/index.json.tmp", 'w') as f:
+            json.dump(index, f, indent=1)
+        os.replace(cases_dir + "/index.json.tmp", cases_dir + "/index.json")
+    return result
+
+
+# Function to get the size of a file or directory (bytes, links not followed)
+def path_size(path):
+    if not os.path.isdir(path) or os.path.islink(path):
+        return os.lstat(path).st_size
+    size = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            size = size + os.lstat(os.path.join(root, name)).st_size
+    return size
+
+
+# Function to list the artifacts of a case
+# Output:
+#   artifacts - Dictionary {artifact: list of names in the case directory}
+def artifacts(case_dir):
+    names = os.listdir(case_dir)
+    times = []
+    for name in names:
+        try:
+            times.append((float(name), name))
+        except ValueError:
+            continue
+    return {"final_time": [max(times)[1]] if times else [],
+            "postProcessing": [name for name in names if name == "postProcessing"],
+            "logs": [name for name in names if name.startswith("log") or name.endswith(".json")],
+            "setup": [name for name in names if name in ["system", "constant"]]}
+
+
+# Function to reduce a finished case to its artifacts, archive it and enforce the quota
+# Input:
+#   case_dir - Directory of the case
+#   state - State recorded in the index ("done" or "failed")
+#   retain, archive, quota - see RETAIN, ARCHIVE and QUOTA
+# Output:
+#   removed - Cases removed to stay below the quota
+def finalize(case_dir, state="done", retain=RETAIN, archive=ARCHIVE, quota=QUOTA, cases_dir=CASES_DIR):
+    keep = set(name for artifact, names in artifacts(case_dir).items() if artifact in retain for name in names)
+    for name in os.listdir(case_dir):
+        if name not in keep:
+            path = case_dir + "/" + name
+            if os.path.isdir(path) and not os.path.islink(path):
+                shutil.rmtree(path)
+            else:
+                os.remove(path)
+    path = case_dir
+    if archive is not None:
+        # Fast compression: the fields of the last time are most of the size
+        path = case_dir + "." + archive
+        options = {"compresslevel": 1} if archive == "tar.gz" else {}
+        with tarfile.open(path + ".tmp", ARCHIVE_MODES[archive], **options) as tar:
+            tar.add(case_dir, arcname=os.path.basename(case_dir))
+        os.replace(path + ".tmp", path)
+        shutil.rmtree(case_dir)
+
+    def add(index):
+        # A case computed again replaces its previous entry
+        for other in [case_dir] + [case_dir + "." + name for name in ARCHIVE_MODES]:
+            if other in index and other != path:
+                remove(other)
+            index.pop(other, None)
+        index[path] = {"case_dir": case_dir, "state": state, "size": path_size(path), "finished": time.time()}
+        return evict(index, quota, keep=path)
+
+    removed = update_index(add, cases_dir)
+    if removed:
+        print(f"Case quota: {len(removed)} oldest cases removed")
+    return removed
+
+
+# Function to remove the oldest finished cases until their size is below the quota
+# Output:
+#   removed - Paths of the removed cases
+def evict(index, quota, keep=None):
+    removed = []
+    total = sum(entry["size"] for entry in index.values())
+    for path in sorted(index, key=lambda p: index[p]["finished"]):
+        if total <= quota:
+            break
+        if path == keep:
+            continue
+        total = total - index[path]["size"]
+        remove(path)
+        del index[path]
+        removed.append(path)
+    return removed
+
+
+# Function to remove a case directory or archive
+def remove(path):
+    if os.path.isdir(path) and not os.path.islink(path):
+        shutil.rmtree(path, ignore_errors=True)
+    elif os.path.lexists(path):
+        os.remove(path)
+
+
+# Function to make an archived case available again as a directory (e.g. seed of a neighbouring alpha)
+# Output:
+#   restored - True if the case was extracted from its archive, None if it does not exist anymore
+def restore(case_dir):
+    if os.path.isdir(case_dir):
+        return False
+    for archive in ARCHIVE_MODES:
+        if os.path.exists(case_dir + "." + archive):
+            # Archives written by finalize (the tar filter of Python >= 3.11.4 keeps the relative link of the mesh)
+            options = {"filter": "tar"} if hasattr(tarfile, "tar_filter") else {}
+            with tarfile.open(case_dir + "." + archive, 'r:*') as tar:
+                tar.extractall(os.path.dirname(case_dir), **options)
+            return True
+    return None
+
+
+# Command line interface:
+#   python src/caseManager.py list
+#   python src/caseManager.py prune [--quota 20] [--older-than 30] [--failed]
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Finished OpenFoam cases")
+    parser.add_argument("--cases-dir", default=CASES_DIR)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("list", help="list the finished cases, most recent first")
+    prune = subparsers.add_parser("prune", help="remove finished cases")
+    prune.add_argument("--quota", type=float, help="remove the oldest cases above this size (GB)")
+    prune.add_argument("--older-than", type=float, help="remove the cases finished for this number of days")
+    prune.add_argument("--failed", action="store_true", help="remove the failed cases")
+    args = parser.parse_args()
+
+    if args.command == "list":
+        index = update_index(lambda index: dict(index), args.cases_dir)
+        for path in sorted(index, key=lambda p: -index[p]["finished"]):
+            entry = index[path]
+            print(f"{path}  {entry['state']:6s}  {entry['size'] / 1e6:8.1f} MB  "
+                  f"{time.strftime('%Y-%m-%d %H:%M', time.localtime(entry['finished']))}")
+        print(f"{len(index)} cases, {sum(entry['size'] for entry in index.values()) / 1e6:.1f} MB")
+    else:
+        def prune_index(index):
+            old = [path for path, entry in index.items()
+                   if (args.older_than is not None and time.time() - entry["finished"] > args.older_than * 86400)
+                   or (args.failed and entry["state"] == "failed")]
+            for path in old:
+                remove(path)
+                del index[path]
+            removed = old
+            if args.quota is not None:
+                removed = removed + evict(index, args.quota * 1e9)
+            return removed
+
+        removed = update_index(prune_index, args.cases_dir)
+        print(f"{len(removed)} cases removed")
@@ -0,0 +1,230 @@
+import foamDat
+import foamDict
+import argparse
+import http.server
+import json
+import os
+import re
+import signal
+import socket
+import subprocess
+import time
+import numpy as np
+
+STATUS_FILE = "status.json"     # written in each case directory while it runs
+KILL = True                     # kill the diverged, stalled or failed cases so that their cores go back to the pool
+STALL_TIMEOUT = 600             # time without a new iteration after which a running case is stalled (s)
+DIVERGENCE_GROWTH = 1e4         # growth of a residual over its minimum of a diverged case...
+DIVERGENCE_RESIDUAL = 1e-2      # ...once above this value
+COEFF_LIMIT = 50                # |Cl|, |Cd| or |Cm| above which a case is diverged
+DRIFT_WINDOW = 300              # window of the Cl/Cd drift without convergence check (iterations)
+RATE_SMOOTHING = 0.3            # weight of the last update in the iteration rate
+ERRORS = re.compile(rb'FOAM FATAL[^\n]*|Floating point exception[^\n]*|[^\n]*sigFpe[^\n]*')
+CASE_DIRS = ["0", "constant", "system", "postProcessing"]   # not searched for cases by collect
+ITERATION = re.compile(rb'^Time = (\S+)\s*$', re.MULTILINE)
+
+
+# Class following a running case: iteration rate, residuals, Cl/Cd drift and remaining time,
+# diverged and stalled cases. The status is written in case_dir/status.json at each update.
+# Usage:
+#   telemetry = Telemetry(case_dir, window)
+#   telemetry.update()      state of the case: running, diverged, stalled or failed
+#   telemetry.finish(returncode)     final state once the solver has ended
+class Telemetry:
+    def __init__(self, case_dir, window=None, pid=None):
+        self.case_dir = case_dir
+        self.window = window or DRIFT_WINDOW
+        self.coeffs = foamDat.DatFile(case_dir + '/postProcessing/forces/0/forceCoeffs.dat')
+        self.residuals = foamDat.DatFile(case_dir + '/postProcessing/residuals/0/residuals.dat')
+        self.log_offset = 0
+        self.iteration = 0.0
+        self.min_residuals = None
+        self.start = time.time()
+        self.last_progress = self.start     # time of the last new iteration
+        control = foamDict.read(case_dir + '/system/controlDict')
+        self.status = {"case_dir": case_dir, "host": socket.gethostname(), "pid": pid, "state": "running",
+                       "reason": None, "started": self.start, "updated": self.start, "iteration": 0.0,
+                       "end_time": float(control['endTime']), "rate": None, "eta": None,
+                       "residuals": {}, "coeffs": {}, "drift": {}}
+        self.write()
+
+    # Function to read the new lines of the log: current iteration and fatal errors
+    def _read_log(self):
+        path = self.case_dir + '/log'
+        if not os.path.exists(path):
+            return None
+        with open(path, 'rb') as f:
+            f.seek(self.log_offset)
+            text = f.read()
+        text = text[:text.rfind(b'\n') + 1]
+        self.log_offset = self.log_offset + len(text)
+        iterations = ITERATION.findall(text)
+        if iterations:
+            self.iteration = max(self.iteration, float(iterations[-1]))
+        error = ERRORS.search(text)
+        return None if error is None else error.group(0).decode(errors='replace').strip()
+
+    # Function to update the metrics of the case and write its status
+    # Output:
+    #   state - "running", "diverged", "stalled" or "failed"
+    def update(self):
+        now = time.time()
+        error = self._read_log()
+        self.residuals.follow()
+        self.coeffs.follow()
+        if len(self.residuals) > 0:
+            self.iteration = max(self.iteration, self.residuals.rows[-1, 0])
+        status = self.status
+
+        # Iteration rate and remaining time to endTime
+        if self.iteration > status["iteration"]:
+            rate = (self.iteration - status["iteration"]) / max(now - status["updated"], 1e-6)
+            status["rate"] = rate if status["rate"] is None else RATE_SMOOTHING * rate + (1 - RATE_SMOOTHING) * status["rate"]
+            self.last_progress = now
+        if status["rate"]:
+            status["eta"] = max(0.0, status["end_time"] - self.iteration) / status["rate"]
+        status["iteration"] = self.iteration
+        status["updated"] = now
+
+        # Current residuals and coefficients, relative band of Cl and Cd over the window
+        residuals = self.residuals.rows
+        if len(residuals) > 0:
+            last = residuals[-1, 1:]
+            status["residuals"] = dict(zip(self.residuals.columns[1:], last.tolist()))
+            finite = residuals[:, 1:][np.isfinite(residuals[:, 1:]).all(axis=1)]
+            if len(finite) > 0:
+                self.min_residuals = finite.min(axis=0)
+        rows = self.coeffs.rows
+        if len(rows) > 0:
+            status["coeffs"] = {name: rows[-1, self.coeffs.index(name)] for name in ["Cl", "Cd", "Cm"]}
+            last = rows[rows[:, 0] >= rows[-1, 0] - self.window]
+            for name in ["Cl", "Cd"]:
+                values = last[:, self.coeffs.index(name)]
+                status["drift"][name] = (values.max() - values.min()) / max(abs(values.mean()), 1e-12)
+
+        status["state"], status["reason"] = self._check(error, now)
+        self.write()
+        return status["state"]
+
+    # Function to check if the case failed, diverged or stalled
+    def _check(self, error, now):
+        if error is not None:
+            return "failed", error
+        values = list(self.status["residuals"].values()) + list(self.status["coeffs"].values())
+        if not np.all(np.isfinite(values)):
+            return "diverged", "non-finite residuals or coefficients at iteration %g" % self.iteration
+        for name, value in self.status["coeffs"].items():
+            if abs(value) > COEFF_LIMIT:
+                return "diverged", "%s = %.3g at iteration %g" % (name, value, self.iteration)
+        if self.min_residuals is not None:
+            for (name, value), minimum in zip(self.status["residuals"].items(), self.min_residuals):
+                if value > DIVERGENCE_RESIDUAL and value > DIVERGENCE_GROWTH * minimum:
+                    return "diverged", "residual %s %.3g, %.3g times its minimum, at iteration %g" % (
+                        name, value, value / minimum, self.iteration)
+        if now - self.last_progress > STALL_TIMEOUT:
+            return "stalled", "no iteration for %.0f s after iteration %g" % (now - self.last_progress, self.iteration)
+        return "running", None
+
+    # Function to write the final state of the case
+    # Input:
+    #   returncode - Exit code of the solver
+    #   state - Final state when known ("converged", "diverged"...), else "done" or "failed" from returncode
+    def finish(self, returncode, state=None, reason=None):
+        error = self._read_log()
+        if state is None and self.status["state"] == "diverged":
+            state, reason = self.status["state"], self.status["reason"]
+        elif state is None:
+            state = "done" if returncode == 0 and error is None else "failed"
+            reason = error if error is not None else (None if returncode == 0 else "exit code %d" % returncode)
+        self.status["state"] = state
+        self.status["reason"] = reason
+        self.status["updated"] = time.time()
+        self.status["eta"] = 0.0
+        self.write()
+
+    def write(self):
+        path = self.case_dir + '/' + STATUS_FILE
+        with open(path + '.tmp', 'w') as f:
+            json.dump(self.status, f, indent=1, default=float)
+        os.replace(path + '.tmp', path)
+
+
+# Function to stop a solver and its subprocesses (started in a new session by runOpenFoam.run_solver)
+def kill(process, timeout=10):
+    try:
+        os.killpg(process.pid, signal.SIGTERM)
+        process.wait(timeout)
+    except subprocess.TimeoutExpired:
+        os.killpg(process.pid, signal.SIGKILL)
+        process.wait()
+    except ProcessLookupError:
+        pass
+
+
+# Function to read the status of the cases under a directory (at any depth, e.g. openFoam/sweeps/<name>/<key>/AOA_*)
+def collect(root="openFoam"):
+    statuses = []
+    for directory, subdirs, files in os.walk(root):
+        if STATUS_FILE in files:
+            subdirs[:] = []     # no case inside a case
+            try:
+                with open(directory + '/' + STATUS_FILE, 'r') as f:
+                    statuses.append(json.load(f))
+            except (OSError, ValueError):
+                continue    # being replaced
+        else:
+            subdirs[:] = sorted(name for name in subdirs if name not in CASE_DIRS and not name.startswith('processor'))
+    return statuses
+
+
+# Function to print the status of the cases
+def print_status(statuses):
+    print(f"{'case':40s} {'state':>9s} {'iteration':>9s} {'it/s':>6s} {'ETA':>8s} {'Cl':>8s} {'Cd':>8s} "
+          f"{'dCl':>8s} {'dCd':>8s}  residuals")
+    for status in statuses:
+        eta = "-" if status["eta"] is None else time.strftime("%H:%M:%S", time.gmtime(status["eta"]))
+        coeffs = status["coeffs"]
+        drift = status["drift"]
+        print(f"{status['case_dir'][-40:]:40s} {status['state']:>9s} {status['iteration']:9.0f} "
+              f"{status['rate'] or 0:6.1f} {eta:>8s} {coeffs.get('Cl', np.nan):8.4f} {coeffs.get('Cd', np.nan):8.5f} "
+              f"{drift.get('Cl', np.nan):8.1e} {drift.get('Cd', np.nan):8.1e}  "
+              + " ".join(f"{name} {value:.2e}" for name, value in status["residuals"].items()))
+        if status["reason"]:
+            print(f"{'':40s} {status['reason']}")
+    running = [status for status in statuses if status["state"] == "running"]
+    if running:
+        print(f"{len(running)} running cases, {sum(status['rate'] or 0 for status in running):.1f} iterations/s, "
+              f"longest remaining time {max(status['eta'] or 0 for status in running):.0f} s")
+
+
+# Command line interface:
+#   python src/caseTelemetry.py status [--root openFoam] [--watch 10]
+#   python src/caseTelemetry.py serve [--root openFoam] [--port 8000]    JSON of the statuses on http://localhost:8000/
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Status of the running OpenFoam cases")
+    commands = parser.add_subparsers(dest="command", required=True)
+    status = commands.add_parser("status")
+    status.add_argument("--root", default="openFoam")
+    status.add_argument("--watch", type=float, default=None, help="refresh period (s)")
+    serve = commands.add_parser("serve")
+    serve.add_argument("--root", default="openFoam")
+    serve.add_argument("--port", type=int, default=8000)
+    args = parser.parse_args()
+    if args.command == "status":
+        while True:
+            print_status(collect(args.root))
+            if args.watch is None:
+                break
+            time.sleep(args.watch)
+            print()
+    else:
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = json.dumps(collect(args.root), default=float).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        http.server.HTTPServer(("localhost", args.port), Handler).serve_forever()
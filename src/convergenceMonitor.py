@@ -0,0 +1,96 @@
+import caseTelemetry
+import foamDict
+import numpy as np
+import subprocess
+
+# Columns of forceCoeffs.dat
+COEFFS = ["Time", "Cm", "Cd", "Cl", "Cl(f)", "Cl(r)"]
+
+
+# Function to check if the force coefficients stay in a relative band over the last window
+# Input:
+#   rows - Rows of forceCoeffs.dat [Time, Cm, Cd, Cl, Cl(f), Cl(r)]
+#   window - Length of the sliding window (iterations)
+#   rel_tol - Relative band allowed for Cm, Cd and Cl
+# Output:
+#   converged - True if Cl, Cd and Cm stayed in the band over the whole window
+#   mean - Mean row over the window (None if the window is not full yet)
+def window_converged(rows, window, rel_tol):
+    rows = np.array(rows)
+    if len(rows) < 2 or rows[-1, 0] - rows[0, 0] < window:
+        return False, None
+    last = rows[rows[:, 0] >= rows[-1, 0] - window]
+    mean = last.mean(axis=0)
+    band = last[:, 1:4].max(axis=0) - last[:, 1:4].min(axis=0)
+    converged = bool(np.all(band <= rel_tol * np.abs(mean[1:4])))
+    return converged, mean
+
+
+# Function to ask a running case to write its current time and stop
+def request_stop(case_dir):
+    control = foamDict.read(case_dir + '/system/controlDict')
+    control['stopAt'] = 'writeNow'
+    foamDict.write(control, case_dir + '/system/controlDict')
+
+
+# Function to follow a running case, stop it once the force coefficients have converged and
+# kill it if it diverges or stalls (see caseTelemetry)
+# Input:
+#   process - Popen of the solver (started in its own session)
+#   case_dir - Directory of the case
+#   window - Length of the sliding window (iterations, None: no convergence check)
+#   rel_tol - Relative band allowed for Cm, Cd and Cl over the window
+#   poll - Time between two checks (s)
+#   kill - Kill the diverged, stalled or failed cases (default caseTelemetry.KILL)
+# Output:
+#   mean - Row of forceCoeffs.dat averaged over the last window, Time is the stopping iteration
+#          (None without convergence check)
+# A solver ending with an error or without force coefficients raises a RuntimeError, as a killed one
+def monitor_case(process, case_dir, window, rel_tol, poll=5, kill=None):
+    kill = caseTelemetry.KILL if kill is None else kill
+    telemetry = caseTelemetry.Telemetry(case_dir, window, process.pid)
+    stopping = False
+    try:
+        while True:
+            try:
+                # Returns as soon as the solver ends instead of sleeping a whole poll period
+                process.wait(timeout=poll)
+                break
+            except subprocess.TimeoutExpired:
+                pass
+            state = telemetry.update()
+            if state != "running" and kill:
+                print(f"{case_dir}: {state}, {telemetry.status['reason']}, killing the solver")
+                caseTelemetry.kill(process)
+                telemetry.finish(process.returncode, state, telemetry.status["reason"])
+                raise RuntimeError(f"{case_dir} {state}: {telemetry.status['reason']}")
+            if window is None or stopping:
+                continue
+            converged, _ = window_converged(telemetry.coeffs.rows, window, rel_tol)
+            if converged:
+                residuals = telemetry.residuals
+                last_residuals = residuals.rows[-1][1:] if len(residuals) > 0 else []
+                print(f"{case_dir}: coefficients converged at iteration {telemetry.coeffs.rows[-1][0]:.0f}, "
+                      f"residuals {' '.join('%.2e' % r for r in last_residuals)}, stopping")
+                request_stop(case_dir)
+                stopping = True
+    except KeyboardInterrupt:
+        caseTelemetry.kill(process)
+        raise
+
+    # Read the last lines written before the solver stopped
+    telemetry.update()
+    telemetry.finish(process.returncode, "converged" if stopping and process.returncode == 0 else None)
+    state, reason = telemetry.status["state"], telemetry.status["reason"]
+    if state not in ["done", "converged"]:
+        # Solver ended in error before being caught by a poll
+        raise RuntimeError(f"{case_dir} {state}: {reason}")
+    rows = telemetry.coeffs.rows
+    if len(rows) == 0:
+        raise RuntimeError(f"{case_dir} failed: no force coefficients written")
+    if window is None:
+        return None
+    last = rows[rows[:, 0] >= rows[-1, 0] - window]
+    mean = last.mean(axis=0)
+    mean[0] = rows[-1, 0]
+    return list(mean)
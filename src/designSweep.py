@@ -0,0 +1,238 @@
+import LEIairfoilMesh
+import caseManager
+import runOpenFoam
+import meshCache
+import polarStore
+import argparse
+import hashlib
+import itertools
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+# Default parameters of a geometry, a sample of the sweep overrides some of them
+DEFAULTS = {
+    "Corde_length": 1, "Depth": 9, "tube_size": 9, "at": 25, "Seam_angle": 35, "TE_angle": 7,
+    "nb_pts": 100,
+    "xmax": 40, "ymax": 30,             # fluid domain
+    "lc_edge": 0.6, "lc_prof": 0.6 / 150, "yh": 1e-4,   # mesh sizes
+    "Va": 20, "L": 1,                   # apparent wind and true chord for the Re number
+}
+rho = 1.225
+mu = 1.8e-5
+nu = mu / rho
+# Sweeps over Re numbers: first cell height for this y+, Re numbers meshed together when their first cell
+# heights are within this factor (see LEIairfoilMesh.reynolds_bands)
+YPLUS = 1
+RE_BAND_SPREAD = 2
+
+# Function to complete a sample with the default parameters and the flow quantities
+# A sample with a Re number gets the apparent wind of this Re for its chord L.
+def geometry_params(sample):
+    params = dict(DEFAULTS)
+    params.update(sample)
+    if "Re" in sample:
+        params["Va"] = params["Re"] * nu / params["L"]
+    else:
+        params["Re"] = LEIairfoilMesh.computeRe(params["Va"], params["L"], nu)
+    params["U"] = LEIairfoilMesh.computeU_eq(params["Re"], nu)
+    if "ep" not in sample:
+        params["ep"] = LEIairfoilMesh.compute_delta_te(params["Re"])
+    return params
+
+
+# Function to complete a sample at each of several Re numbers, with the first cell height and boundary layer
+# thickness of the Re band of each Re (as the mesh jobs of expand_jobs)
+# Output:
+#   params - List of the parameters of geometry_params, by increasing Re
+def reynolds_params(sample, reynolds, yplus=YPLUS):
+    return [geometry_params(dict(sample, Re=Re, yh=yh, ep=ep))
+            for Res, yh, ep in LEIairfoilMesh.reynolds_bands(reynolds, rho, nu, yplus, RE_BAND_SPREAD) for Re in Res]
+
+
+# Function to expand a parameter grid {name: [values]} into a list of samples
+def expand_grid(grid):
+    names = sorted(grid)
+    return [dict(zip(names, values)) for values in itertools.product(*[grid[name] for name in names])]
+
+
+# Function to create the mesh and solve jobs of a sweep
+# Each geometry gets one mesh job (shared by identical meshes) and one solve job
+# per angle of attack depending on it. With Re numbers, each geometry gets one mesh
+# job per Re band (same yh and ep) shared by the solve jobs of all the Re of the band.
+# The solver preset "auto" is the preset of the sweep name (family) for the Re of each job.
+# Output:
+#   jobs - Dictionary {job id: job}
+def expand_jobs(samples, alphas, name, reynolds=None, yplus=YPLUS, solver_preset=None):
+    variants = [{}]
+    if reynolds is not None:
+        variants = []
+        for Res, yh, ep in LEIairfoilMesh.reynolds_bands(reynolds, rho, nu, yplus, RE_BAND_SPREAD):
+            print(f"Re band {', '.join(f'{Re:.3g}' for Re in Res)}: yh = {yh:.3g}, ep = {ep:.3g}")
+            variants.extend({"Re": Re, "yh": yh, "ep": ep} for Re in Res)
+    jobs = {}
+    for sample, variant in itertools.product(samples, variants):
+        params = geometry_params(dict(sample, **variant))
+        mesh_id = "mesh-" + meshCache.mesh_key(params)
+        jobs[mesh_id] = {"type": "mesh", "params": params, "deps": [], "status": "pending", "result": None}
+        # Jobs are namespaced by all the parameters, the flow may differ on a shared mesh,
+        # cases by geometry hash and Re (see caseManager.case_root)
+        case_key = hashlib.sha1(json.dumps(params, sort_keys=True).encode()).hexdigest()[:16]
+        solver = runOpenFoam.find_solver_preset(name, params["Re"]) if solver_preset == "auto" else solver_preset
+        for alpha in alphas:
+            jobs[f"solve-{case_key}-{alpha:g}"] = {
+                "type": "solve", "params": params, "key": case_key, "alpha": alpha,
+                "case_root": caseManager.case_root(params), "solver": solver,
+                "deps": [mesh_id], "status": "pending", "result": None}
+    return jobs
+
+
+# Function to write the journal of the sweep (atomic replace so that a killed run leaves a valid file)
+def write_journal(journal_file, jobs):
+    with open(journal_file + ".tmp", 'w') as f:
+        json.dump(jobs, f, indent=1)
+    os.replace(journal_file + ".tmp", journal_file)
+
+
+# Function run by the workers
+# Output:
+#   result - Mesh case directory for a mesh job, polar row for a solve job
+#   elapsed - Wall time of the job (s)
+def run_job(job, cores_per_case, conv_window, conv_tol, mesh_case=None, storage="ascii", mesh_threads=None):
+    start = time.perf_counter()
+    params = job["params"]
+    if job["type"] == "mesh":
+        result = meshCache.get_mesh(*[params[name] for name in meshCache.MESH_PARAMETERS], n_threads=mesh_threads)
+    else:
+        result = runOpenFoam.compute_alpha(params["U"], job["alpha"], None, cores_per_case, None, conv_window, conv_tol,
+                                           mesh_case, job["case_root"], storage, solver=job.get("solver"))
+    return result, time.perf_counter() - start
+
+
+# Function to run a sweep, resuming from its journal if it exists
+# The meshes are generated by a pool of mesh worker processes (one gmsh session per mesh) while the
+# solve workers run the cases of the meshes already done. At most mesh_ahead meshes are
+# generated or waiting for their cases, so that meshing stays just ahead of the solvers.
+# Input:
+#   name - Name of the sweep (journal results/<name>_journal.json, case_name of the polar store)
+#   samples - List of samples {parameter: value} overriding DEFAULTS
+#   alphas - Angles of attack of each geometry (degrees)
+#   n_workers - Number of solve jobs run at the same time
+#   cores_per_case - Number of cores of each solve job
+#   n_mesh_workers - Number of meshes generated at the same time
+#   mesh_threads - Threads of each gmsh process
+#   mesh_ahead - Maximum number of meshes generated or waiting for their cases
+#   conv_window, conv_tol - Convergence check of runOpenFoam.compute_alpha
+#   storage - Storage profile of the cases (see runOpenFoam.STORAGE_PROFILES)
+#   reynolds - Re numbers computed for each geometry (None: Re of Va and L of the samples), meshed by band
+#   yplus - Target y+ of the first cell of the Re bands
+#   solver_preset - Solver preset of the cases (see runOpenFoam.SOLVER_PRESETS), "auto" to look it up by Re
+#                   for the family of the sweep name, None for the template settings
+def run_design_sweep(name, samples, alphas, n_workers=None, cores_per_case=1, conv_window=300, conv_tol=1e-3,
+                     storage="compressed", n_mesh_workers=1, mesh_threads=None, mesh_ahead=2, reynolds=None, yplus=YPLUS,
+                     solver_preset=None):
+    # A sweep without mesh or solve slots would return with all its jobs pending
+    for option, value in [("n_workers", n_workers), ("n_mesh_workers", n_mesh_workers), ("mesh_ahead", mesh_ahead)]:
+        if value is not None and value < 1:
+            raise ValueError(f"{option} must be at least 1, got {value}")
+    journal_file = "results/" + name + "_journal.json"
+    jobs = expand_jobs(samples, alphas, name, reynolds, yplus, solver_preset)
+    if os.path.exists(journal_file):
+        # Resume: keep the completed jobs, rerun the others
+        with open(journal_file, 'r') as f:
+            previous = json.load(f)
+        for job_id, job in previous.items():
+            if job_id in jobs and job["status"] == "done":
+                # A mesh evicted from the cache since is generated again
+                if job["type"] == "mesh" and not os.path.exists(job["result"][0]):
+                    continue
+                jobs[job_id] = job
+    write_journal(journal_file, jobs)
+    n_done = sum(job["status"] == "done" for job in jobs.values())
+    print(f"Sweep {name}: {len(samples)} geometries, {len(jobs)} jobs, {n_done} already done")
+
+    if n_workers is None:
+        n_workers = max(1, (os.cpu_count() or 1) // cores_per_case)
+    # Solve jobs of each mesh job
+    dependents = {job_id: [] for job_id in jobs}
+    for job_id, job in jobs.items():
+        for dep in job["deps"]:
+            dependents[dep].append(job_id)
+
+    def meshes_ahead():
+        return sum(job["type"] == "mesh" and (job["status"] == "running" or (job["status"] == "done" and any(
+            jobs[dep]["status"] == "pending" for dep in dependents[job_id]))) for job_id, job in jobs.items())
+
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=n_mesh_workers) as mesh_pool, ProcessPoolExecutor(max_workers=n_workers) as solve_pool:
+        futures = {}
+        while True:
+            # Submit the jobs whose dependencies are done, fail those whose dependencies failed
+            n_ahead = meshes_ahead()
+            n_solving = sum(job["type"] == "solve" and job["status"] == "running" for job in jobs.values())
+            for job_id, job in jobs.items():
+                if job["status"] != "pending":
+                    continue
+                deps = [jobs[dep]["status"] for dep in job["deps"]]
+                if "failed" in deps:
+                    job["status"] = "failed"
+                    job["result"] = "dependency failed"
+                elif all(status == "done" for status in deps):
+                    if job["type"] == "mesh":
+                        if n_ahead >= mesh_ahead:
+                            continue
+                        future = mesh_pool.submit(run_job, job, cores_per_case, conv_window, conv_tol, mesh_threads=mesh_threads)
+                        n_ahead = n_ahead + 1
+                    else:
+                        if n_solving >= n_workers:
+                            continue
+                        mesh_case = jobs[job["deps"][0]]["result"][0] if job["deps"] else None
+                        future = solve_pool.submit(run_job, job, cores_per_case, conv_window, conv_tol, mesh_case, storage)
+                        n_solving = n_solving + 1
+                    futures[future] = job_id
+                    job["status"] = "running"
+            write_journal(journal_file, jobs)
+            if not futures:
+                break
+
+            done, _ = wait(futures, return_when=FIRST_COMPLETED)
+            for future in done:
+                job_id = futures.pop(future)
+                job = jobs[job_id]
+                try:
+                    job["result"] = list(future.result())
+                    job["status"] = "done"
+                except Exception as error:
+                    job["result"] = repr(error)
+                    job["status"] = "failed"
+                n_done = n_done + (job["status"] == "done")
+                print(f"[{n_done}/{len(jobs)}] {job_id}" + (f" (Re {job['params']['Re']:.3g})" if job["type"] == "solve" else "")
+                      + f" {job['status']}"
+                      + (f" in {job['result'][1]:.1f} s" if job["status"] == "done" else f": {job['result']}")
+                      + f", elapsed {time.perf_counter() - start:.1f} s")
+                if job["type"] == "solve" and job["status"] == "done":
+                    # Stored before the journal, a case stored twice keeps its last row
+                    polarStore.append([polarStore.record(job["params"], job["result"][0], job["result"][1], name)])
+
+    failed = [job_id for job_id, job in jobs.items() if job["status"] == "failed"]
+    print(f"Sweep {name} finished in {time.perf_counter() - start:.1f} s, {len(failed)} jobs failed")
+    return jobs
+
+
+# Command line interface: python src/designSweep.py sweep.json
+# The sweep file gives "name", "alphas" and either a "grid" {parameter: [values]}
+# or a list of "samples", and optionally n_workers, cores_per_case, conv_window, conv_tol, storage,
+# n_mesh_workers, mesh_threads, mesh_ahead, "Re" (list of Re numbers of each geometry), yplus and solver_preset.
+# Running the same file again resumes the sweep.
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Sweep of LEI airfoil geometries and angles of attack")
+    parser.add_argument("sweep_file")
+    args = parser.parse_args()
+    with open(args.sweep_file, 'r') as f:
+        sweep = json.load(f)
+    samples = expand_grid(sweep["grid"]) if "grid" in sweep else sweep["samples"]
+    run_design_sweep(sweep["name"], samples, sweep["alphas"], sweep.get("n_workers"), sweep.get("cores_per_case", 1),
+                     sweep.get("conv_window", 300), sweep.get("conv_tol", 1e-3), sweep.get("storage", "compressed"),
+                     sweep.get("n_mesh_workers", 1), sweep.get("mesh_threads"), sweep.get("mesh_ahead", 2),
+                     sweep.get("Re"), sweep.get("yplus", YPLUS), sweep.get("solver_preset"))
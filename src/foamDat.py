@@ -0,0 +1,192 @@
+import numpy as np
+import mmap
+import os
+
+CHUNK_SIZE = 64 * 2**20     # bytes parsed at once by DatFile.read
+BLOCK_SIZE = 64 * 2**10     # bytes read at once from the end of the file by DatFile.tail
+
+
+# Class to read a postProcessing .dat file of OpenFoam (forceCoeffs.dat, residuals.dat...)
+# The header comments give the metadata ("# magUInf : 9.000000e+01") and the columns ("# Time Cm Cd ...").
+# 'N/A' values are read as nan, rows with missing values are completed with nan.
+# Usage:
+#   dat = DatFile(case_dir + '/postProcessing/forces/0/forceCoeffs.dat')
+#   dat.read()      all the rows (memory-mapped, parsed by chunks)
+#   dat.tail(10)    last 10 rows, read from the end of the file
+#   dat.follow()    rows written since the last call, for a file still being written (all of them in dat.rows)
+class DatFile:
+    def __init__(self, path):
+        self.path = path
+        self.title = None
+        self.metadata = {}
+        self.columns = None
+        self.offset = 0     # position of the first line not read by follow
+        self._chunks = []
+        self._n_rows = 0
+
+    # Parse the header comments of the file
+    def header(self):
+        if self.columns is None and os.path.exists(self.path):
+            with open(self.path, 'rb') as f:
+                text = f.read(BLOCK_SIZE)
+            self._read_comments(text[:text.rfind(b'\n') + 1])
+        return self.metadata
+
+    # Column index of a column name
+    def index(self, name):
+        self.header()
+        return self.columns.index(name)
+
+    # Function to read all the rows of the file
+    # Input:
+    #   columns - Names of the columns to return (default: all)
+    # Output:
+    #   rows - Array (number of rows, number of columns)
+    def read(self, columns=None):
+        self.header()
+        blocks = []
+        with open(self.path, 'rb') as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return self._select(np.empty((0, self._n_columns())), columns)
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                end = data.rfind(b'\n') + 1
+                start = 0
+                while start < end:
+                    stop = data.rfind(b'\n', start, min(start + CHUNK_SIZE, end)) + 1
+                    if stop <= start:
+                        stop = data.find(b'\n', start) + 1
+                    blocks.append(self._parse(data[start:stop]))
+                    start = stop
+        rows = np.concatenate(blocks) if blocks else np.empty((0, self._n_columns()))
+        return self._select(rows, columns)
+
+    # Function to read the last n rows of the file, without reading the rest of it
+    def tail(self, n=1, columns=None):
+        self.header()
+        with open(self.path, 'rb') as f:
+            end = f.seek(0, os.SEEK_END)
+            position = end
+            text = b''
+            # Read blocks from the end until n complete data lines are found
+            while position > 0:
+                position = max(0, position - BLOCK_SIZE)
+                f.seek(position)
+                text = f.read(end - position)
+                complete = text[:text.rfind(b'\n') + 1]
+                if position == 0 or complete.count(b'\n') > n + 1:
+                    break
+        text = text[:text.rfind(b'\n') + 1]
+        if position > 0:
+            # The first line of the block may be incomplete
+            text = text[text.find(b'\n') + 1:]
+        lines = [line for line in text.split(b'\n') if line.strip() and not line.lstrip().startswith(b'#')]
+        rows = self._parse(b'\n'.join(lines[-n:]) + b'\n') if lines else np.empty((0, self._n_columns()))
+        return self._select(rows, columns)
+
+    # Function to read the rows written since the last call (complete lines only)
+    # Output:
+    #   rows - New rows, also added to self.rows
+    def follow(self):
+        if not os.path.exists(self.path):
+            return np.empty((0, self._n_columns()))
+        with open(self.path, 'rb') as f:
+            f.seek(self.offset)
+            text = f.read()
+        text = text[:text.rfind(b'\n') + 1]
+        self.offset = self.offset + len(text)
+        rows = self._parse(text)
+        if len(rows) > 0:
+            self._chunks.append(rows)
+            self._n_rows = self._n_rows + len(rows)
+        return rows
+
+    # Rows read by follow
+    @property
+    def rows(self):
+        if len(self._chunks) > 1:
+            self._chunks = [np.concatenate(self._chunks)]
+        return self._chunks[0] if self._chunks else np.empty((0, self._n_columns()))
+
+    def __len__(self):
+        return self._n_rows
+
+    def _n_columns(self):
+        return len(self.columns) if self.columns is not None else 0
+
+    def _select(self, rows, columns):
+        if columns is None:
+            return rows
+        return rows[:, [self.columns.index(name) for name in columns]]
+
+    # Read the metadata and the columns from the comment lines of a block
+    def _read_comments(self, text):
+        for line in text.split(b'\n'):
+            line = line.strip()
+            if not line.startswith(b'#'):
+                continue
+            line = line[1:].decode().strip()
+            if ':' in line:
+                key, value = [s.strip() for s in line.split(':', 1)]
+                self.metadata[key] = _parse_value(value)
+            elif line.startswith('Time'):
+                self.columns = line.split()
+            elif self.title is None:
+                self.title = line
+
+    # Parse a block of complete lines into an array
+    def _parse(self, text):
+        if b'#' in text:
+            self._read_comments(text)
+            text = b'\n'.join(line for line in text.split(b'\n') if not line.lstrip().startswith(b'#'))
+        text = text.replace(b'N/A', b'nan')
+        if text.strip() == b'':
+            return np.empty((0, self._n_columns()))
+        if self.columns is None:
+            # No header: the first line gives the number of columns
+            n_columns = len(text.lstrip().split(b'\n', 1)[0].split())
+            self.columns = ['Time'] + ['c' + str(k) for k in range(1, n_columns)]
+        n_columns = self._n_columns()
+        values = np.fromstring(text, sep=' ')
+        n_lines = text.count(b'\n') + (not text.endswith(b'\n'))
+        if values.size == n_lines * n_columns:
+            return values.reshape(n_lines, n_columns)
+        # Blank lines or lines with missing values (e.g. first line of residuals.dat):
+        # count the values of each line and complete the short lines with nan
+        data = np.frombuffer(text, dtype=np.uint8)
+        space = np.isin(data, np.frombuffer(b' \t\r\n', dtype=np.uint8))
+        starts = ~space & np.concatenate(([True], space[:-1]))
+        line = np.cumsum(data == ord('\n'))[starts]
+        counts = np.bincount(line)
+        counts = counts[counts > 0]
+        row = np.repeat(np.arange(len(counts)), counts)
+        column = np.arange(len(row)) - np.repeat(np.cumsum(counts) - counts, counts)
+        keep = column < n_columns
+        rows = np.full((len(counts), n_columns), np.nan)
+        rows[row[keep], column[keep]] = values[keep]
+        return rows
+
+
+# Parse a header value: number, vector (x y z) or text
+def _parse_value(value):
+    try:
+        if value.startswith('('):
+            return np.array(value.strip('()').split(), dtype=float)
+        return float(value)
+    except ValueError:
+        return value
+
+
+# Function to read the last rows of the same .dat file of many cases
+# Input:
+#   case_dirs - Directories of the cases
+#   dat - Path of the file in each case
+#   n - Number of rows of each case
+# Output:
+#   tails - Dictionary {case_dir: array (n, number of columns)}, the missing files are skipped
+def read_tails(case_dirs, dat='postProcessing/forces/0/forceCoeffs.dat', n=1):
+    tails = {}
+    for case_dir in case_dirs:
+        path = case_dir + '/' + dat
+        if os.path.exists(path):
+            tails[case_dir] = DatFile(path).tail(n)
+    return tails
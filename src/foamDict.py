@@ -0,0 +1,249 @@
+import copy
+import os
+import re
+
+# Tokens of an OpenFoam dictionary
+TOKEN = re.compile(r'''
+    (?P<space>\s+)
+  | (?P<comment>//[^\n]*|/\*.*?\*/)
+  | (?P<directive>\#[^\n]*)
+  | (?P<string>"[^"]*")
+  | (?P<punct>[{}()\[\];])
+  | (?P<word>[^\s{}()\[\];"]+)
+''', re.VERBOSE | re.DOTALL)
+
+# Parsed templates {path: (modification time, dictionary)}
+_templates = {}
+
+
+# Entry of a dictionary: key, value (text, FoamDict or None for a directive)
+# The whitespace and comments before the entry (prefix), between the key and the value (sep)
+# and before the ';' (end) are kept so that an unchanged file is written back identically.
+class _Entry:
+    __slots__ = ("prefix", "key", "sep", "value", "end")
+
+    def __init__(self, prefix, key, sep, value, end=''):
+        self.prefix = prefix
+        self.key = key
+        self.sep = sep
+        self.value = value
+        self.end = end
+
+
+# Class of an OpenFoam dictionary (a file, a sub-dictionary or a list of named dictionaries
+# such as the patches of constant/polyMesh/boundary)
+# The entries are read and modified by key: d["internalField"], d["functions"]["forces"]["liftDir"],
+# or by path: d.get("functions/forces/liftDir"), d.set("functions/forces/liftDir", (0, 1, 0)).
+# The values are the text of the entries (without the ';'), sub-dictionaries are FoamDict.
+class FoamDict:
+    def __init__(self, is_list=False):
+        self.entries = []
+        self.tail = None    # whitespace and comments before the closing brace
+        self.is_list = is_list
+
+    def _find(self, key):
+        for entry in reversed(self.entries):
+            if entry.key == key and not key.startswith('#'):
+                return entry
+        return None
+
+    def __contains__(self, key):
+        return self._find(key) is not None
+
+    def __getitem__(self, key):
+        entry = self._find(key)
+        if entry is None:
+            raise KeyError(key)
+        return entry.value
+
+    def __setitem__(self, key, value):
+        if isinstance(value, dict) and not isinstance(value, FoamDict):
+            sub = FoamDict()
+            for sub_key, sub_value in value.items():
+                sub[sub_key] = sub_value
+            value = sub
+        elif not isinstance(value, FoamDict):
+            value = format_value(value)
+        entry = self._find(key)
+        if entry is None:
+            self.entries.append(_Entry(None, key, None, value))
+        else:
+            entry.value = value
+            entry.end = ''
+
+    def __delitem__(self, key):
+        entry = self._find(key)
+        if entry is None:
+            raise KeyError(key)
+        self.entries.remove(entry)
+
+    def keys(self):
+        return [entry.key for entry in self.entries if entry.value is not None]
+
+    def items(self):
+        return [(entry.key, entry.value) for entry in self.entries if entry.value is not None]
+
+    # Value of an entry given by its path "a/b/c", default if it does not exist
+    def get(self, path, default=None):
+        d = self
+        for key in path.split('/'):
+            if not isinstance(d, FoamDict) or key not in d:
+                return default
+            d = d[key]
+        return d
+
+    # Set the value of an entry given by its path, the missing sub-dictionaries are created
+    def set(self, path, value):
+        keys = path.split('/')
+        d = self
+        for key in keys[:-1]:
+            if key not in d:
+                d[key] = FoamDict()
+            d = d[key]
+        d[keys[-1]] = value
+
+    def __str__(self):
+        return self._render(0)
+
+    def _render(self, depth):
+        indent = '    ' * depth
+        text = []
+        for k, entry in enumerate(self.entries):
+            if entry.prefix is not None:
+                prefix = entry.prefix
+            elif depth == 0 and not self.is_list:
+                prefix = '\n\n' if k > 0 else ''
+            else:
+                prefix = '\n' + indent
+            text.append(prefix)
+            if entry.value is None:
+                text.append(entry.key)
+            elif isinstance(entry.value, FoamDict):
+                sep = entry.sep if entry.sep is not None else '\n' + indent
+                # The key of a list of named dictionaries is its length
+                key = str(len(entry.value.keys())) if entry.value.is_list and entry.key.isdigit() else entry.key
+                text.append(key + sep + entry.value._render_block(depth + 1))
+            else:
+                sep = entry.sep if entry.sep is not None else ' ' * max(1, 16 - len(entry.key))
+                text.append(entry.key + sep + entry.value + entry.end + ';')
+        if self.tail is not None:
+            text.append(self.tail)
+        elif depth > 0:
+            text.append('\n' + '    ' * (depth - 1))
+        return ''.join(text)
+
+    def _render_block(self, depth):
+        if self.is_list:
+            return '(' + self._render(depth) + ')'
+        return '{' + self._render(depth) + '}'
+
+
+# Function to write a value as the text of an entry
+# Numbers are written with str, sequences as (a b c), True/False as true/false
+def format_value(value):
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    if isinstance(value, (list, tuple)):
+        return '(' + ' '.join(format_value(v) for v in value) + ')'
+    return str(value)
+
+
+# Function to parse the text of an OpenFoam dictionary
+def parse(text):
+    tokens = [(m.lastgroup, m.start(), m.end()) for m in TOKEN.finditer(text)]
+    d, k = _parse_entries(text, tokens, 0, None)
+    return d
+
+
+def _parse_entries(text, tokens, k, close, is_list=False):
+    d = FoamDict(is_list)
+    while True:
+        # Whitespace and comments before the entry
+        start = tokens[k][1] if k < len(tokens) else len(text)
+        while k < len(tokens) and tokens[k][0] in ('space', 'comment'):
+            k = k + 1
+        position = tokens[k][1] if k < len(tokens) else len(text)
+        prefix = text[start:position]
+        if k == len(tokens) or text[position] == close:
+            if k == len(tokens) and close is not None:
+                raise ValueError("missing '" + close + "'")
+            d.tail = prefix
+            return d, k + 1
+        kind, key_start, key_end = tokens[k]
+        if kind == 'directive':
+            d.entries.append(_Entry(prefix, text[key_start:key_end], '', None))
+            k = k + 1
+            continue
+        if kind not in ('word', 'string'):
+            raise ValueError("unexpected '" + text[key_start:key_end] + "' at character " + str(key_start))
+        key = text[key_start:key_end]
+        k = k + 1
+        sep_start = tokens[k][1] if k < len(tokens) else len(text)
+        while k < len(tokens) and tokens[k][0] in ('space', 'comment'):
+            k = k + 1
+        if k == len(tokens):
+            raise ValueError("missing value of " + key)
+        sep = text[sep_start:tokens[k][1]]
+        opening = text[tokens[k][1]]
+        if opening == '{' or (opening == '(' and close != ')' and key.isdigit() and _is_dict_list(text, tokens, k + 1)):
+            # Sub-dictionary, or list of named dictionaries (the key is then the length of the list)
+            value, k = _parse_entries(text, tokens, k + 1, '}' if opening == '{' else ')', opening == '(')
+            end = ''
+        else:
+            # Value up to the ';' outside of brackets
+            value_start = tokens[k][1]
+            depth = 0
+            while True:
+                if k == len(tokens):
+                    raise ValueError("missing ';' after " + key)
+                token = text[tokens[k][1]:tokens[k][2]]
+                if tokens[k][0] == 'punct':
+                    if token in '([{':
+                        depth = depth + 1
+                    elif token in ')]}':
+                        depth = depth - 1
+                    elif depth == 0:
+                        break
+                k = k + 1
+            value = text[value_start:tokens[k][1]]
+            end = value[len(value.rstrip()):]
+            value = value.rstrip()
+            k = k + 1
+        d.entries.append(_Entry(prefix, key, sep, value, end))
+
+
+# Check if a list starts with a named dictionary: name { ...
+def _is_dict_list(text, tokens, k):
+    words = [t for t in tokens[k:k + 6] if t[0] not in ('space', 'comment')]
+    return len(words) >= 2 and words[0][0] == 'word' and text[words[1][1]] == '{'
+
+
+# Function to read a dictionary file
+def read(path):
+    with open(path, 'r') as f:
+        return parse(f.read())
+
+
+# Function to write a dictionary file
+def write(d, path):
+    with open(path, 'w') as f:
+        f.write(str(d))
+
+
+# Function to get a copy of a template dictionary, each file is parsed once
+# (again only if it has been modified) and the copies are modified and written per case
+def template(path):
+    path = os.path.abspath(path)
+    mtime = os.path.getmtime(path)
+    if path not in _templates or _templates[path][0] != mtime:
+        _templates[path] = (mtime, read(path))
+    return copy.deepcopy(_templates[path][1])
+
+
+# Function to get the list of named patches of a boundary file (constant/polyMesh/boundary)
+# The patches are then modified by name: patches(boundary)["airfoil"]["type"] = "wall"
+def patches(boundary):
+    for entry in boundary.entries:
+        if isinstance(entry.value, FoamDict) and entry.value.is_list:
+            return entry.value
+    raise KeyError("no list of patches")
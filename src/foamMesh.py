@@ -0,0 +1,454 @@
+import foamDict
+import numpy as np
+import os
+import re
+
+# Faces of the cells of each gmsh element type, local node numbers (cell models of OpenFoam)
+# The orientation of the faces is checked against the cell centres by build.
+CELL_FACES = {
+    4: [[0, 2, 1], [0, 1, 3], [0, 3, 2], [1, 2, 3]],                                          # tetrahedron
+    5: [[0, 4, 7, 3], [1, 2, 6, 5], [0, 1, 5, 4], [3, 7, 6, 2], [0, 3, 2, 1], [4, 5, 6, 7]],    # hexahedron
+    6: [[0, 2, 1], [3, 4, 5], [0, 3, 5, 2], [1, 2, 5, 4], [0, 1, 4, 3]],                        # prism
+    7: [[0, 3, 2, 1], [0, 1, 4], [1, 2, 4], [2, 3, 4], [3, 0, 4]],                              # pyramid
+}
+CELL_NODES = {4: 4, 5: 8, 6: 6, 7: 5}
+FACE_NODES = {2: 3, 3: 4}     # triangle, quadrangle
+LIST_START = re.compile(rb'(\d+)\s*\(')
+
+
+# Function to get the mesh of the current gmsh model (after gmsh.model.mesh.generate)
+# The 3D elements are the cells, the elements of the physical groups of dimension 2 the patches.
+# Output:
+#   mesh - see build
+def from_gmsh():
+    import gmsh
+    tags, coords, _ = gmsh.model.mesh.getNodes()
+    # Index of each node tag in coords
+    index = np.full(int(tags.max()) + 1, -1, dtype=np.int64)
+    index[tags.astype(np.int64)] = np.arange(len(tags))
+    cells = []
+    for element_type, _, nodes in zip(*gmsh.model.mesh.getElements(3)):
+        if element_type not in CELL_FACES:
+            raise ValueError(f"gmsh element type {element_type} is not a linear 3D cell")
+        cells.append((element_type, index[nodes.astype(np.int64)].reshape(-1, CELL_NODES[element_type])))
+    patches = []
+    for dim, tag in gmsh.model.getPhysicalGroups(2):
+        faces = [np.empty((0, 4), dtype=np.int64)]
+        for entity in gmsh.model.getEntitiesForPhysicalGroup(dim, tag):
+            for element_type, _, nodes in zip(*gmsh.model.mesh.getElements(dim, entity)):
+                faces.append(_pad(index[nodes.astype(np.int64)].reshape(-1, FACE_NODES[element_type])))
+        patches.append((gmsh.model.getPhysicalName(dim, tag), np.concatenate(faces)))
+    return build(coords.reshape(-1, 3), cells, patches)
+
+
+# Faces as arrays of 4 nodes, the triangles are completed with -1
+def _pad(faces):
+    if faces.shape[1] == 3:
+        return np.hstack((faces, np.full((len(faces), 1), -1, dtype=faces.dtype)))
+    return faces
+
+
+# Function to build the polyMesh of a mesh (vectorised over the faces)
+# Input:
+#   points - Array (number of nodes, 3)
+#   cells - List of (gmsh element type, array (number of cells, nodes of the type)) of node indices
+#   patches - List of (name, array (number of faces, 4)) of node indices of the boundary faces (-1 completed triangles)
+# Output:
+#   mesh - Dictionary: points, faces (array (number of faces, 4), -1 completed), owner, neighbour
+#          (internal faces first, in upper triangular order), patches [(name, start face, number of faces)]
+def build(points, cells, patches):
+    # All the faces of all the cells, oriented outwards
+    faces = []
+    face_cell = []
+    centres = []
+    n_cells = 0
+    for element_type, nodes in cells:
+        for local in CELL_FACES[element_type]:
+            faces.append(_pad(nodes[:, local]))
+            face_cell.append(n_cells + np.arange(len(nodes)))
+        centres.append(points[nodes].mean(axis=1))
+        n_cells = n_cells + len(nodes)
+    faces = np.concatenate(faces)
+    face_cell = np.concatenate(face_cell)
+    centres = np.concatenate(centres)
+    faces = _orient(points, faces, centres[face_cell])
+
+    # The faces of two cells have the same sorted nodes: the cell of lower index is the owner
+    keys = np.sort(faces, axis=1)
+    order = np.lexsort((face_cell,) + tuple(keys.T[::-1]))
+    starts, counts = _groups(keys[order])
+    if counts.max() > 2:
+        raise ValueError(f"{np.sum(counts > 2)} faces belong to more than two cells")
+    first = order[starts]
+    internal = counts == 2
+    owner = face_cell[first[internal]]
+    neighbour = face_cell[order[starts[internal] + 1]]
+    internal_faces = faces[first[internal]]
+    upper = np.lexsort((neighbour, owner))
+
+    # Boundary faces, sorted by patch: a boundary face and the face of a patch have the same sorted nodes
+    boundary = first[~internal]
+    patch_keys = np.concatenate([keys[boundary]] + [np.sort(patch_faces, axis=1) for _, patch_faces in patches])
+    source = np.concatenate([np.full(len(boundary), -1)] + [np.full(len(patch_faces), k) for k, (_, patch_faces) in enumerate(patches)])
+    order = np.lexsort((source,) + tuple(patch_keys.T[::-1]))
+    starts, counts = _groups(patch_keys[order])
+    matched = (counts == 2) & (source[order[starts]] == -1)
+    patch = np.full(len(patch_keys), -1)
+    patch[order[starts[matched]]] = source[order[starts[matched] + 1]]
+    patch = patch[:len(boundary)]
+    if np.any(patch < 0):
+        raise ValueError(f"{np.sum(patch < 0)} boundary faces are not in a physical group")
+    boundary = boundary[np.lexsort((face_cell[boundary], patch))]
+    n_faces = np.bincount(patch, minlength=len(patches))
+    start = len(owner) + np.concatenate(([0], np.cumsum(n_faces)[:-1]))
+
+    # Keep the points of the cells only (gmsh also has the centres of the arcs)
+    faces = np.concatenate((internal_faces[upper], faces[boundary]))
+    used = np.zeros(len(points), dtype=bool)
+    used[faces[faces >= 0]] = True
+    used = np.flatnonzero(used)
+    renumber = np.full(len(points), -1)
+    renumber[used] = np.arange(len(used))
+    faces = np.where(faces >= 0, renumber[np.maximum(faces, 0)], -1)
+    return {"points": points[used], "faces": faces, "owner": np.concatenate((owner[upper], face_cell[boundary])),
+            "neighbour": neighbour[upper], "n_cells": n_cells,
+            "patches": [(name, int(s), int(n)) for (name, _), s, n in zip(patches, start, n_faces)]}
+
+
+# Groups of equal rows of sorted keys: start and length of each group
+def _groups(sorted_keys):
+    new = np.concatenate(([True], np.any(sorted_keys[1:] != sorted_keys[:-1], axis=1)))
+    starts = np.flatnonzero(new)
+    return starts, np.diff(np.append(starts, len(sorted_keys)))
+
+
+# Function to compute the centres and the area vectors of faces (vectorised over the faces)
+# Input:
+#   faces - Array (number of faces, 4) of node indices, -1 completed triangles
+# Output:
+#   centres, areas - Arrays (number of faces, 3), the area vectors follow the order of the nodes
+#                    (out of the owner cell for the faces of a polyMesh)
+def face_geometry(points, faces):
+    triangle = faces[:, 3] < 0
+    last = np.where(triangle, faces[:, 2], faces[:, 3])
+    p0, p1, p2, p3 = points[faces[:, 0]], points[faces[:, 1]], points[faces[:, 2]], points[last]
+    # Area vector from the diagonals (from the edges for a triangle, p3 = p2)
+    areas = 0.5 * np.cross(p2 - p0, p3 - p1)
+    centres = np.where(triangle[:, None], (p0 + p1 + p2) / 3, (p0 + p1 + p2 + p3) / 4)
+    return centres, areas
+
+
+# Function to orient the faces from their cell outwards
+def _orient(points, faces, cell_centres):
+    centres, areas = face_geometry(points, faces)
+    inward = np.einsum('ij,ij->i', areas, centres - cell_centres) < 0
+    triangle = faces[:, 3] < 0
+    flipped = np.where(triangle[:, None], faces[:, [0, 2, 1, 3]], faces[:, [0, 3, 2, 1]])
+    return np.where(inward[:, None], flipped, faces)
+
+
+# Header of a polyMesh file
+def _header(class_name, name, binary, note=None):
+    header = foamDict.FoamDict()
+    entries = {"format": "binary" if binary else "ascii", "class": class_name}
+    if binary:
+        entries["arch"] = '"LSB;label=32;scalar=64"'
+    if note is not None:
+        entries["note"] = '"' + note + '"'
+    entries.update({"location": '"constant/polyMesh"', "object": name})
+    header["FoamFile"] = entries
+    return (str(header) + "\n\n").encode()
+
+
+# Write a list of labels or vectors: "n\n(" then the raw values in binary, one per line in ascii
+def _list(values, binary):
+    if binary:
+        dtype = '<i4' if values.dtype.kind == 'i' else '<f8'
+        return str(len(values)).encode() + b"\n(" + np.ascontiguousarray(values, dtype=dtype).tobytes() + b")\n"
+    if values.ndim == 1:
+        rows = values.astype(str)
+    else:
+        rows = ["(" + " ".join(repr(float(v)) for v in row) + ")" for row in values]
+    return (str(len(values)) + "\n(\n" + "\n".join(rows) + "\n)\n").encode()
+
+
+# Function to write the polyMesh of a mesh (see build)
+# Input:
+#   mesh - Dictionary of build
+#   mesh_case - Case directory, the mesh is written in mesh_case/constant/polyMesh
+#   binary - Write points, faces, owner and neighbour in binary (ascii otherwise)
+#   boundary - Write the boundary file, with the type patch (see runOpenFoam.patch_boundary for their types)
+def write(mesh, mesh_case, binary=True, boundary=True):
+    directory = mesh_case + "/constant/polyMesh"
+    os.makedirs(directory, exist_ok=True)
+    faces = mesh["faces"]
+    sizes = 4 - (faces[:, 3] < 0)
+    note = (f"nPoints:{len(mesh['points'])}  nCells:{mesh['n_cells']}  nFaces:{len(faces)}  "
+            f"nInternalFaces:{len(mesh['neighbour'])}")
+    with open(directory + "/points", 'wb') as f:
+        f.write(_header("vectorField", "points", binary) + _list(mesh["points"], binary))
+    with open(directory + "/faces", 'wb') as f:
+        if binary:
+            # faceCompactList: offsets of the faces in the list of their nodes
+            offsets = np.concatenate(([0], np.cumsum(sizes)))
+            f.write(_header("faceCompactList", "faces", binary) + _list(offsets, binary) + b"\n"
+                    + _list(faces[faces >= 0], binary))
+        else:
+            rows = [f"{size}(" + " ".join(map(str, face[:size])) + ")" for size, face in zip(sizes, faces)]
+            f.write(_header("faceList", "faces", binary)
+                    + (str(len(faces)) + "\n(\n" + "\n".join(rows) + "\n)\n").encode())
+    with open(directory + "/owner", 'wb') as f:
+        f.write(_header("labelList", "owner", binary, note) + _list(mesh["owner"], binary))
+    with open(directory + "/neighbour", 'wb') as f:
+        f.write(_header("labelList", "neighbour", binary, note) + _list(mesh["neighbour"], binary))
+    if not boundary:
+        return
+
+    boundary = foamDict.FoamDict()
+    boundary["FoamFile"] = {"format": "ascii", "class": "polyBoundaryMesh", "location": '"constant/polyMesh"',
+                            "object": "boundary"}
+    patches = foamDict.FoamDict(is_list=True)
+    for name, start, n_faces in mesh["patches"]:
+        patches[name] = {"type": "patch", "physicalType": "patch", "nFaces": n_faces, "startFace": start}
+    boundary[str(len(mesh["patches"]))] = patches
+    boundary.tail = "\n"
+    foamDict.write(boundary, directory + "/boundary")
+
+
+# Read the lists of a polyMesh file (binary or ascii): header entries and list of arrays
+def _read_lists(path, dtype):
+    with open(path, 'rb') as f:
+        data = f.read()
+    end = data.index(b'}', data.index(b'FoamFile')) + 1
+    header = foamDict.parse(data[:end].decode())["FoamFile"]
+    binary = header["format"] == "binary"
+    if binary and "label=64" in header.get("arch", ""):
+        raise ValueError(f"{path}: 64 bits labels are not supported")
+    lists = []
+    k = end
+    while True:
+        match = LIST_START.search(data, k)
+        if match is None:
+            return header, lists
+        n = int(match.group(1))
+        start = match.end()
+        if binary:
+            size = np.dtype(dtype).itemsize * n * (3 if dtype == '<f8' else 1)
+            lists.append(np.frombuffer(data[start:start + size], dtype=dtype).copy())
+            k = start + size + 1
+        else:
+            # The closing parenthesis of the list is at the start of a line (one point or face per line)
+            stop = data.index(b'\n)', start) + 1
+            text = data[start:stop].replace(b'(', b' ').replace(b')', b' ')
+            lists.append(np.array(text.split(), dtype=float if dtype == '<f8' else np.int64))
+            k = stop + 1
+        if header["class"] != "faceCompactList" or len(lists) == 2:
+            return header, lists
+
+
+# Function to read the polyMesh of a case (binary or ascii, faces of 3 or 4 nodes)
+# Input:
+#   mesh_case - Case directory of the mesh
+# Output:
+#   mesh - Dictionary of build
+def read(mesh_case):
+    directory = mesh_case + "/constant/polyMesh"
+    _, (points,) = _read_lists(directory + "/points", '<f8')
+    header, lists = _read_lists(directory + "/faces", '<i4')
+    if header["class"] == "faceCompactList":
+        offsets, labels = lists
+        sizes = np.diff(offsets)
+    else:
+        # faceList: size of the face then its nodes
+        values = lists[0]
+        sizes, starts = [], []
+        k = 0
+        while k < len(values):
+            sizes.append(values[k])
+            starts.append(k + 1)
+            k = k + 1 + values[k]
+        sizes = np.array(sizes)
+        labels = np.delete(values, np.array(starts, dtype=np.int64) - 1)
+        offsets = np.concatenate(([0], np.cumsum(sizes)))
+    if np.any((sizes < 3) | (sizes > 4)):
+        raise ValueError(f"{mesh_case}: faces of more than 4 nodes are not supported")
+    faces = np.full((len(sizes), 4), -1, dtype=np.int64)
+    for k in range(4):
+        has = sizes > k
+        faces[has, k] = labels[offsets[:-1][has] + k]
+    _, (owner,) = _read_lists(directory + "/owner", '<i4')
+    _, (neighbour,) = _read_lists(directory + "/neighbour", '<i4')
+    boundary = foamDict.patches(foamDict.read(directory + "/boundary"))
+    return {"points": points.reshape(-1, 3), "faces": faces, "owner": owner.astype(np.int64),
+            "neighbour": neighbour.astype(np.int64), "n_cells": int(owner.max()) + 1,
+            "patches": [(name, int(boundary[name]["startFace"]), int(boundary[name]["nFaces"])) for name in boundary.keys()]}
+
+
+# Function to compute the bandwidth and the profile of the matrix of a mesh (as reported by renumberMesh)
+# Output:
+#   band - Largest distance between the owner and the neighbour of an internal face
+#   profile - Sum over the cells of their largest distance to a lower numbered neighbour
+def bandwidth(owner, neighbour, n_cells):
+    distance = neighbour - owner
+    cell_band = np.zeros(n_cells, dtype=np.int64)
+    np.maximum.at(cell_band, neighbour, distance)
+    return int(distance.max(initial=0)), int(cell_band.sum())
+
+
+# Function to order the cells by Reverse Cuthill-McKee on the face graph of the mesh
+# The breadth first search is vectorised by level: a cell is numbered after the first numbered cell it
+# neighbours, by increasing number of neighbours, each connected region from a pseudo-peripheral cell.
+# Output:
+#   order - Old label of the cells in the new order
+def rcm(owner, neighbour, n_cells):
+    rows = np.concatenate((owner, neighbour))
+    columns = np.concatenate((neighbour, owner))
+    sort = np.argsort(rows, kind='stable')
+    columns = columns[sort]
+    degree = np.bincount(rows, minlength=n_cells)
+    offsets = np.concatenate(([0], np.cumsum(degree)))
+
+    def levels(start, numbered):
+        # Breadth first search from start: cells in Cuthill-McKee order and last level
+        numbered[start] = True
+        order, level = [np.array([start])], np.array([start])
+        while True:
+            counts = degree[level]
+            parent = np.repeat(np.arange(len(level)), counts)
+            first = np.repeat(offsets[level], counts)
+            candidates = columns[first + np.arange(len(parent)) - np.repeat(np.cumsum(counts) - counts, counts)]
+            keep = ~numbered[candidates]
+            candidates, parent = candidates[keep], parent[keep]
+            if len(candidates) == 0:
+                return order, level
+            candidates = candidates[np.lexsort((degree[candidates], parent))]
+            _, index = np.unique(candidates, return_index=True)
+            level = candidates[np.sort(index)]
+            numbered[level] = True
+            order.append(level)
+
+    numbered = np.zeros(n_cells, dtype=bool)
+    order = []
+    remaining = np.argsort(degree, kind='stable')
+    k = 0
+    while len(order) < n_cells:
+        while numbered[remaining[k]]:
+            k = k + 1
+        # Pseudo-peripheral start cell: lowest degree cell of the last level, while the depth increases
+        start, depth = remaining[k], 0
+        for _ in range(5):
+            trial = numbered.copy()
+            region, last = levels(start, trial)
+            if len(region) <= depth:
+                break
+            depth = len(region)
+            start = last[np.argmin(degree[last])]
+        region, _ = levels(start, numbered)
+        order.extend(np.concatenate(region).tolist())
+    return np.array(order[::-1], dtype=np.int64)
+
+
+# Function to renumber the cells of a mesh, then its faces in upper triangular order
+# Input:
+#   mesh - Dictionary of build
+#   order - Old label of the cells in the new order (see rcm)
+# Output:
+#   mesh - Renumbered mesh
+#   cell_map - New label of each old cell
+def renumber(mesh, order):
+    cell_map = np.empty(mesh["n_cells"], dtype=np.int64)
+    cell_map[order] = np.arange(len(order))
+    n_internal = len(mesh["neighbour"])
+    faces = mesh["faces"].copy()
+    owner = cell_map[mesh["owner"]]
+    neighbour = cell_map[mesh["neighbour"]]
+
+    # The owner of an internal face is the cell of lower label: swapped cells flip the face
+    swap = owner[:n_internal] > neighbour
+    owner[:n_internal][swap], neighbour[swap] = neighbour[swap], owner[:n_internal][swap]
+    internal = faces[:n_internal]
+    triangle = internal[:, 3] < 0
+    internal[swap & triangle] = internal[swap & triangle][:, [0, 2, 1, 3]]
+    internal[swap & ~triangle] = internal[swap & ~triangle][:, [0, 3, 2, 1]]
+
+    # Internal faces in upper triangular order, boundary faces by owner within their patch
+    face_order = [np.lexsort((neighbour, owner[:n_internal]))]
+    for _, start, n_faces in mesh["patches"]:
+        face_order.append(start + np.argsort(owner[start:start + n_faces], kind='stable'))
+    face_order = np.concatenate(face_order)
+    renumbered = dict(mesh, faces=faces[face_order], owner=owner[face_order], neighbour=neighbour[face_order[:n_internal]])
+    return renumbered, cell_map
+
+
+# Function to compute the centres of the cells of a mesh (mean of the centres of their faces)
+# Output:
+#   centres - Array (number of cells, 3)
+def cell_centres(mesh):
+    faces = mesh["faces"]
+    valid = faces >= 0
+    face_centres = (mesh["points"][np.maximum(faces, 0)] * valid[..., None]).sum(axis=1) / valid.sum(axis=1)[:, None]
+    cells = np.concatenate((mesh["owner"], mesh["neighbour"]))
+    face_centres = np.concatenate((face_centres, face_centres[:len(mesh["neighbour"])]))
+    counts = np.bincount(cells, minlength=mesh["n_cells"])
+    return np.column_stack([np.bincount(cells, face_centres[:, k], minlength=mesh["n_cells"]) / counts for k in range(3)])
+
+
+# Function to find the nearest source point of each target point in the plane (exact search)
+# The source points are binned on a grid whose lines are quantiles of their coordinates, so that the bins
+# follow the grading of the mesh. The targets of a bin are compared to the sources of the neighbouring bins,
+# then to all the bins within the largest distance found, which contain their nearest sources.
+# Input:
+#   source, target - Arrays (number of points, 2)
+#   per_bin - Average number of source points per bin
+# Output:
+#   nearest - Index of the nearest source point of each target point
+def nearest(source, target, per_bin=8):
+    n_bins = max(1, int(np.sqrt(len(source) / per_bin)))
+    edges = [np.unique(np.quantile(source[:, k], np.linspace(0, 1, n_bins + 1)[1:-1])) for k in range(2)]
+    nx, ny = len(edges[0]) + 1, len(edges[1]) + 1
+
+    def bins(points):
+        return [np.searchsorted(edges[k], points[:, k], side='right') for k in range(2)]
+
+    # Sources sorted by bin, the bins of a row of the grid are contiguous
+    sx, sy = bins(source)
+    order = np.argsort(sx * ny + sy, kind='stable')
+    starts = np.searchsorted((sx * ny + sy)[order], np.arange(nx * ny + 1))
+    sorted_source = source[order]
+    tx, ty = bins(target)
+    target_key = tx * ny + ty
+    target_order = np.argsort(target_key, kind='stable')
+    target_starts = np.searchsorted(target_key[target_order], np.arange(nx * ny + 1))
+
+    def gather(x0, x1, y0, y1):
+        return np.concatenate([np.arange(starts[i * ny + y0], starts[i * ny + y1 + 1]) for i in range(x0, x1 + 1)])
+
+    def search(points, window):
+        candidates = gather(*window)
+        distance = np.zeros((len(points), len(candidates)))
+        for k in range(2):
+            distance += (points[:, k, None] - sorted_source[None, candidates, k]) ** 2
+        best = distance.argmin(axis=1)
+        return candidates[best], np.sqrt(distance[np.arange(len(points)), best].max())
+
+    nearest = np.empty(len(target), dtype=np.int64)
+    for key in np.flatnonzero(target_starts[1:] > target_starts[:-1]):
+        members = target_order[target_starts[key]:target_starts[key + 1]]
+        points = target[members]
+        i, j = divmod(int(key), ny)
+        # Neighbouring bins, widened until they hold a source
+        k = 1
+        while True:
+            window = (max(i - k, 0), min(i + k, nx - 1), max(j - k, 0), min(j + k, ny - 1))
+            if len(gather(*window)) > 0:
+                break
+            k = 2 * k
+        found, radius = search(points, window)
+        # Bins within the largest distance of the targets to their nearest source so far
+        (x0, y0), (x1, y1) = [[int(b[0]) for b in bins(corner[None])]
+                              for corner in [points.min(axis=0) - radius, points.max(axis=0) + radius]]
+        if x0 < window[0] or x1 > window[1] or y0 < window[2] or y1 > window[3]:
+            window = (min(x0, window[0]), max(x1, window[1]), min(y0, window[2]), max(y1, window[3]))
+            found, _ = search(points, window)
+        nearest[members] = order[found]
+    return nearest
@@ -0,0 +1,138 @@
+import foamDict
+import foamMesh
+import runOpenFoam
+import gzip
+import os
+import shutil
+import sys
+import time
+
+# Stub of the OpenFoam applications used by the scripts, to run the pipeline without OpenFoam
+# (benchmarks, tests of the scripts). foamRun replays the postProcessing of the template case:
+# forceCoeffs.dat and residuals.dat are written line by line, the fields are written every
+# writeInterval with the number of cells of the mesh (ascii, gzip if writeCompression is on),
+# purgeWrite is applied and stopAt writeNow is honoured as with runTimeModifiable.
+# FOAM_STUB_DELAY, FOAM_STUB_DIVERGE and FOAM_STUB_STALL slow it down, make it diverge or hang.
+# gmshToFoam converts the mesh with foamMesh (ascii) if gmsh is installed, else copies the polyMesh of
+# the template (without faces, meshCheck.RENUMBER = None), the other applications do nothing.
+TEMPLATE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "openFoam", "Cas_de_base")
+APPLICATIONS = ["foamRun", "gmshToFoam", "decomposePar", "reconstructPar", "foamFormatConvert", "renumberMesh",
+                "checkMesh", "mapFields", "foamPostProcess", "mpirun"]
+DELAY = float(os.environ.get("FOAM_STUB_DELAY", 0))     # wall time of an iteration of foamRun (s)
+# Iterations after which foamRun diverges (residuals growing tenfold every 10 iterations) or hangs
+DIVERGE = float(os.environ.get("FOAM_STUB_DIVERGE", "inf"))
+STALL = float(os.environ.get("FOAM_STUB_STALL", "inf"))
+
+
+# Function to install the stubs in a directory, to be put first in the PATH
+def install(bin_dir):
+    os.makedirs(bin_dir, exist_ok=True)
+    for application in APPLICATIONS:
+        path = os.path.join(bin_dir, application)
+        with open(path, 'w') as f:
+            f.write(f'#!/bin/sh\nexec "{sys.executable}" "{os.path.abspath(__file__)}" {application} "$@"\n')
+        os.chmod(path, 0o755)
+    return bin_dir
+
+
+# Text of a field with a nonuniform internalField of n_cells values
+def _field_text(name, n_cells):
+    field = foamDict.read(TEMPLATE + "/0/" + name)
+    value = "(0 0 0)" if field["FoamFile"]["class"] == "volVectorField" else "0"
+    kind = "vector" if value.startswith("(") else "scalar"
+    field["internalField"] = f"nonuniform List<{kind}> \n{n_cells}\n(\n" + "\n".join([value] * n_cells) + "\n)\n"
+    return str(field)
+
+
+def foam_run():
+    control = foamDict.read("system/controlDict")
+    end_time = float(control["endTime"])
+    write_interval = int(float(control.get("writeInterval", "100")))
+    purge = int(control.get("purgeWrite", "0"))
+    compress = control.get("writeCompression", "off") in ("on", "yes", "true")
+    n_cells = runOpenFoam.cell_count(".")
+    fields = {name: _field_text(name, n_cells) for name in ["U", "p", "nut", "nuTilda"]}
+
+    def read_rows(path):
+        header, rows = [], {}
+        with open(TEMPLATE + "/postProcessing/" + path) as f:
+            for line in f:
+                if line.startswith("#"):
+                    header.append(line)
+                else:
+                    rows[float(line.split()[0])] = line
+        return header, rows
+
+    coeffs_header, coeffs = read_rows("forces/0/forceCoeffs.dat")
+    residuals_header, residuals = read_rows("residuals/0/residuals.dat")
+    os.makedirs("postProcessing/forces/0", exist_ok=True)
+    os.makedirs("postProcessing/residuals/0", exist_ok=True)
+    written = []
+
+    def write_time(t):
+        time_dir = "%g" % t
+        os.makedirs(time_dir, exist_ok=True)
+        for name, text in fields.items():
+            if compress:
+                with gzip.open(time_dir + "/" + name + ".gz", "wt", compresslevel=1) as f:
+                    f.write(text)
+            else:
+                with open(time_dir + "/" + name, "w") as f:
+                    f.write(text)
+        written.append(time_dir)
+        if purge > 0 and len(written) > purge:
+            shutil.rmtree(written.pop(0), ignore_errors=True)
+
+    with open("postProcessing/forces/0/forceCoeffs.dat", "w") as coeffs_file, \
+            open("postProcessing/residuals/0/residuals.dat", "w") as residuals_file:
+        coeffs_file.writelines(coeffs_header)
+        residuals_file.writelines(residuals_header)
+        t = 0
+        for t in sorted(residuals):
+            if t > end_time:
+                break
+            if t > DIVERGE:
+                values = residuals[t].split()
+                growth = 10 ** ((t - DIVERGE) / 10)
+                residuals[t] = "\t".join([values[0]] + ["%e" % (float(v) * growth) for v in values[1:]]) + "\n"
+            if t > STALL:
+                residuals_file.flush()
+                time.sleep(1e9)
+            residuals_file.write(residuals[t])
+            if t in coeffs:
+                coeffs_file.write(coeffs[t])
+                coeffs_file.flush()
+                residuals_file.flush()
+            if t > 0 and t % write_interval == 0:
+                write_time(t)
+            if t % 10 == 0 and "writeNow" in foamDict.read("system/controlDict").get("stopAt", ""):
+                break
+            if DELAY > 0:
+                time.sleep(DELAY)
+        if not written or written[-1] != "%g" % t:
+            write_time(t)
+    print("End")
+
+
+def gmsh_to_foam(mesh_file):
+    shutil.rmtree("constant/polyMesh", ignore_errors=True)
+    try:
+        import gmsh
+    except ImportError:
+        shutil.copytree(TEMPLATE + "/constant/polyMesh", "constant/polyMesh")
+        return
+    gmsh.initialize()
+    gmsh.open(mesh_file)
+    foamMesh.write(foamMesh.from_gmsh(), ".", binary=False)
+    gmsh.finalize()
+
+
+if __name__ == "__main__":
+    application = sys.argv[1]
+    if application == "foamRun":
+        foam_run()
+    elif application == "gmshToFoam":
+        gmsh_to_foam(sys.argv[2])
+    elif application == "mpirun":
+        # mpirun -np N application -parallel: run the application on one process
+        os.execvp(sys.argv[4], sys.argv[4:5])
@@ -0,0 +1,185 @@
+import designSweep
+import meshCache
+import runOpenFoam
+import argparse
+import json
+import numpy as np
+import os
+
+# Mesh parameters scaled by the refinement ratio: sizes are divided by it, numbers of points multiplied
+REFINED_SIZES = ["lc_prof", "lc_edge"]
+REFINED_COUNTS = ["nb_pts"]
+SAFETY_FACTOR = 1.25    # of the GCI for a study of three meshes or more
+COARSE_RATIO = 2        # coarsening of the mesh of the coarse-to-fine initialisation (see coarse_mesh)
+
+
+# Function to build the parameters of a mesh of the family
+# Input:
+#   sample - Parameters of the reference mesh (overriding designSweep.DEFAULTS)
+#   ratio - Refinement ratio relative to the reference (> 1: finer)
+#   refine_yh - Also divide the first cell height by the ratio (it is kept by default to keep the y+)
+def refine(sample, ratio, refine_yh=False):
+    params = designSweep.geometry_params(sample)
+    refined = dict(sample)
+    for name in REFINED_SIZES + (["yh"] if refine_yh else []):
+        refined[name] = params[name] / ratio
+    for name in REFINED_COUNTS:
+        refined[name] = int(round(params[name] * ratio))
+    return refined
+
+
+# Function to get the coarse mesh of a geometry, solved first for each alpha to initialise the fine case
+# (see sweepScheduler.run_case), from the cache
+# Input:
+#   params - Geometry, mesh and flow parameters of the fine mesh
+#   ratio - Coarsening ratio (> 1), the first cell height is coarsened as well
+# Output:
+#   mesh_case - Mesh case of meshCache.get_mesh
+def coarse_mesh(params, ratio=COARSE_RATIO):
+    coarse = refine(params, 1 / ratio, refine_yh=True)
+    return meshCache.get_mesh(*[coarse[name] for name in meshCache.MESH_PARAMETERS])
+
+
+# Function to compute the Richardson extrapolation of a quantity computed on three meshes
+# (procedure of Celik et al. 2008, J. Fluids Eng. 130, for non-constant refinement ratios)
+# Input:
+#   h - Representative cell sizes of the meshes, fine to coarse
+#   phi - Quantity on each mesh
+# Output:
+#   result - Dictionary: order p, extrapolated value phi_ext, relative error of the fine mesh
+#            e_ext, GCI of the fine mesh, convergence "monotonic", "oscillatory" or "none"
+def richardson(h, phi, max_iterations=100):
+    h1, h2, h3 = h
+    phi1, phi2, phi3 = phi
+    r21 = h2 / h1
+    r32 = h3 / h2
+    if r21 <= 1 or r32 <= 1:
+        raise ValueError("the meshes must have different cell sizes, sorted fine to coarse")
+    eps21 = phi2 - phi1
+    eps32 = phi3 - phi2
+    if eps21 == 0 or eps32 == 0:
+        return {"p": np.nan, "phi_ext": phi1, "e_ext": 0.0, "gci": 0.0, "convergence": "monotonic"}
+    ratio = eps32 / eps21
+    s = np.sign(ratio)
+    convergence = "monotonic" if 0 < ratio else "oscillatory"
+    if abs(ratio) < 1:
+        # The differences grow with the refinement
+        convergence = "none"
+    # Fixed point iteration on the order
+    p = abs(np.log(abs(ratio))) / np.log(r21)
+    for _ in range(max_iterations):
+        q = np.log((r21 ** p - s) / (r32 ** p - s))
+        p_new = abs(np.log(abs(ratio)) + q) / np.log(r21)
+        if not np.isfinite(p_new) or abs(p_new - p) < 1e-10:
+            break
+        p = p_new
+    phi_ext = (r21 ** p * phi1 - phi2) / (r21 ** p - 1)
+    e_a = abs(eps21 / phi1)
+    return {"p": p, "phi_ext": phi_ext, "e_ext": abs((phi_ext - phi1) / phi_ext),
+            "gci": SAFETY_FACTOR * e_a / (r21 ** p - 1), "convergence": convergence}
+
+
+# Function to run a mesh-resolution study
+# The meshes of the family are generated and solved for each alpha in parallel by designSweep.
+# The three finest meshes give the Richardson extrapolation of Cl and Cd, the error of each mesh
+# is estimated against the extrapolated values.
+# Input:
+#   name - Name of the study (journal and polar store case name)
+#   sample - Geometry, reference mesh and flow parameters (overriding designSweep.DEFAULTS)
+#   ratios - Refinement ratios of the meshes relative to the reference (at least 3)
+#   alphas - Angles of attack solved on each mesh (degrees)
+#   target - Relative error allowed on Cl and Cd (times SAFETY_FACTOR) for the recommended mesh
+#   n_workers, cores_per_case, conv_window, conv_tol, storage - see designSweep.run_design_sweep
+# Output:
+#   report - Dictionary with the meshes, the Richardson results and the recommended mesh
+def run_grid_study(name, sample, ratios, alphas, target=0.01, refine_yh=False, n_workers=None, cores_per_case=1,
+                   conv_window=300, conv_tol=1e-3, storage="compressed"):
+    if len(ratios) < 3:
+        raise ValueError("a grid study needs at least 3 meshes")
+    samples = [refine(sample, ratio, refine_yh) for ratio in ratios]
+    jobs = designSweep.run_design_sweep(name, samples, alphas, n_workers, cores_per_case, conv_window, conv_tol, storage)
+
+    # Cells and coefficients of each mesh
+    meshes = []
+    for ratio, refined in zip(ratios, samples):
+        params = designSweep.geometry_params(refined)
+        mesh_job = jobs["mesh-" + meshCache.mesh_key(params)]
+        if mesh_job["status"] != "done":
+            raise RuntimeError(f"mesh of ratio {ratio} failed: {mesh_job['result']}")
+        coeffs = {}
+        for job in jobs.values():
+            if job["type"] == "solve" and job["params"] == params and job["status"] == "done":
+                row = job["result"][0]
+                coeffs[job["alpha"]] = {"Cl": row[4], "Cd": row[3], "Cm": row[2]}
+        n_cells = runOpenFoam.cell_count(mesh_job["result"][0])
+        meshes.append({"ratio": ratio, "params": {k: refined[k] for k in REFINED_SIZES + REFINED_COUNTS + ["yh"] if k in refined},
+                       "cells": n_cells, "h": 1 / np.sqrt(n_cells), "coeffs": coeffs})
+    meshes.sort(key=lambda mesh: (mesh["h"], -mesh["ratio"]))     # fine to coarse
+
+    # Richardson extrapolation on the three finest meshes
+    results = {}
+    for alpha in alphas:
+        if not all(alpha in mesh["coeffs"] for mesh in meshes[:3]):
+            continue
+        results[alpha] = {}
+        for coeff in ["Cl", "Cd"]:
+            result = richardson([mesh["h"] for mesh in meshes[:3]], [mesh["coeffs"][alpha][coeff] for mesh in meshes[:3]])
+            result["errors"] = [abs(mesh["coeffs"][alpha][coeff] - result["phi_ext"]) / abs(result["phi_ext"])
+                                if alpha in mesh["coeffs"] else np.nan for mesh in meshes]
+            results[alpha][coeff] = result
+
+    # Coarsest mesh whose estimated error is below the target for all the alphas and coefficients
+    recommended = None
+    for k in range(len(meshes) - 1, -1, -1):
+        errors = [SAFETY_FACTOR * results[alpha][coeff]["errors"][k] for alpha in results for coeff in results[alpha]]
+        if errors and all(error <= target for error in errors):
+            recommended = k
+            break
+    converged = all(result["convergence"] == "monotonic" for alpha in results for result in results[alpha].values())
+
+    print_report(name, meshes, results, recommended, target, converged)
+    report = {"name": name, "target": target, "meshes": meshes,
+              "richardson": {str(alpha): coeffs for alpha, coeffs in results.items()},
+              "monotonic": converged,
+              "recommended": None if recommended is None else meshes[recommended]}
+    os.makedirs("results", exist_ok=True)
+    with open("results/" + name + "_grid_study.json", 'w') as f:
+        json.dump(report, f, indent=1, default=float)
+    return report
+
+
+# Function to print the results of a grid study
+def print_report(name, meshes, results, recommended, target, converged):
+    print(f"Grid study {name}")
+    print(" ratio     cells  " + "  ".join(f"{'Cl ' + format(alpha, 'g'):>10s} {'Cd ' + format(alpha, 'g'):>10s}" for alpha in results))
+    for mesh in meshes:
+        values = "  ".join(f"{mesh['coeffs'][alpha]['Cl']:10.5f} {mesh['coeffs'][alpha]['Cd']:10.6f}"
+                           if alpha in mesh["coeffs"] else f"{'-':>10s} {'-':>10s}" for alpha in results)
+        print(f"{mesh['ratio']:6g} {mesh['cells']:9d}  {values}")
+    for alpha, coeffs in results.items():
+        for coeff, result in coeffs.items():
+            print(f"alpha {alpha:g} {coeff}: extrapolated {result['phi_ext']:.6g}, order {result['p']:.2f}, "
+                  f"GCI fine {100 * result['gci']:.2f} % ({result['convergence']}), "
+                  f"errors {' '.join('%.2f%%' % (100 * e) for e in result['errors'])}")
+    if not converged:
+        print("Warning: the convergence is not monotonic for all the coefficients, the extrapolation is not reliable")
+    if recommended is None:
+        print(f"No mesh reaches the target error of {100 * target:g} %")
+    else:
+        mesh = meshes[recommended]
+        print(f"Recommended mesh for {100 * target:g} %: ratio {mesh['ratio']:g}, {mesh['cells']} cells, "
+              + " ".join(f"{k}={v:g}" for k, v in mesh["params"].items()))
+
+
+# Command line interface: python src/gridStudy.py study.json
+# The study file gives "name", "ratios", "alphas", optionally the "sample" parameters
+# of the reference mesh, "target", "refine_yh" and the options of designSweep.
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Mesh-resolution study of an LEI airfoil")
+    parser.add_argument("study_file")
+    args = parser.parse_args()
+    with open(args.study_file, 'r') as f:
+        study = json.load(f)
+    run_grid_study(study["name"], study.get("sample", {}), study["ratios"], study["alphas"], study.get("target", 0.01),
+                   study.get("refine_yh", False), study.get("n_workers"), study.get("cores_per_case", 1),
+                   study.get("conv_window", 300), study.get("conv_tol", 1e-3), study.get("storage", "compressed"))
@@ -1,25 +1,59 @@
-import LEIairfoilMesh
-import runOpenFoam
-import numpy as np
-import os
-import csv
-import matplotlib.pyplot as plt
+import polarPipeline
+
+# Inputs of the polar computed when the script is run (python src/main_compute_polars.py), the same pipeline
+# is called from other scripts with polarPipeline.PolarConfig and its functions (see src/polarPipeline.py)
 
 ######  Study case inputs #########
 case_name = 'default-kite'
 Va = 20         # apparent wind 
 L = 1           # true chord of the kite for Re number
+# Several Re numbers in one run instead of the Re of Va and L: the Re numbers whose first cell heights
+# are close share a mesh (see LEIairfoilMesh.reynolds_bands), the polars are stored by Re
+Re_list = None  # e.g. [5e5, 1e6, 2e6]
+yplus = 1       # y+ of the first cell of the boundary layer
+show_plots = True   # False: the polars are saved in results/<case_name>_polars.png (no display, see polarReport.py)
 Depth = 9       # max depth (in % of the chord)
 tube_size = 9   # tube diameter (in % of the chord)
 at = 25         # x-position of the max camber (in % of the chord)
 TE_angle = 7   
-remesh = True   #boolean for recompute mesh
+remesh = False  #boolean for recompute mesh
+use_mesh_cache = True   # reuse the mesh of an identical geometry and mesh parameters
 
 # Range of angle of attack
 min_AOA = 0
 max_AOA = 17
 delta_AOA = 2
-range_AOA = np.arange(min_AOA, max_AOA, delta_AOA)
+# Adaptive angles of attack between min_AOA and max_AOA instead of every delta_AOA: computed by batches
+# where a Gaussian process of Cl and Cd is the most uncertain (near stall), up to max_cases
+adaptive = False
+max_cases = 12
+
+# Parallel run of the angles of attack
+n_workers = None        # number of cases run at once (None: all the cores / cores_per_case)
+cores_per_case = 1      # cores of each case (decomposePar + mpirun when > 1)
+continuation = False    # start each alpha from the converged neighbouring alpha
+# Coarse-to-fine initialisation: each alpha is first solved on the mesh coarsened by this ratio (sizes and
+# first cell height), its fields are mapped on the mesh of the polar as initial condition (None: uniform start)
+coarse_ratio = None     # e.g. 2
+# Solver settings (system/fvSolution): name of a preset tuned by src/solverTuning.py, "auto" for the preset of
+# case_name whose Re band contains the Re of the case, None for the settings of openFoam/Cas_de_base
+solver_preset = None
+# Surface pressure and skin friction of the cases of the polar, extracted in results/surface (see src/surfaceData.py)
+surface_data = False
+
+# Convergence check of the force coefficients
+conv_window = 300       # sliding window in iterations (None: run to endTime)
+conv_tol = 1e-3         # relative band of Cl, Cd and Cm over the window to stop a case
+
+# Storage of the fields of the cases: "ascii" (template), "binary" or "compressed" (binary + gzip, last time only)
+storage = "compressed"
+
+# Mesh-resolution study instead of the polar: the mesh sizes (lc_prof, lc_init) are divided and nb_pts
+# multiplied by each ratio, the coarsest mesh with an error below grid_target is recommended
+grid_study = False
+grid_ratios = [1, 1.5, 2.25]
+grid_alphas = [4, 10]
+grid_target = 0.01      # relative error on Cl and Cd
 #####################################
 
 # Default parameters of LEI airfoil geometry for meshing
@@ -35,119 +69,21 @@ ymax = 30   # half-thickness of the domain
 lc_init = 0.6           # size of the volumes at the boundaries
 lc_prof = lc_init / 150 # size of the volumes around the profile
 
-# Air characteristics
-rho = 1.225
-mu = 1.8e-5
-nu = mu/rho
-
-# Boundary layer parameters
-Re = Va * L / nu    # Reynolds number
-U = Re * nu         # Equivalent speed for the Re with a chord of 1 (used in the simulation)
-# Size of the first cell in the boundary layer
-# yh = bl_parameter.compute_deltay(Re, U, rho, nu)
-yh = 1e-4
-# Theoretical thickness of the boundary layer at the trailing edge
-ep = LEIairfoilMesh.compute_delta_te(Re)
-
-#Mesh of the kite
-if remesh :
-    LEIairfoilMesh.mesh_LEI_airfoil(Corde_length, Depth, tube_size, at, Seam_angle, TE_angle, nb_pts, lc_prof, lc_init, xmax, ymax, ep, yh)
-
-# Create or reset the polar.csv file
-csv_file = 'results/' + case_name + '.csv'
-header = ["Alpha", "Time", "Cm", "Cd", "Cl", "Cl(f)", "Cl(r)"]
-# Check if file exists
-if os.path.exists(csv_file):
-    # If file exists, clear its content but keep the header
-    with open(csv_file, 'r') as file:
-        lines = file.readlines()
-    if len(lines) == 0 or lines[0].strip() != ','.join(header):
-        # File is empty or header is incorrect, rewrite the correct header
-        with open(csv_file, 'w', newline='') as file:
-            writer = csv.writer(file)
-            writer.writerow(header)
-    else:
-        # File has the correct header, clear its content but keep the header
-        with open(csv_file, 'w', newline='') as file:
-            writer = csv.writer(file)
-            writer.writerow(header)
-else:
-    # If file does not exist, create it and write the header
-    with open(csv_file, 'w', newline='') as file:
-        writer = csv.writer(file)
-        writer.writerow(header)
-
-# Create or append the profiles caracteristics of the polar to 'polars_list.txt'
-polars_list_file = 'data/polars_list.txt'
-if not os.path.exists(polars_list_file):
-    with open(polars_list_file, 'w') as file:
-        file.write("##################\n")
-        file.write(csv_file + "\n")
-        file.write("##################\n")
-        file.write(f"Tube size = {tube_size:.2f} %\nDepth = {Depth:.2f} %\nat {at:.2f} % \nTE angle = {TE_angle:.2f} °\nChord = {L:.2f} m\n\n")
-
-else:
-    with open(polars_list_file, 'r') as file:
-        content = file.read()
-    if csv_file not in content:
-        with open(polars_list_file, 'a') as file:
-            file.write("##################\n")
-            file.write(csv_file + "\n")
-            file.write("##################\n")
-            file.write(f"Tube size = {tube_size:.2f} %\nDepth = {Depth:.2f} %\nat {at:.2f} % \nTE angle = {TE_angle:.2f} °\nChord = {L:.2f} m\n\n")
-       
-
-# Computation of the different angles of attack
-for q in range(len(range_AOA)):
-    runOpenFoam.compute_alpha(U, range_AOA[q], csv_file)
-
-# Plotting the polars from polar.csv
-alpha_values = []
-Cl_values = []
-Cd_values = []
-Cm_values = []
-
-with open(csv_file, 'r') as file:
-    reader = csv.DictReader(file)
-    for row in reader:
-        alpha_values.append(float(row['Alpha']))  # Assuming 'Alpha' column is correctly labeled
-        Cl_values.append(float(row['Cl']))
-        Cd_values.append(float(row['Cd']))
-        Cm_values.append(float(row['Cm']))
-
-plt.figure(figsize=(12, 10))
-
-# Plot Cl vs Alpha
-plt.subplot(2, 2, 1)
-plt.plot(alpha_values, Cl_values, 'b-o')
-plt.xlabel('Alpha (degrees)')
-plt.ylabel('Cl')
-plt.title('Cl vs Alpha')
-plt.grid(True)
-
-# Plot Cd vs Alpha
-plt.subplot(2, 2, 2)
-plt.plot(alpha_values, Cd_values, 'r-o')
-plt.xlabel('Alpha (degrees)')
-plt.ylabel('Cd')
-plt.title('Cd vs Alpha')
-plt.grid(True)
-
-# Plot Cm vs Alpha
-plt.subplot(2, 2, 3)
-plt.plot(alpha_values, Cm_values, 'g-o')
-plt.xlabel('Alpha (degrees)')
-plt.ylabel('Cm')
-plt.title('Cm vs Alpha')
-plt.grid(True)
-
-# Plot Cl vs Cd
-plt.subplot(2, 2, 4)
-plt.plot(Cl_values, Cd_values, 'g-o')
-plt.xlabel('Cd')
-plt.ylabel('Cl')
-plt.title('Cl vs Cd')
-plt.grid(True)
 
-plt.tight_layout()
-plt.show()
+if __name__ == "__main__":
+    config = polarPipeline.PolarConfig(
+        case_name=case_name, Va=Va, L=L, Re_list=Re_list, yplus=yplus,
+        Corde_length=Corde_length, Depth=Depth, tube_size=tube_size, at=at, Seam_angle=Seam_angle, TE_angle=TE_angle, nb_pts=nb_pts,
+        xmax=xmax, ymax=ymax, lc_edge=lc_init, lc_prof=lc_prof, remesh=remesh, use_mesh_cache=use_mesh_cache,
+        min_AOA=min_AOA, max_AOA=max_AOA, delta_AOA=delta_AOA, adaptive=adaptive, max_cases=max_cases,
+        n_workers=n_workers, cores_per_case=cores_per_case, continuation=continuation, coarse_ratio=coarse_ratio,
+        solver_preset=solver_preset, surface_data=surface_data, conv_window=conv_window, conv_tol=conv_tol, storage=storage,
+        grid_ratios=grid_ratios, grid_alphas=grid_alphas, grid_target=grid_target)
+    if grid_study :
+        polarPipeline.grid_study(config)
+    else :
+        polars = polarPipeline.solve_polar(config)
+        # Plotting the polars from the polar store, one curve per Re
+        path = polarPipeline.plot(config, polars, show=show_plots)
+        if path is not None :
+            print("Polars written in " + path)
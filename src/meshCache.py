@@ -0,0 +1,172 @@
+import LEIairfoilMesh
+import runOpenFoam
+import argparse
+import fcntl
+import functools
+import hashlib
+import json
+import os
+import shutil
+import time
+
+CACHE_DIR = "data/mesh_cache"
+MAX_SIZE = 20e9     # size of the cache above which the least recently used meshes are removed (bytes)
+NATIVE_EXPORT = True    # write the polyMesh from the gmsh arrays (foamMesh) instead of mesh.msh + gmshToFoam
+
+# Inputs of mesh_LEI_airfoil defining a mesh
+MESH_PARAMETERS = ["Corde_length", "Depth", "tube_size", "at", "Seam_angle", "TE_angle", "nb_pts",
+                   "lc_prof", "lc_edge", "xmax", "ymax", "ep", "yh"]
+
+
+# Function to get the version of gmsh, imported only when a key is computed (loading gmsh is slow)
+@functools.lru_cache(maxsize=1)
+def gmsh_version():
+    import gmsh
+    return gmsh.__version__
+
+
+# Function to compute the key of a mesh from its geometry and mesh parameters and the gmsh version
+def mesh_key(params):
+    content = {name: float(params[name]) for name in MESH_PARAMETERS}
+    content["gmsh"] = gmsh_version()
+    return hashlib.sha1(json.dumps(content, sort_keys=True).encode()).hexdigest()[:16]
+
+
+# Function to read, modify and write the index of the cache under a lock
+# Input:
+#   update - Function modifying the index dictionary {key: entry} in place
+def update_index(update, cache_dir=CACHE_DIR):
+    os.makedirs(cache_dir, exist_ok=True)
+    with open(cache_dir + "/index.lock", 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        index = {}
+        if os.path.exists(cache_dir + "/index.json"):
+            with open(cache_dir + "/index.json", 'r') as f:
+                index = json.load(f)
+        result = update(index)
+        with open(cache_dir + "/index.json.tmp", 'w') as f:
+            json.dump(index, f, indent=1)
+        os.replace(cache_dir + "/index.json.tmp", cache_dir + "/index.json")
+    return result
+
+
+# Function to compute the size of a directory (bytes)
+def dir_size(path):
+    size = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            size = size + os.path.getsize(os.path.join(root, name))
+    return size
+
+
+# Function to get the mesh of a geometry, generated and converted only if it is not in the cache
+# Input:
+#   Parameters of LEIairfoilMesh.mesh_LEI_airfoil
+#   force - Regenerate the mesh even if it is in the cache
+#   n_threads - Threads of gmsh (General.NumThreads, None: gmsh default)
+#   native - Write the polyMesh directly from gmsh (no mesh.msh in the entry), else convert mesh.msh with gmshToFoam
+# Output:
+#   entry_dir - Directory of the mesh: the case entry_dir/constant/polyMesh (and entry_dir/mesh.msh if not native),
+#               entry_dir/mesh_report.json (renumbering and checkMesh, see meshCheck.optimise_mesh)
+#               (to be used as mesh_case of runOpenFoam.compute_alpha)
+def get_mesh(Corde_length, Depth, tube_size, at, Seam_angle, TE_angle, nb_pts, lc_prof, lc_edge, xmax, ymax, ep, yh,
+             force=False, cache_dir=CACHE_DIR, max_size=MAX_SIZE, n_threads=None, native=NATIVE_EXPORT):
+    params = dict(Corde_length=Corde_length, Depth=Depth, tube_size=tube_size, at=at, Seam_angle=Seam_angle,
+                  TE_angle=TE_angle, nb_pts=nb_pts, lc_prof=lc_prof, lc_edge=lc_edge, xmax=xmax, ymax=ymax, ep=ep, yh=yh)
+    key = mesh_key(params)
+    entry_dir = cache_dir + "/" + key
+
+    def touch(index):
+        if key in index and not force:
+            index[key]["last_used"] = time.time()
+            return True
+        return False
+
+    if update_index(touch, cache_dir):
+        print(f"Mesh {key} found in the cache")
+        return entry_dir
+
+    # Cache miss: mesh and convert in a temporary directory, then move it in place
+    tmp_dir = entry_dir + ".tmp" + str(os.getpid())
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    try:
+        if native:
+            LEIairfoilMesh.mesh_LEI_airfoil(Corde_length, Depth, tube_size, at, Seam_angle, TE_angle, nb_pts, lc_prof, lc_edge,
+                                            xmax, ymax, ep, yh, mesh_file=None, n_threads=n_threads, mesh_case=tmp_dir)
+            runOpenFoam.prepare_mesh(None, tmp_dir)
+        else:
+            LEIairfoilMesh.mesh_LEI_airfoil(Corde_length, Depth, tube_size, at, Seam_angle, TE_angle, nb_pts, lc_prof, lc_edge,
+                                            xmax, ymax, ep, yh, mesh_file=tmp_dir + "/mesh.msh", n_threads=n_threads)
+            runOpenFoam.prepare_mesh(tmp_dir + "/mesh.msh", tmp_dir)
+    except RuntimeError:
+        # Mesh rejected by meshCheck: not cached
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+    shutil.rmtree(entry_dir, ignore_errors=True)
+    os.replace(tmp_dir, entry_dir)
+
+    def add(index):
+        now = time.time()
+        index[key] = {"params": {name: float(value) for name, value in params.items()},
+                      "size": dir_size(entry_dir), "created": now, "last_used": now}
+        return evict(index, max_size, cache_dir, keep=key)
+
+    removed = update_index(add, cache_dir)
+    print(f"Mesh {key} added to the cache" + (f", {len(removed)} meshes evicted" if removed else ""))
+    return entry_dir
+
+
+# Function to remove the least recently used meshes until the cache is smaller than max_size
+# Output:
+#   removed - Keys of the removed meshes
+def evict(index, max_size, cache_dir=CACHE_DIR, keep=None):
+    removed = []
+    total = sum(entry["size"] for entry in index.values())
+    for key in sorted(index, key=lambda k: index[k]["last_used"]):
+        if total <= max_size:
+            break
+        if key == keep:
+            continue
+        total = total - index[key]["size"]
+        shutil.rmtree(cache_dir + "/" + key, ignore_errors=True)
+        del index[key]
+        removed.append(key)
+    return removed
+
+
+# Command line interface to list and prune the cache
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Cache of the LEI airfoil meshes")
+    parser.add_argument("--cache-dir", default=CACHE_DIR)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("list", help="list the cached meshes, most recently used first")
+    prune = subparsers.add_parser("prune", help="remove meshes from the cache")
+    prune.add_argument("--max-size", type=float, help="remove the least recently used meshes above this size (GB)")
+    prune.add_argument("--older-than", type=float, help="remove the meshes not used for this number of days")
+    prune.add_argument("--key", nargs="+", default=[], help="remove these meshes")
+    args = parser.parse_args()
+
+    if args.command == "list":
+        index = update_index(lambda index: dict(index), args.cache_dir)
+        for key in sorted(index, key=lambda k: -index[k]["last_used"]):
+            entry = index[key]
+            params = " ".join(f"{name}={value:g}" for name, value in entry["params"].items())
+            print(f"{key}  {entry['size'] / 1e6:8.1f} MB  {time.strftime('%Y-%m-%d %H:%M', time.localtime(entry['last_used']))}  {params}")
+        print(f"{len(index)} meshes, {sum(entry['size'] for entry in index.values()) / 1e6:.1f} MB")
+
+    else:
+        def prune_index(index):
+            removed = []
+            for key in list(index):
+                too_old = args.older_than is not None and time.time() - index[key]["last_used"] > args.older_than * 86400
+                if key in args.key or too_old:
+                    shutil.rmtree(args.cache_dir + "/" + key, ignore_errors=True)
+                    del index[key]
+                    removed.append(key)
+            if args.max_size is not None:
+                removed = removed + evict(index, args.max_size * 1e9, args.cache_dir)
+            return removed
+
+        removed = update_index(prune_index, args.cache_dir)
+        print(f"{len(removed)} meshes removed: {' '.join(removed)}")
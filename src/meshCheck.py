@@ -0,0 +1,180 @@
+import foamDict
+import foamMesh
+import json
+import os
+import re
+import shutil
+import subprocess
+import numpy as np
+
+# Optimisation and check of a converted mesh, once per geometry before its cases are solved
+# (called by runOpenFoam.prepare_mesh): the cells are renumbered to reduce the bandwidth of the
+# matrices, checkMesh is run and parsed, and the bad meshes are rejected before using solver hours.
+RENUMBER = "python"     # renumbering of the cells: "python" (Reverse Cuthill-McKee of foamMesh.rcm), "renumberMesh" or None
+CHECK = True            # run checkMesh on the meshes
+ON_BAD_MESH = "reject"  # "reject": raise an error, "flag": keep the mesh, flagged in its report
+REPORT_FILE = "mesh_report.json"    # written in the mesh case
+# Limits of the checkMesh metrics of a good mesh
+MAX_LIMITS = {"max_non_orthogonality": 70, "max_skewness": 4}
+MIN_LIMITS = {"min_volume": 0, "min_face_area": 0}      # exclusive
+# Failed checks (lines *** of checkMesh) that do not make a mesh bad: the boundary layer cells are stretched
+ALLOWED_ERRORS = ["aspect ratio"]
+
+NUMBER = r'([-+]?\d+(?:\.\d*)?(?:[eE][-+]?\d+)?)'
+CHECK_METRICS = {
+    "points": r'^\s*points:\s+' + NUMBER,
+    "faces": r'^\s*faces:\s+' + NUMBER,
+    "internal_faces": r'^\s*internal faces:\s+' + NUMBER,
+    "cells": r'^\s*cells:\s+' + NUMBER,
+    "max_aspect_ratio": r'Max aspect ratio\s*[=:]\s*' + NUMBER,
+    "min_face_area": r'Minimum face area = ' + NUMBER,
+    "max_face_area": r'Maximum face area = ' + NUMBER,
+    "min_volume": r'Min volume = ' + NUMBER,
+    "max_volume": r'Max volume = ' + NUMBER,
+    "total_volume": r'Total volume = ' + NUMBER,
+    "max_non_orthogonality": r'non-orthogonality Max: ' + NUMBER,
+    "average_non_orthogonality": r'non-orthogonality Max: \S+ average: ' + NUMBER,
+    "max_skewness": r'Max skewness = ' + NUMBER,
+    "failed_checks": r'Failed ' + NUMBER + ' mesh checks',
+}
+RENUMBER_LOG = re.compile(r'(Before|After) renumbering\s*:\s*band\s*:\s*' + NUMBER + r'\s*profile\s*:\s*' + NUMBER)
+
+
+# Function to renumber the cells of a mesh
+# Input:
+#   mesh_case - Case directory of the mesh
+#   method - "python" or "renumberMesh"
+# Output:
+#   renumbering - Dictionary: method, band and profile of the matrix before and after (None if not reported)
+def renumber(mesh_case, method=RENUMBER):
+    if method == "renumberMesh":
+        subprocess.run(['renumberMesh -overwrite > log.renumberMesh 2>&1'], shell=True, cwd=mesh_case)
+        renumbering = {"method": method, "band_before": None, "profile_before": None,
+                       "band_after": None, "profile_after": None}
+        with open(mesh_case + "/log.renumberMesh", 'r') as f:
+            for when, band, profile in RENUMBER_LOG.findall(f.read()):
+                renumbering["band_" + when.lower()] = int(float(band))
+                renumbering["profile_" + when.lower()] = int(float(profile))
+        return renumbering
+    if method != "python":
+        raise ValueError(f"Unknown renumbering method {method}")
+
+    mesh = foamMesh.read(mesh_case)
+    n_internal = len(mesh["neighbour"])
+    band, profile = foamMesh.bandwidth(mesh["owner"][:n_internal], mesh["neighbour"], mesh["n_cells"])
+    renumbered, cell_map = foamMesh.renumber(mesh, foamMesh.rcm(mesh["owner"][:n_internal], mesh["neighbour"], mesh["n_cells"]))
+    band_after, profile_after = foamMesh.bandwidth(renumbered["owner"][:n_internal], renumbered["neighbour"], mesh["n_cells"])
+    renumbering = {"method": method, "band_before": band, "profile_before": profile,
+                   "band_after": band, "profile_after": profile}
+    if profile_after < profile:
+        foamMesh.write(renumbered, mesh_case, boundary=False)
+        renumber_zones(mesh_case, cell_map)
+        renumbering.update(band_after=band_after, profile_after=profile_after)
+    return renumbering
+
+
+# Function to apply a renumbering to the cell zones of a mesh (ascii cellZones of gmshToFoam),
+# the cell sets written by checkMesh are removed
+def renumber_zones(mesh_case, cell_map):
+    directory = mesh_case + "/constant/polyMesh"
+    shutil.rmtree(directory + "/sets", ignore_errors=True)
+    if not os.path.exists(directory + "/cellZones"):
+        return
+    zones_file = foamDict.read(directory + "/cellZones")
+    if zones_file["FoamFile"]["format"] != "ascii":
+        raise ValueError(f"{directory}/cellZones: only ascii cell zones can be renumbered")
+    zones = foamDict.patches(zones_file)
+    for name in zones.keys():
+        labels = zones[name]["cellLabels"]
+        if labels.startswith("List<label>"):
+            values = np.array(labels[labels.index("(") + 1:labels.rindex(")")].split(), dtype=np.int64)
+            values = np.sort(cell_map[values])
+            zones[name]["cellLabels"] = (f"List<label> \n{len(values)}\n(\n" + "\n".join(values.astype(str)) + "\n)")
+    foamDict.write(zones_file, directory + "/cellZones")
+
+
+# Function to run checkMesh on a mesh
+# Output:
+#   quality - Dictionary of parse_check_mesh
+def check_mesh(mesh_case):
+    subprocess.run(['checkMesh > log.checkMesh 2>&1'], shell=True, cwd=mesh_case)
+    with open(mesh_case + "/log.checkMesh", 'r') as f:
+        return parse_check_mesh(f.read())
+
+
+# Function to parse the output of checkMesh
+# Output:
+#   quality - Dictionary: sizes of the mesh, metrics (keys of CHECK_METRICS, absent if not reported),
+#             errors (failed checks, lines ***) and ok (None if checkMesh did not conclude)
+def parse_check_mesh(text):
+    quality = {}
+    for name, pattern in CHECK_METRICS.items():
+        match = re.search(pattern, text, re.MULTILINE)
+        if match is not None:
+            value = float(match.group(1))
+            quality[name] = int(value) if name in ["points", "faces", "internal_faces", "cells", "failed_checks"] else value
+    quality["errors"] = [line.strip().lstrip('*') for line in text.splitlines() if line.strip().startswith('***')]
+    if "Mesh OK." in text:
+        quality["failed_checks"] = 0
+    quality["ok"] = None if "failed_checks" not in quality else quality["failed_checks"] == 0
+    return quality
+
+
+# Function to list the problems of a mesh from its checkMesh metrics
+# Output:
+#   problems - List of descriptions, empty for a good mesh
+def mesh_problems(quality):
+    problems = []
+    for name, limit in MAX_LIMITS.items():
+        if quality.get(name, -np.inf) > limit:
+            problems.append(f"{name} {quality[name]:g} > {limit:g}")
+    for name, limit in MIN_LIMITS.items():
+        if quality.get(name, np.inf) <= limit:
+            problems.append(f"{name} {quality[name]:g} <= {limit:g}")
+    for error in quality.get("errors", []):
+        if not any(allowed in error.lower() for allowed in ALLOWED_ERRORS):
+            problems.append(error)
+    return problems
+
+
+# Function to renumber and check a converted mesh, report in mesh_case/mesh_report.json
+# Input:
+#   mesh_case - Case directory of the mesh
+#   renumbering - Method of renumber, None to keep the numbering of the conversion
+#   check - Run checkMesh
+#   on_bad_mesh - "reject" to raise a RuntimeError on a bad mesh, "flag" to only report it
+# Output:
+#   report - Dictionary: renumbering, quality (see parse_check_mesh), problems and verdict (good, bad or unchecked)
+def optimise_mesh(mesh_case, renumbering=RENUMBER, check=CHECK, on_bad_mesh=ON_BAD_MESH):
+    report = {"renumbering": None if renumbering is None else renumber(mesh_case, renumbering),
+              "quality": None, "problems": [], "verdict": "unchecked"}
+    if check:
+        quality = check_mesh(mesh_case)
+        report["quality"] = quality
+        report["problems"] = mesh_problems(quality)
+        if report["problems"]:
+            report["verdict"] = "bad"
+        elif "cells" in quality:    # checkMesh ran
+            report["verdict"] = "good"
+    with open(mesh_case + "/" + REPORT_FILE, 'w') as f:
+        json.dump(report, f, indent=1)
+    print_report(mesh_case, report)
+    if report["verdict"] == "bad" and on_bad_mesh == "reject":
+        raise RuntimeError(f"Bad mesh {mesh_case}: " + "; ".join(report["problems"]))
+    return report
+
+
+# Function to print the report of optimise_mesh
+def print_report(mesh_case, report):
+    renumbering = report["renumbering"]
+    if renumbering is not None and renumbering["band_before"] is not None:
+        print(f"Mesh {mesh_case} renumbered ({renumbering['method']}): band {renumbering['band_before']} -> "
+              f"{renumbering['band_after']}, profile {renumbering['profile_before']:.3g} -> {renumbering['profile_after']:.3g}")
+    quality = report["quality"]
+    if quality is not None and "cells" in quality:
+        print(f"Mesh {mesh_case}: {quality['cells']} cells, non-orthogonality max "
+              f"{quality.get('max_non_orthogonality', np.nan):.1f} average {quality.get('average_non_orthogonality', np.nan):.1f}, "
+              f"skewness max {quality.get('max_skewness', np.nan):.2f}, aspect ratio max {quality.get('max_aspect_ratio', np.nan):.3g}, "
+              f"min volume {quality.get('min_volume', np.nan):.3g}: {report['verdict']}")
+    for problem in report["problems"]:
+        print(f"    {problem}")
@@ -0,0 +1,287 @@
+import argparse
+import dataclasses
+import json
+import os
+import sys
+from dataclasses import dataclass, field
+from typing import Optional
+
+# Pipeline of main_compute_polars as functions of a configuration, to be called from other scripts:
+#   config = polarPipeline.PolarConfig(case_name="deep-kite", Depth=13, Re_list=[5e5, 1e6])
+#   polars = polarPipeline.solve_polar(config)
+#   polarPipeline.plot(config, polars)
+# Only the standard library is imported with this module: the modules of a stage (NumPy, and gmsh or
+# matplotlib through them) are imported when the stage runs (see benchmark.py startup).
+
+rho = 1.225
+mu = 1.8e-5
+nu = mu / rho
+
+
+# Inputs of a polar (see main_compute_polars for their description)
+@dataclass
+class PolarConfig:
+    case_name: str = "default-kite"
+    Va: float = 20                      # apparent wind (m/s)
+    L: float = 1                        # true chord of the kite for the Re number (m)
+    Re_list: Optional[list] = None      # several Re numbers instead of the Re of Va and L
+    yplus: float = 1
+
+    # Geometry (in % of the chord for Depth, tube_size and at)
+    Corde_length: float = 1
+    Depth: float = 9
+    tube_size: float = 9
+    at: float = 25
+    Seam_angle: float = 35
+    TE_angle: float = 7
+    nb_pts: int = 100
+
+    # Fluid domain and mesh
+    xmax: float = 40
+    ymax: float = 30
+    lc_edge: float = 0.6
+    lc_prof: float = 0.6 / 150
+    remesh: bool = False
+    use_mesh_cache: bool = True
+
+    # Angles of attack (degrees)
+    min_AOA: float = 0
+    max_AOA: float = 17
+    delta_AOA: float = 2
+    adaptive: bool = False
+    max_cases: int = 12
+
+    # Solve
+    n_workers: Optional[int] = None
+    cores_per_case: int = 1
+    continuation: bool = False
+    coarse_ratio: Optional[float] = None
+    solver_preset: Optional[str] = None
+    surface_data: bool = False
+    conv_window: Optional[int] = 300
+    conv_tol: float = 1e-3
+    storage: str = "compressed"
+
+    # Mesh-resolution study (see grid_study)
+    grid_ratios: list = field(default_factory=lambda: [1, 1.5, 2.25])
+    grid_alphas: list = field(default_factory=lambda: [4, 10])
+    grid_target: float = 0.01
+
+    # Function to build a configuration from a dictionary (e.g. a json file), rejecting the unknown inputs
+    @classmethod
+    def from_dict(cls, values):
+        names = {f.name for f in dataclasses.fields(cls)}
+        unknown = sorted(set(values) - names)
+        if unknown:
+            raise ValueError(f"unknown inputs of the polar: {', '.join(unknown)}")
+        return cls(**values)
+
+    @property
+    def Re(self):
+        return self.Va * self.L / nu
+
+    # Angles of attack of the polar (min_AOA included, max_AOA excluded)
+    def alphas(self):
+        import numpy as np
+        return np.arange(self.min_AOA, self.max_AOA, self.delta_AOA)
+
+    # Geometry and mesh sizes of designSweep (without the boundary layer, which follows the Re)
+    def sample(self):
+        names = ["Corde_length", "Depth", "tube_size", "at", "Seam_angle", "TE_angle", "nb_pts",
+                 "lc_prof", "lc_edge", "xmax", "ymax", "L"]
+        return {name: getattr(self, name) for name in names}
+
+    # Geometry, mesh and flow parameters at the Re of Va and L (see polarStore.record)
+    def params(self):
+        import LEIairfoilMesh
+        U = LEIairfoilMesh.computeU_eq(self.Re, nu)
+        yh = float(LEIairfoilMesh.compute_deltay(self.Re, U, rho, nu, self.yplus))
+        return dict(self.sample(), ep=LEIairfoilMesh.compute_delta_te(self.Re), yh=yh, Va=self.Va, Re=self.Re, U=U)
+
+    # Parameters of each Re of the polar: the Re of Va and L, or the Re numbers of Re_list with the
+    # boundary layer of their Re band (see designSweep.reynolds_params)
+    def reynolds_params(self):
+        if self.Re_list is None:
+            return [self.params()]
+        import designSweep
+        return designSweep.reynolds_params(self.sample(), self.Re_list, self.yplus)
+
+
+# Function to mesh the geometry at the Re of Va and L and convert it to OpenFoam
+# Output:
+#   mesh_case - Directory of the OpenFoam mesh (in the mesh cache with use_mesh_cache)
+def mesh(config):
+    import meshCache
+    params = config.params()
+    if config.use_mesh_cache:
+        # Mesh and conversion reused from the cache for the same geometry and mesh parameters
+        return meshCache.get_mesh(*[params[name] for name in meshCache.MESH_PARAMETERS], force=config.remesh)
+    import LEIairfoilMesh
+    import runOpenFoam
+    mesh_case = 'openFoam/mesh'
+    if config.remesh:
+        LEIairfoilMesh.mesh_LEI_airfoil(*[params[name] for name in meshCache.MESH_PARAMETERS])
+    # Conversion of the mesh to OpenFoam, shared by all the angles of attack
+    if config.remesh or not os.path.exists(mesh_case + '/constant/polyMesh'):
+        runOpenFoam.prepare_mesh('data/mesh.msh', mesh_case)
+    return mesh_case
+
+
+# Function to run the mesh-resolution study of the geometry (see gridStudy.run_grid_study)
+def grid_study(config):
+    import gridStudy
+    sample = {name: value for name, value in config.params().items() if name not in ["Re", "U"]}
+    return gridStudy.run_grid_study(config.case_name + '-grid', sample, config.grid_ratios, config.grid_alphas,
+                                    config.grid_target, n_workers=config.n_workers, cores_per_case=config.cores_per_case,
+                                    conv_window=config.conv_window, conv_tol=config.conv_tol, storage=config.storage)
+
+
+# Function to compute the polar of the geometry, stored in the polar store
+# With Re_list, the Re bands are meshed and solved by designSweep (journal results/<case_name>_journal.json).
+# Output:
+#   polars - Polars of the geometry read from the store, one per Re, by increasing alpha (see load_polars)
+def solve_polar(config):
+    import caseManager
+    import polarStore
+    if config.Re_list is not None:
+        import designSweep
+        designSweep.run_design_sweep(config.case_name, [config.sample()], config.alphas().tolist(), config.n_workers,
+                                     config.cores_per_case, config.conv_window, config.conv_tol, config.storage,
+                                     reynolds=config.Re_list, yplus=config.yplus, solver_preset=config.solver_preset)
+    else:
+        import runOpenFoam
+        mesh_case = mesh(config)
+        params = config.params()
+        case_root = caseManager.case_root(params)
+        solver = runOpenFoam.find_solver_preset(config.case_name, params["Re"]) if config.solver_preset == "auto" else config.solver_preset
+        coarse_mesh_case = None
+        if config.coarse_ratio is not None:
+            import gridStudy
+            coarse_mesh_case = gridStudy.coarse_mesh(params, config.coarse_ratio)
+
+        if config.adaptive:
+            import surrogate
+            # The angles already in the store for this geometry are used by the model
+            known = polarStore.query(polarStore.load(), geometry_hash=polarStore.geometry_hash(params), Re=params["Re"])
+            known = [[row['Alpha'], row['Iterations'], row['Cm'], row['Cd'], row['Cl'], row['Cl_f'], row['Cl_r']] for row in known]
+            rows, timings, seeds = surrogate.adaptive_polar(params["U"], (config.min_AOA, config.max_AOA), max_cases=config.max_cases,
+                                                            batch=config.n_workers, known=known, cores_per_case=config.cores_per_case,
+                                                            conv_window=config.conv_window, conv_tol=config.conv_tol,
+                                                            mesh_case=mesh_case, storage=config.storage, case_root=case_root,
+                                                            coarse_mesh_case=coarse_mesh_case, solver=solver)
+        else:
+            import sweepScheduler
+            rows, timings, seeds = sweepScheduler.run_sweep(params["U"], config.alphas(), None, config.n_workers, config.cores_per_case,
+                                                            config.continuation, config.conv_window, config.conv_tol, mesh_case,
+                                                            config.storage, case_root, coarse_mesh_case, solver)
+
+        # Store the polar with the geometry and mesh parameters of the case
+        polarStore.append([polarStore.record(params, rows[q], timings[q], config.case_name, seeds[q]) for q in range(len(rows))])
+
+    if config.surface_data:
+        import glob
+        import surfaceData
+        case_dirs = sorted(set(case_dir.removesuffix(".tar.gz").removesuffix(".tar") for params in config.reynolds_params()
+                               for case_dir in glob.glob(caseManager.case_root(params) + "/AOA_*")))
+        surfaceData.extract(case_dirs, config.n_workers)
+    return load_polars(config)
+
+
+# Function to read the polars of the geometry from the polar store
+# Output:
+#   polars - Structured arrays of polarStore, one per Re (see PolarConfig.reynolds_params), by increasing alpha
+def load_polars(config):
+    import numpy as np
+    import polarStore
+    store = polarStore.load()
+    polars = [polarStore.query(store, geometry_hash=polarStore.geometry_hash(params), Re=params["Re"])
+              for params in config.reynolds_params()]
+    return [polar[np.argsort(polar['Alpha'])] for polar in polars]
+
+
+# Function to plot the polars of the geometry, one curve per Re
+# Input:
+#   polars - Polars of solve_polar (default: read from the store with load_polars)
+#   output - Path of the figures without extension (default results/<case_name>_polars, see polarReport.render_figure)
+#   show - Display the figure in a window (blocking) instead of writing it
+# Output:
+#   path - Path of the figures, None when shown
+def plot(config, polars=None, output=None, show=False):
+    import polarReport
+    if polars is None:
+        polars = load_polars(config)
+    labels = [f"Re = {polar['Re'][0]:.3g}" if len(polar) else "" for polar in polars]
+    if show:
+        import matplotlib.pyplot as plt
+        polarReport.plot_polars(polars, labels, plt.figure(figsize=(12, 10)))
+        plt.tight_layout()
+        plt.show()
+        return None
+    return polarReport.render_figure(output or 'results/' + config.case_name + '_polars', polars, labels)
+
+
+# Function to read the configuration of the command line: json file then name=value inputs
+def parse_config(config_file, inputs):
+    values = {}
+    if config_file is not None:
+        with open(config_file, 'r') as f:
+            values = json.load(f)
+    for text in inputs:
+        name, _, value = text.partition("=")
+        try:
+            values[name] = json.loads(value)
+        except json.JSONDecodeError:
+            # Strings without quotes (case_name=deep-kite)
+            values[name] = value
+    return PolarConfig.from_dict(values)
+
+
+# Command line interface:
+#   python src/polarPipeline.py mesh [config.json] [--set Depth=13 ...]
+#   python src/polarPipeline.py solve [config.json] [--set ...] [--plot] [--show]
+#   python src/polarPipeline.py plot [config.json] [--set ...] [--output path] [--show]
+#   python src/polarPipeline.py grid [config.json] [--set ...]
+#   python src/polarPipeline.py config [config.json] [--set ...]     # print the inputs and derived parameters
+# The config file gives the inputs of PolarConfig, the others keep their default.
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Mesh, solve and plot the polar of an LEI airfoil")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    commands = {
+        "mesh": "mesh the geometry and convert it to OpenFoam",
+        "solve": "compute the polar and store it in the polar store",
+        "plot": "plot the polars of the geometry from the polar store",
+        "grid": "run a mesh-resolution study of the geometry",
+        "config": "print the inputs and the derived parameters",
+    }
+    for command, description in commands.items():
+        subparser = subparsers.add_parser(command, help=description)
+        subparser.add_argument("config_file", nargs="?")
+        subparser.add_argument("--set", nargs="+", default=[], metavar="NAME=VALUE", help="inputs overriding the config file")
+        if command in ["solve", "plot"]:
+            subparser.add_argument("--output", help="path of the figures without extension")
+            subparser.add_argument("--show", action="store_true", help="display the figure instead of writing it")
+        if command == "solve":
+            subparser.add_argument("--plot", action="store_true", help="plot the polars once solved")
+    args = parser.parse_args()
+    try:
+        config = parse_config(args.config_file, args.set)
+    except (TypeError, ValueError) as error:
+        parser.error(str(error))
+
+    if args.command == "mesh":
+        print(mesh(config))
+    elif args.command == "solve":
+        polars = solve_polar(config)
+        if args.plot or args.show:
+            path = plot(config, polars, args.output, args.show)
+            if path is not None:
+                print("Polars written in " + path)
+    elif args.command == "plot":
+        path = plot(config, output=args.output, show=args.show)
+        if path is not None:
+            print("Polars written in " + path)
+    elif args.command == "grid":
+        grid_study(config)
+    else:
+        json.dump({"inputs": dataclasses.asdict(config), "params": config.params()}, sys.stdout, indent=1, default=float)
+        print()
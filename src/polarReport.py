@@ -0,0 +1,229 @@
+import polarStore
+import argparse
+import csv
+import html
+import os
+import time
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor, wait
+
+# Report of the polars of the store: metrics of each polar, comparison figures rendered with Agg
+# in worker processes (no display needed) and an index.html with the table of the metrics.
+REPORT_DIR = "results/report"
+FORMATS = ["png"]               # formats of the figures (png, svg, pdf)
+POLARS_PER_FIGURE = 8           # polars compared on each figure
+METRICS = ["Cl_max", "alpha_stall", "LD_max", "alpha_LD_max", "Cd_min"]
+# Styles of the polars: 10 colors, then the next marker
+COLORS = ['#1f77b4', '#ff7f0e', '#2ca02c', '#d62728', '#9467bd', '#8c564b', '#e377c2', '#7f7f7f', '#bcbd22', '#17becf']
+MARKERS = ['o', 's', '^', 'v', 'D', 'P', 'X', '*']
+COLUMNS = ["geometry_hash", "case_name", "Re", "Alpha", "Cl", "Cd", "Cm"] + polarStore.GEOMETRY_COLUMNS
+SUMMARY_DTYPE = np.dtype([(name, polarStore.DTYPE[name]) for name in ["geometry_hash", "case_name", "Re"] + polarStore.GEOMETRY_COLUMNS]
+                         + [("n_alpha", "i8"), ("alpha_min", "f8"), ("alpha_max", "f8")] + [(name, "f8") for name in METRICS])
+
+
+# Function to compute the metrics of the polars of the store (vectorised over all the rows)
+# Input:
+#   data - Structured array of polarStore.load (with the COLUMNS)
+# Output:
+#   summary - Structured array (SUMMARY_DTYPE), one row per polar in the order of polarStore.polars:
+#             Cl_max, alpha_stall (alpha of Cl_max, nan if Cl_max is at the largest alpha: stall not reached),
+#             LD_max and alpha_LD_max (maximum lift to drag ratio), Cd_min
+def polar_metrics(data):
+    data = data[np.lexsort((data["Alpha"], data["Re"], data["geometry_hash"]))]
+    summary = np.zeros(0, dtype=SUMMARY_DTYPE)
+    if len(data) == 0:
+        return summary
+    new = (data["geometry_hash"] != np.roll(data["geometry_hash"], 1)) | (data["Re"] != np.roll(data["Re"], 1))
+    new[0] = True
+    starts = np.flatnonzero(new)
+    ends = np.append(starts[1:], len(data)) - 1
+    group = np.cumsum(new) - 1
+
+    summary = np.zeros(len(starts), dtype=SUMMARY_DTYPE)
+    for name in ["geometry_hash", "case_name", "Re"] + polarStore.GEOMETRY_COLUMNS:
+        summary[name] = data[name][starts]
+    summary["n_alpha"] = ends - starts + 1
+    summary["alpha_min"] = data["Alpha"][starts]
+    summary["alpha_max"] = data["Alpha"][ends]
+    # Sorted by polar then by decreasing value: the first row of each polar is its maximum
+    best_cl = np.lexsort((-data["Cl"], group))[starts]
+    summary["Cl_max"] = data["Cl"][best_cl]
+    summary["alpha_stall"] = np.where(best_cl < ends, data["Alpha"][best_cl], np.nan)
+    lift_drag = data["Cl"] / data["Cd"]
+    best_ld = np.lexsort((-lift_drag, group))[starts]
+    summary["LD_max"] = lift_drag[best_ld]
+    summary["alpha_LD_max"] = data["Alpha"][best_ld]
+    summary["Cd_min"] = np.minimum.reduceat(data["Cd"], starts)
+    return summary
+
+
+# Function to get the color and marker of the i-th polar of a figure
+def style(i):
+    return COLORS[i % len(COLORS)], MARKERS[(i // len(COLORS)) % len(MARKERS)]
+
+
+# Function to plot polars on a figure: Cl, Cd and Cm vs alpha and Cl vs Cd
+# Input:
+#   polars - List of structured arrays sorted by alpha (Alpha, Cl, Cd, Cm)
+#   labels - Label of each polar
+#   figure - matplotlib figure (plt.figure() or matplotlib.figure.Figure)
+def plot_polars(polars, labels, figure):
+    axes = [figure.add_subplot(2, 2, k + 1) for k in range(4)]
+    for i, (polar, label) in enumerate(zip(polars, labels)):
+        color, marker = style(i)
+        for ax, (x, y) in zip(axes, [("Alpha", "Cl"), ("Alpha", "Cd"), ("Alpha", "Cm"), ("Cd", "Cl")]):
+            ax.plot(polar[x], polar[y], color=color, marker=marker, linestyle='-', label=label)
+    for ax, (xlabel, ylabel, title) in zip(axes, [('Alpha (degrees)', 'Cl', 'Cl vs Alpha'), ('Alpha (degrees)', 'Cd', 'Cd vs Alpha'),
+                                                  ('Alpha (degrees)', 'Cm', 'Cm vs Alpha'), ('Cd', 'Cl', 'Cl vs Cd')]):
+        ax.set_xlabel(xlabel)
+        ax.set_ylabel(ylabel)
+        ax.set_title(title)
+        ax.grid(True)
+        ax.legend(fontsize='small')
+    return axes
+
+
+# Function to render polars in files with the Agg backend (run by the workers, no display)
+# Input:
+#   path - Path of the figure without extension, one file per format
+def render_figure(path, polars, labels, formats=FORMATS):
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+    figure = Figure(figsize=(12, 10))
+    FigureCanvasAgg(figure)
+    plot_polars(polars, labels, figure)
+    figure.tight_layout()
+    for extension in formats:
+        figure.savefig(path + "." + extension)
+    return path
+
+
+# Function to render the metrics of the polars against the geometry parameters that vary, colored by Re
+def render_metrics(path, summary, parameters, formats=FORMATS):
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+    parameters = parameters or ["Re"]
+    figure = Figure(figsize=(4 * len(parameters) + 1, 3 * len(METRICS)), layout='constrained')
+    FigureCanvasAgg(figure)
+    for row, metric in enumerate(METRICS):
+        for col, parameter in enumerate(parameters):
+            ax = figure.add_subplot(len(METRICS), len(parameters), row * len(parameters) + col + 1)
+            points = ax.scatter(summary[parameter], summary[metric], c=np.log10(summary["Re"]), cmap='viridis', s=15)
+            ax.set_xlabel(parameter)
+            ax.set_ylabel(metric)
+            ax.grid(True)
+    figure.colorbar(points, ax=figure.axes, label='log10(Re)')
+    for extension in formats:
+        figure.savefig(path + "." + extension)
+    return path
+
+
+# Function to parse a filter of the command line: name=value, name=min:max (open ends allowed) or name=a,b,c
+def parse_condition(text):
+    name, value = text.split("=", 1)
+
+    def number(item, default=None):
+        if item == "" and default is not None:
+            return default
+        try:
+            return float(item)
+        except ValueError:
+            return item
+
+    if ":" in value:
+        low, high = value.split(":", 1)
+        return name, (number(low, -np.inf), number(high, np.inf))
+    if "," in value:
+        return name, [number(item) for item in value.split(",")]
+    return name, number(value)
+
+
+# Function to generate the report of the polars of the store
+# Input:
+#   output - Directory of the report (index.html, summary.csv and the figures)
+#   conditions - Filters on the columns of the store (see polarStore.query), e.g. {"Depth": (8, 10)}
+#   metric_conditions - Filters on the metrics of the polars, e.g. {"Cl_max": (1.2, np.inf)}
+#   sort - Metric by which the polars are sorted (decreasing), None for the store order
+#   formats - Formats of the figures
+#   per_figure - Number of polars compared on each figure
+#   n_workers - Worker processes rendering the figures (default: all the cores)
+# Output:
+#   summary - Metrics of the polars of the report
+def generate_report(output=REPORT_DIR, conditions=None, metric_conditions=None, sort=None, formats=FORMATS,
+                    per_figure=POLARS_PER_FIGURE, n_workers=None, store_dir=polarStore.STORE_DIR):
+    start = time.perf_counter()
+    data = polarStore.query(polarStore.load(store_dir, columns=COLUMNS), **(conditions or {}))
+    summary = polar_metrics(data)
+    polars = polarStore.polars(data) if len(summary) > 0 else []
+    order = np.flatnonzero(polarStore.mask(summary, **(metric_conditions or {})))
+    if sort is not None:
+        order = order[np.argsort(-summary[sort][order], kind='stable')]
+    summary = summary[order]
+    polars = [polars[k] for k in order]
+
+    # Labels: case name, geometry parameters that vary and Re
+    varied = [name for name in polarStore.GEOMETRY_COLUMNS if len(np.unique(summary[name])) > 1]
+    labels = [f"{row['case_name']} " + " ".join(f"{name}={row[name]:g}" for name in varied) + f" Re={row['Re']:.3g}"
+              for row in summary]
+
+    os.makedirs(output, exist_ok=True)
+    pages = [(output + f"/polars-{k // per_figure + 1:03d}", polars[k:k + per_figure], labels[k:k + per_figure])
+             for k in range(0, len(polars), per_figure)]
+    with ProcessPoolExecutor(max_workers=n_workers) as pool:
+        futures = [pool.submit(render_figure, path, page_polars, page_labels, formats) for path, page_polars, page_labels in pages]
+        if len(summary) > 0:
+            futures.append(pool.submit(render_metrics, output + "/metrics", summary, varied + (["Re"] if len(np.unique(summary["Re"])) > 1 else []), formats))
+        wait(futures)
+        figures = [future.result() for future in futures]
+
+    write_summary(output + "/summary.csv", summary, labels)
+    write_html(output + "/index.html", summary, labels, figures, formats, per_figure)
+    print(f"Report of {len(summary)} polars in {output}/index.html ({len(figures)} figures, {time.perf_counter() - start:.1f} s)")
+    return summary
+
+
+# Function to write the metrics of the polars in a csv file
+def write_summary(path, summary, labels):
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(["label"] + list(SUMMARY_DTYPE.names))
+        for label, row in zip(labels, summary):
+            writer.writerow([label] + [row[name] for name in SUMMARY_DTYPE.names])
+
+
+# Function to write the html page of the report: table of the metrics and figures
+def write_html(path, summary, labels, figures, formats, per_figure):
+    extension = "svg" if "svg" in formats else formats[0]
+    columns = ["case_name", "Re"] + polarStore.GEOMETRY_COLUMNS + ["n_alpha"] + METRICS
+    rows = []
+    for k, row in enumerate(summary):
+        cells = [html.escape(str(row[name])) if name == "case_name" else f"{row[name]:.4g}" for name in columns]
+        rows.append(f"<tr><td>{k // per_figure + 1}</td><td>{html.escape(labels[k])}</td>" + "".join(f"<td>{cell}</td>" for cell in cells) + "</tr>")
+    images = "\n".join(f'<h2>{os.path.basename(figure)}</h2>\n<img src="{os.path.basename(figure)}.{extension}" style="max-width:100%">'
+                       for figure in figures)
+    with open(path, 'w') as f:
+        f.write("<!DOCTYPE html>\n<html><head><meta charset=\"utf-8\"><title>Polar report</title>\n"
+                "<style>table{border-collapse:collapse;font-size:small}td,th{border:1px solid #ccc;padding:2px 6px;text-align:right}</style>\n"
+                f"</head><body>\n<h1>Polar report</h1>\n<p>{len(summary)} polars, {time.strftime('%Y-%m-%d %H:%M')}</p>\n"
+                "<table>\n<tr><th>figure</th><th>label</th>" + "".join(f"<th>{name}</th>" for name in columns) + "</tr>\n"
+                + "\n".join(rows) + "\n</table>\n" + images + "\n</body></html>\n")
+
+
+# Command line interface:
+#   python src/polarReport.py [--output results/report] [--where Depth=8:10 --where case_name=tube-depth]
+#                             [--where Cl_max=1.2:] [--sort LD_max] [--formats png svg] [--per-figure 8] [--workers 8]
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Report of the polars of the polar store")
+    parser.add_argument("--output", default=REPORT_DIR)
+    parser.add_argument("--store-dir", default=polarStore.STORE_DIR)
+    parser.add_argument("--where", action="append", default=[],
+                        help="filter on a column of the store or a metric: name=value, name=min:max or name=a,b")
+    parser.add_argument("--sort", choices=METRICS, default=None)
+    parser.add_argument("--formats", nargs="+", default=FORMATS)
+    parser.add_argument("--per-figure", type=int, default=POLARS_PER_FIGURE)
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args()
+    conditions = dict(parse_condition(text) for text in args.where)
+    metric_conditions = {name: conditions.pop(name) for name in list(conditions) if name in METRICS}
+    generate_report(args.output, conditions, metric_conditions, args.sort, args.formats, args.per_figure, args.workers,
+                    args.store_dir)
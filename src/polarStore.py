@@ -0,0 +1,208 @@
+import numpy as np
+import argparse
+import glob
+import hashlib
+import json
+import os
+import time
+
+STORE_DIR = "results/polars"
+
+# Columns of the store: one row per (geometry hash, alpha, Re)
+GEOMETRY_COLUMNS = ["Corde_length", "Depth", "tube_size", "at", "Seam_angle", "TE_angle"]
+MESH_COLUMNS = ["nb_pts", "lc_prof", "lc_edge", "xmax", "ymax", "ep", "yh"]
+COLUMNS = ([("geometry_hash", "U16"), ("case_name", "U64"), ("Re", "f8"), ("Alpha", "f8")]
+           + [(name, "f8") for name in GEOMETRY_COLUMNS + MESH_COLUMNS]
+           + [("Va", "f8"), ("L", "f8"),
+              ("Cl", "f8"), ("Cd", "f8"), ("Cm", "f8"), ("Cl_f", "f8"), ("Cl_r", "f8"),
+              ("Iterations", "i8"), ("Wall_time", "f8"), ("Seed_alpha", "f8"), ("Written", "f8")])
+DTYPE = np.dtype(COLUMNS)
+
+
+# Function to compute the hash of a geometry and its mesh resolution
+# ep is left out as it follows the Re number, which is a column of its own. yh is kept so that polars solved on
+# different first cell heights get different hashes (the Re numbers of a band share yh, see LEIairfoilMesh.reynolds_bands).
+def geometry_hash(params):
+    content = {name: float(params[name]) for name in GEOMETRY_COLUMNS + MESH_COLUMNS if name != "ep"}
+    return hashlib.sha1(json.dumps(content, sort_keys=True).encode()).hexdigest()[:16]
+
+
+# Function to build the record of a computed case
+# Input:
+#   params - Geometry, mesh and flow parameters (Re, Va, L and the mesh_LEI_airfoil inputs)
+#   row - Row returned by runOpenFoam.compute_alpha [alpha, Time, Cm, Cd, Cl, Cl(f), Cl(r)]
+#   wall_time - Wall time of the case (s)
+def record(params, row, wall_time=np.nan, case_name="", seed_alpha=None):
+    rec = {name: params[name] for name in GEOMETRY_COLUMNS + MESH_COLUMNS}
+    rec.update(geometry_hash=geometry_hash(params), case_name=case_name, Re=params["Re"],
+               Va=params.get("Va", np.nan), L=params.get("L", np.nan),
+               Alpha=row[0], Iterations=row[1], Cm=row[2], Cd=row[3], Cl=row[4], Cl_f=row[5], Cl_r=row[6],
+               Wall_time=wall_time, Seed_alpha=np.nan if seed_alpha is None else seed_alpha)
+    return rec
+
+
+# Function to append records to the store
+# Each call writes a new part file, so that several processes can append at the same time.
+def append(records, store_dir=STORE_DIR):
+    if len(records) == 0:
+        return
+    data = np.zeros(len(records), dtype=DTYPE)
+    data["Written"] = time.time()
+    for i, rec in enumerate(records):
+        for name, value in rec.items():
+            data[name][i] = value
+    append_array(data, store_dir)
+
+
+# Function to load the store
+# Input:
+#   columns - Columns to read (default: all), the other parts of the files are not read
+#   latest - Keep only the last written row of each (geometry hash, alpha, Re)
+# Output:
+#   data - Structured array, one row per case
+def load(store_dir=STORE_DIR, columns=None, latest=True):
+    if columns is None:
+        columns = list(DTYPE.names)
+    read = list(columns)
+    if latest:
+        read = read + [name for name in ["geometry_hash", "Alpha", "Re", "Written"] if name not in read]
+    dtype = np.dtype([(name, DTYPE[name]) for name in read])
+    parts = []
+    for path in sorted(glob.glob(store_dir + "/part-*[0-9].npz")):
+        with np.load(path) as part:
+            n = len(part["Written"])
+            data = np.zeros(n, dtype=dtype)
+            for name in read:
+                if name in part.files:
+                    data[name] = part[name]
+            parts.append(data)
+    data = np.concatenate(parts) if parts else np.zeros(0, dtype=dtype)
+    if latest:
+        data = latest_rows(data)
+    return data[list(columns)] if latest else data
+
+
+# Function to keep the last written row of each (geometry hash, alpha, Re)
+def latest_rows(data):
+    if len(data) == 0:
+        return data
+    order = np.lexsort((-data["Written"], data["Re"], data["Alpha"], data["geometry_hash"]))
+    data = data[order]
+    key = np.stack([data["geometry_hash"] != np.roll(data["geometry_hash"], 1),
+                    data["Alpha"] != np.roll(data["Alpha"], 1),
+                    data["Re"] != np.roll(data["Re"], 1)])
+    first = np.any(key, axis=0)
+    first[0] = True
+    return data[first]
+
+
+# Function to select rows of the store
+# Input:
+#   data - Structured array returned by load
+#   conditions - column=value, column=(min, max) or column=[values]
+# Example: query(data, tube_size=(7, 10), Re=1.36e6, case_name=["a", "b"])
+def query(data, **conditions):
+    return data[mask(data, **conditions)]
+
+
+# Function to get the mask of the rows of a structured array meeting the conditions of query
+def mask(data, **conditions):
+    selected = np.ones(len(data), dtype=bool)
+    for name, condition in conditions.items():
+        if isinstance(condition, tuple):
+            selected &= (data[name] >= condition[0]) & (data[name] <= condition[1])
+        elif isinstance(condition, (list, np.ndarray)):
+            selected &= np.isin(data[name], condition)
+        else:
+            selected &= data[name] == condition
+    return selected
+
+
+# Function to split the store into polars, one per (geometry hash, Re), each sorted by alpha
+# Output:
+#   polars - List of structured arrays (empty for an empty store)
+def polars(data):
+    if len(data) == 0:
+        return []
+    data = data[np.lexsort((data["Alpha"], data["Re"], data["geometry_hash"]))]
+    keys = np.stack([data["geometry_hash"] != np.roll(data["geometry_hash"], 1), data["Re"] != np.roll(data["Re"], 1)])
+    starts = np.flatnonzero(np.any(keys, axis=0) | (np.arange(len(data)) == 0))
+    return np.split(data, starts[1:])
+
+
+# Function to merge all the part files into one
+# The geometry hashes are computed again from the columns, so that the rows written with a former
+# geometry_hash (e.g. without yh) are found by query again.
+def compact(store_dir=STORE_DIR):
+    old_parts = glob.glob(store_dir + "/part-*[0-9].npz")
+    data = load(store_dir, latest=False)
+    data["geometry_hash"] = [geometry_hash(row) for row in data]
+    data = latest_rows(data)
+    append_array(data, store_dir)
+    for path in old_parts:
+        os.remove(path)
+    return len(old_parts), len(data)
+
+
+# Function to write a structured array of the store dtype as a new part
+def append_array(data, store_dir=STORE_DIR):
+    os.makedirs(store_dir, exist_ok=True)
+    name = store_dir + f"/part-{time.time_ns()}-{os.getpid()}"
+    np.savez(name + ".tmp.npz", **{column: data[column] for column in data.dtype.names})
+    os.replace(name + ".tmp.npz", name + ".npz")
+
+
+# Function to import the polars listed in the former data/polars_list.txt
+# Each entry gives the csv file of the polar and the tube size, depth, at, TE angle and chord.
+# The other parameters are the defaults of main_compute_polars.
+def import_polars_list(polars_list, Va=20, nu=1.8e-5 / 1.225, store_dir=STORE_DIR):
+    with open(polars_list, 'r') as file:
+        blocks = file.read().split("##################\n")
+    records = []
+    # blocks: '', csv file, parameters, csv file, parameters...
+    for csv_block, params_block in zip(blocks[1::2], blocks[2::2]):
+        csv_file = csv_block.strip()
+        values = {}
+        for line in params_block.splitlines():
+            # "Tube size = 9.00 %", "at 25.00 %": the label is followed by the first number
+            words = line.replace("=", " ").split()
+            for k, word in enumerate(words):
+                try:
+                    values[" ".join(words[:k])] = float(word)
+                    break
+                except ValueError:
+                    continue
+        params = {"Corde_length": 1, "Depth": values["Depth"], "tube_size": values["Tube size"], "at": values["at"],
+                  "Seam_angle": 35, "TE_angle": values["TE angle"], "nb_pts": 100, "lc_prof": 0.6 / 150,
+                  "lc_edge": 0.6, "xmax": 40, "ymax": 30, "yh": 1e-4, "Va": Va, "L": values["Chord"]}
+        params["Re"] = Va * params["L"] / nu
+        params["ep"] = 0.38 * params["Re"] ** (-1 / 5)
+        rows = np.atleast_2d(np.loadtxt(csv_file, delimiter=",", skiprows=1))
+        for row in rows:
+            records.append(record(params, row, case_name=os.path.basename(csv_file).removesuffix(".csv")))
+    append(records, store_dir)
+    return len(records)
+
+
+# Command line interface to inspect and maintain the store
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Polar store")
+    parser.add_argument("--store-dir", default=STORE_DIR)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("list", help="list the polars of the store")
+    subparsers.add_parser("compact", help="merge the part files of the store and update their geometry hashes")
+    import_parser = subparsers.add_parser("import", help="import the csv polars listed in a polars_list.txt file")
+    import_parser.add_argument("polars_list")
+    args = parser.parse_args()
+
+    if args.command == "list":
+        for polar in polars(load(args.store_dir)):
+            first = polar[0]
+            print(f"{first['geometry_hash']}  {first['case_name']:20s}  Re={first['Re']:.3g}  "
+                  f"tube_size={first['tube_size']:g} Depth={first['Depth']:g} at={first['at']:g} TE_angle={first['TE_angle']:g}  "
+                  f"{len(polar)} alphas [{polar['Alpha'].min():g}, {polar['Alpha'].max():g}]  Cl_max={polar['Cl'].max():.3f}")
+    elif args.command == "compact":
+        n_parts, n_rows = compact(args.store_dir)
+        print(f"{n_parts} parts merged, {n_rows} rows")
+    else:
+        print(f"{import_polars_list(args.polars_list, store_dir=args.store_dir)} rows imported")
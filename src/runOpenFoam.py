@@ -1,99 +1,464 @@
+import caseManager
+import convergenceMonitor
+import foamDat
+import foamDict
+import foamMesh
+import meshCheck
 import subprocess
 import numpy as np
 import csv
+import json
+import os
+import re
 
-def compute_alpha(U, alpha, csv_polar):
+# Template case copied for each angle of attack
+TEMPLATE = "openFoam/Cas_de_base"
+
+# Types of the patches of the converted mesh {patch: (type, physicalType)}
+BOUNDARY_TYPES = {
+    "side": ("empty", "empty"),
+    "airfoil": ("wall", "wall"),
+    "inlet": ("patch", "inlet"),
+    "outlet": ("patch", "outlet"),
+}
+
+# Storage profiles of the cases (entries of system/controlDict)
+# writeInterval "window" writes the fields once per convergence window (template value without convergence check)
+# purgeWrite keeps only the last time directories, the stopped time of a converged case is always kept
+STORAGE_PROFILES = {
+    "ascii": {"writeFormat": "ascii", "writeCompression": "off", "purgeWrite": 0, "writeInterval": None},
+    "binary": {"writeFormat": "binary", "writeCompression": "off", "purgeWrite": 2, "writeInterval": "window"},
+    "compressed": {"writeFormat": "binary", "writeCompression": "on", "purgeWrite": 1, "writeInterval": "window"},
+}
+
+# Mapping of the fields of a coarse mesh case onto a finer mesh (coarse-to-fine initialisation):
+# "python" (value of the nearest coarse cell, see mapped_cells) or "mapFields" (OpenFoam interpolation)
+MAP_METHOD = "python"
+
+# Presets of solver settings (entries of system/fvSolution) tuned by solverTuning for a geometry family and
+# a Re band: {name: {"family", "Re", "Re_band", "entries": {path: value}, ...}}
+SOLVER_PRESETS = "results/solver_presets.json"
+
+# Function to run the OpenFoam case of one angle of attack
+# Input:
+#   U - Inflow speed
+#   alpha - Angle of attack (degrees)
+#   csv_polar - Polar file to append the result to (None to only return it)
+#   ncores - Number of cores of the case (decomposePar/mpirun when > 1)
+#   seed_alpha - Converged angle of attack to start from (None for a uniform start)
+#   conv_window - Sliding window of the convergence check in iterations (None to run to endTime)
+#   conv_tol - Relative band of Cl, Cd and Cm over the window to stop the case
+#   mesh_case - Case holding the converted polyMesh of the geometry (see prepare_mesh)
+#   case_root - Directory of the AOA_<alpha> cases (see caseManager.case_root)
+#   storage - Storage profile of the written fields (see STORAGE_PROFILES)
+#   finalize - Reduce the finished case to its artifacts and archive it (see caseManager.finalize)
+#   init_case - Converged case of the same alpha on a coarser mesh to start from (see map_fields), instead of seed_alpha
+#   solver - Name of the solver preset (see SOLVER_PRESETS), None for the settings of the template
+# Output:
+#   last_line_values - [alpha, Time, Cm, Cd, Cl, Cl(f), Cl(r)], averaged over the
+#                      window and with Time the stopping iteration when conv_window is set
+def compute_alpha(U, alpha, csv_polar, ncores=1, seed_alpha=None, conv_window=None, conv_tol=1e-3, mesh_case="openFoam/mesh", case_root="openFoam", storage="ascii",
+                  finalize=True, init_case=None, solver=None):
+    case_dir = setup_case(U, alpha, mesh_case, case_root, storage, conv_window, seed_alpha, init_case, solver)
+    try:
+        window_values = run_solver(case_dir, ncores, conv_window, conv_tol)
+        last_line_values = read_result(case_dir, alpha, window_values)
+    except RuntimeError:
+        # Diverged, stalled or failed: the logs are kept for inspection
+        if finalize:
+            caseManager.finalize(case_dir, "failed")
+        raise
+    if finalize:
+        caseManager.finalize(case_dir)
+
+    # Write it in polar.csv
+    if csv_polar is not None:
+        with open(csv_polar, 'a', newline='') as csvfile:
+            csv_writer = csv.writer(csvfile)
+            csv_writer.writerow(last_line_values)
+
+    return last_line_values
+
+
+# Function to create the case of one angle of attack from the template (see compute_alpha)
+# Output:
+#   case_dir - Directory of the case
+def setup_case(U, alpha, mesh_case="openFoam/mesh", case_root="openFoam", storage="ascii", conv_window=None, seed_alpha=None,
+               init_case=None, solver=None):
     # Create the working directory
-    subprocess.run(["mkdir", "-p", "openFoam/AOA_" + str(alpha)])
-    subprocess.run(["cp", "-r", "openFoam/Cas_de_base/0", "openFoam/Cas_de_base/constant", "openFoam/Cas_de_base/system", "openFoam/AOA_" + str(alpha)])
-    subprocess.run(["cp", "-r", "data/mesh.msh", "openFoam/AOA_" + str(alpha)])
-
-    # Convert the mesh from gmsh to blockMesh format
-    subprocess.run(['gmshToFoam mesh.msh'], shell=True, cwd="openFoam/AOA_" + str(alpha))
-
-    # Modify the boundary dictionary
-    f = open("openFoam/AOA_" + str(alpha) + '/constant/polyMesh/boundary', 'r+')
-    t = f.readlines()
-    new_lines = []
-    replace = [
-        '        type            empty;\n', 
-        '        physicalType    empty;\n', 
-        '        type            wall;\n',
-        '        physicalType    wall;\n',
-        '        type            patch;\n',
-        '        physicalType    inlet;\n',
-        '        type            patch;\n',
-        '        physicalType    outlet;\n'
-    ]
-    k = 0
-    for line in t:
-        if 'patch' in line:
-            new_lines = np.append(new_lines, replace[k])
-            k = k + 1
-        else:
-            new_lines = np.append(new_lines, line)
-    f.close()
-    f = open("openFoam/AOA_" + str(alpha) + '/constant/polyMesh/boundary', 'w')
-    f.writelines(new_lines)
-    f.close()
+    case_dir = case_root + "/AOA_" + str(alpha)
+    caseManager.remove(case_dir)    # previous run of the case
+    subprocess.run(["mkdir", "-p", case_dir + "/constant"])
+    subprocess.run(["cp", "-r", TEMPLATE + "/0", TEMPLATE + "/system", case_dir])
+    for name in os.listdir(TEMPLATE + "/constant"):
+        if name != "polyMesh":
+            subprocess.run(["cp", "-r", TEMPLATE + "/constant/" + name, case_dir + "/constant"])
+
+    # Link the mesh converted once for all the angles of attack
+    link_mesh(mesh_case, case_dir)
 
     # Change the wind direction (equivalent to changing the AOA)
     v = U  # wind speed
     vx = v * np.cos(alpha * np.pi / 180)
     vy = v * np.sin(alpha * np.pi / 180)
-    # Modify the 0/U dictionary
-    f = open("openFoam/AOA_" + str(alpha) + '/0/U', 'r+')
-    t = f.readlines()
-    new_lines = []
-    for line in t:
-        if 'uniform' in line:
-            new_lines = np.append(new_lines, 'internalField   uniform (' + str(vx) + ' ' + str(vy) + ' ' + '0);\n')
-        else:
-            new_lines = np.append(new_lines, line)
-    f.close()
-    f = open("openFoam/AOA_" + str(alpha) + '/0/U', 'w')
-    f.writelines(new_lines)
-    f.close()
+    field = foamDict.template(TEMPLATE + '/0/U')
+    field['internalField'] = 'uniform ' + foamDict.format_value((vx, vy, 0))
+    foamDict.write(field, case_dir + '/0/U')
 
     # Change the direction of liftDir/dragDir
-    f = open("openFoam/AOA_" + str(alpha) + '/system/controlDict', 'r+')
-    t = f.readlines()
-    new_lines = []
-    for line in t:
-        if 'liftDir' in line:
-            new_lines = np.append(new_lines, '        liftDir     (' + str(-np.sin(alpha * np.pi / 180)) + ' ' + str(np.cos(alpha * np.pi / 180)) + ' ' + '0);\n')
-        elif 'dragDir' in line:
-            new_lines = np.append(new_lines, '        dragDir     (' + str(np.cos(alpha * np.pi / 180)) + ' ' + str(np.sin(alpha * np.pi / 180)) + ' ' + '0);\n')
-        elif 'magUInf' in line:
-            new_lines = np.append(new_lines, '        magUInf     ' + str(U) + ';\n')
+    control = foamDict.template(TEMPLATE + '/system/controlDict')
+    control.set('functions/forces/liftDir', (-np.sin(alpha * np.pi / 180), np.cos(alpha * np.pi / 180), 0))
+    control.set('functions/forces/dragDir', (np.cos(alpha * np.pi / 180), np.sin(alpha * np.pi / 180), 0))
+    control.set('functions/forces/magUInf', U)
+    # Format, compression and retention of the written fields
+    for key, value in storage_entries(storage, conv_window).items():
+        control[key] = value
+    foamDict.write(control, case_dir + '/system/controlDict')
+    # Relaxation factors and linear solvers of the preset
+    if solver is not None:
+        apply_solver(case_dir, solver_entries(solver))
+
+    # Start from the converged fields of the same angle of attack on a coarser mesh, or of the
+    # neighbouring angle of attack (extracted if it was archived)
+    if init_case is not None or seed_alpha is not None:
+        seed_dir = init_case if init_case is not None else case_root + "/AOA_" + str(seed_alpha)
+        restored = caseManager.restore(seed_dir)
+        if restored is None:
+            print(f"Seed {seed_dir} removed by the case quota, {case_dir} starts from uniform fields")
+        elif init_case is not None:
+            map_fields(seed_dir, case_dir)
         else:
-            new_lines = np.append(new_lines, line)
-    f.close()
-    f = open("openFoam/AOA_" + str(alpha) + '/system/controlDict', 'w')
-    f.writelines(new_lines)
-    f.close()
+            seed_fields(seed_dir, case_dir, alpha - seed_alpha)
+        if restored:
+            caseManager.remove(seed_dir)
+    return case_dir
 
-    # Run simpleFoam
-    subprocess.run(['foamRun > log'], shell=True, cwd="openFoam/AOA_" + str(alpha))
 
-    # Read the last lines of the file forceCoeffs.dat
-    force_coeffs_path = "openFoam/AOA_" + str(alpha) + "/postProcessing/forces/0/forceCoeffs.dat"
-    with open(force_coeffs_path, 'r') as f:
-        lines = f.readlines()
-        last_line = lines[-1].strip()
+# Function to run the solver on a case (see compute_alpha)
+# Output:
+#   window_values - Row of forceCoeffs.dat averaged over the convergence window (None without convergence check)
+def run_solver(case_dir, ncores=1, conv_window=None, conv_tol=1e-3):
+    subprocess.run(["rm", "-rf", case_dir + "/postProcessing"])
+    if ncores > 1:
+        decompose(case_dir, ncores)
+        command = 'mpirun -np ' + str(ncores) + ' foamRun -parallel > log'
+    else:
+        command = 'foamRun > log'
+    # The solver runs in its own session so that a diverged case can be killed with its MPI ranks
+    process = subprocess.Popen([command], shell=True, cwd=case_dir, start_new_session=True)
+    # Follow the case (status.json), stop it once the coefficients stay in the band over the window
+    window_values = convergenceMonitor.monitor_case(process, case_dir, conv_window, conv_tol)
+    if ncores > 1:
+        # Bring the last time step back into the case directory
+        subprocess.run(['reconstructPar -latestTime > log.reconstructPar'], shell=True, cwd=case_dir)
+    return window_values
 
-    # Convert last_line to a list of values
-    last_line_values = last_line.split()
 
-    # Convert string values to float
-    last_line_values = list(map(float, last_line_values))
+# Function to get the polar row of a computed case
+# Output:
+#   last_line_values - [alpha, Time, Cm, Cd, Cl, Cl(f), Cl(r)]
+def read_result(case_dir, alpha, window_values=None):
+    if window_values is not None:
+        # Averaged coefficients over the window, Time is the stopping iteration
+        last_line_values = [alpha] + list(window_values)
+    else:
+        # Read the last line of the file forceCoeffs.dat
+        force_coeffs_path = case_dir + "/postProcessing/forces/0/forceCoeffs.dat"
+        tail = foamDat.DatFile(force_coeffs_path).tail(1) if os.path.exists(force_coeffs_path) else []
+        if len(tail) == 0:
+            raise RuntimeError(f"{case_dir} failed: no force coefficients written")
+        last_line_values = tail[0].tolist()
 
-    # Insert alpha at the beginning of the list
-    last_line_values.insert(0, alpha)
+        # Insert alpha at the beginning of the list
+        last_line_values.insert(0, alpha)
+    return last_line_values
+
+
+# Function to convert the gmsh mesh of a geometry once for all the angles of attack
+# Input:
+#   mesh_file - gmsh mesh (.msh, format 2.2), None if the polyMesh was written directly by
+#               LEIairfoilMesh.mesh_LEI_airfoil(mesh_case=...) (only the patch types are set)
+#   mesh_case - Case directory where the polyMesh is written (mesh_case/constant/polyMesh)
+# The mesh is then renumbered and checked by meshCheck.optimise_mesh (report in mesh_case/mesh_report.json).
+def prepare_mesh(mesh_file="data/mesh.msh", mesh_case="openFoam/mesh"):
+    subprocess.run(["mkdir", "-p", mesh_case + "/constant"])
+    # gmshToFoam needs the system directory of a case
+    subprocess.run(["cp", "-r", TEMPLATE + "/system", mesh_case])
+    if mesh_file is not None:
+        subprocess.run(["rm", "-rf", mesh_case + "/constant/polyMesh"])
+        copy = os.path.abspath(mesh_file) != os.path.abspath(mesh_case + "/mesh.msh")
+        if copy:
+            subprocess.run(["cp", mesh_file, mesh_case + "/mesh.msh"])
+
+        # Convert the mesh from gmsh to blockMesh format
+        subprocess.run(['gmshToFoam mesh.msh > log.gmshToFoam'], shell=True, cwd=mesh_case)
+        if copy:
+            subprocess.run(["rm", mesh_case + "/mesh.msh"])
+
+    # Set the types of the patches
+    patch_boundary(mesh_case)
+
+    # Renumber the cells and check the quality of the mesh (see meshCheck), a bad mesh raises a RuntimeError
+    meshCheck.optimise_mesh(mesh_case)
+
+
+# Function to set the type of the patches of a converted mesh (BOUNDARY_TYPES), by patch name
+def patch_boundary(mesh_case):
+    boundary = foamDict.read(mesh_case + '/constant/polyMesh/boundary')
+    patches = foamDict.patches(boundary)
+    for name, (patch_type, physical_type) in BOUNDARY_TYPES.items():
+        patches[name]['type'] = patch_type
+        patches[name]['physicalType'] = physical_type
+    foamDict.write(boundary, mesh_case + '/constant/polyMesh/boundary')
+
+
+# Function to read the number of cells of a converted mesh (note of the owner file header)
+def cell_count(mesh_case):
+    with open(mesh_case + "/constant/polyMesh/owner", 'rb') as f:
+        header = f.read(2048).decode('ascii', 'replace')
+    return int(re.search(r'nCells:\s*(\d+)', header).group(1))
+
+
+# Function to make the constant/polyMesh of a case a link to the shared polyMesh
+def link_mesh(mesh_case, case_dir):
+    link = case_dir + "/constant/polyMesh"
+    if os.path.islink(link):
+        os.remove(link)
+    elif os.path.exists(link):
+        subprocess.run(["rm", "-rf", link])
+    os.symlink(os.path.relpath(mesh_case + "/constant/polyMesh", case_dir + "/constant"), link)
+
+
+# Function to decompose a case to run it on several cores
+# Input:
+#   case_dir - Directory of the OpenFoam case
+#   ncores - Number of subdomains / MPI ranks
+def decompose(case_dir, ncores):
+    # Set the number of subdomains of the decomposition
+    decomposition = foamDict.read(case_dir + '/system/decomposeParDict')
+    decomposition['numberOfSubdomains'] = ncores
+    foamDict.write(decomposition, case_dir + '/system/decomposeParDict')
+
+    subprocess.run(['decomposePar -force > log.decomposePar'], shell=True, cwd=case_dir)
+
+
+# Function to find the last written time directory of a case
+def last_time_dir(case_dir):
+    times = []
+    for name in os.listdir(case_dir):
+        try:
+            times.append((float(name), name))
+        except ValueError:
+            continue
+    return case_dir + '/' + max(times)[1]
+
+
+# Function to locate the internalField entry of an ascii field file
+# Output:
+#   start, end - Position of the entry in the text (end is after the ';')
+#   values - Array of the values of a nonuniform field (None if uniform)
+def find_internal_field(text):
+    start = text.index('internalField')
+    nonuniform = re.compile(r'internalField\s+nonuniform\s+List<\w+>\s*(\d+)\s*\(').match(text, start)
+    if nonuniform is None:
+        return start, text.index(';', start) + 1, None
+    list_end = text.index('\n)', nonuniform.end())
+    values = np.array(text[nonuniform.end():list_end].replace('(', ' ').replace(')', ' ').split(), dtype=float)
+    values = values.reshape(int(nonuniform.group(1)), -1)
+    return start, text.index(';', list_end) + 1, values
+
+
+# Function to read the value of a patch in an ascii field file
+# Input:
+#   text - Text of the field file
+#   patch - Name of the patch
+#   start - Position of the text after which the boundaryField starts (e.g. end of find_internal_field)
+# Output:
+#   values - Array (faces, components) of a nonuniform value, (1, components) of a uniform value,
+#            None if the patch has no value entry (zeroGradient: the value of its cells)
+def find_patch_value(text, patch, start=0):
+    boundary = text.index('boundaryField', start)
+    block = re.compile(r'\b' + re.escape(patch) + r'\s*\{').search(text, boundary)
+    if block is None:
+        raise ValueError(f"No patch {patch} in the boundaryField")
+    block_end = text.index('}', block.end())
+    value = re.compile(r'\bvalue\s+(uniform|nonuniform\s+List<\w+>\s*(\d+))\s*([({]?)').search(text, block.end(), block_end)
+    if value is None:
+        return None
+    if value.group(1) == 'uniform':
+        entry = text[value.end() - len(value.group(3)):text.index(';', value.end())]
+        return np.array(entry.replace('(', ' ').replace(')', ' ').split(), dtype=float).reshape(1, -1)
+    n = int(value.group(2))
+    if value.group(3) == '{':
+        # Compact list of equal values: n{value}
+        entry = text[value.end():text.index('}', value.end())]
+        return np.tile(np.array(entry.replace('(', ' ').replace(')', ' ').split(), dtype=float), (n, 1))
+    if n == 0:
+        return np.zeros((0, 1))
+    list_end = text.index('\n)', value.end())
+    values = np.array(text[value.end():list_end].replace('(', ' ').replace(')', ' ').split(), dtype=float)
+    return values.reshape(n, -1)
+
+
+# Function to initialise the 0/ fields of a case from the last time of a converged case
+# Input:
+#   seed_dir - Converged case (neighbouring angle of attack)
+#   case_dir - Case to initialise, its 0/ already holds the uniform fields of its alpha
+#   delta_alpha - Difference of angle of attack between the two cases (degrees)
+#   cells - Cell of the seed giving the value of each cell of the case, if the meshes differ (see mapped_cells)
+def seed_fields(seed_dir, case_dir, delta_alpha, cells=None):
+    # The seed may have been written in binary or compressed
+    ascii_fields(seed_dir)
+    seed_time = last_time_dir(seed_dir)
+    c = np.cos(delta_alpha * np.pi / 180)
+    s = np.sin(delta_alpha * np.pi / 180)
+    for field in ['U', 'p', 'nut', 'nuTilda']:
+        with open(seed_time + '/' + field, 'r') as f:
+            seed_text = f.read()
+        values = find_internal_field(seed_text)[2]
+        if values is None:
+            continue  # nothing computed yet, keep the uniform field
+        if cells is not None:
+            values = values[cells]
+        if field == 'U':
+            # Rotate the velocity field to the new inflow direction
+            values = np.column_stack((c * values[:, 0] - s * values[:, 1], s * values[:, 0] + c * values[:, 1], values[:, 2]))
+            rows = ['(' + ' '.join('%.6g' % v for v in value) + ')' for value in values]
+            new_entry = 'nonuniform List<vector> \n' + str(len(values)) + '\n(\n' + '\n'.join(rows) + '\n)\n'
+        else:
+            rows = ['%.6g' % value for value in values[:, 0]]
+            new_entry = 'nonuniform List<scalar> \n' + str(len(values)) + '\n(\n' + '\n'.join(rows) + '\n)\n'
+
+        target = foamDict.read(case_dir + '/0/' + field)
+        # The boundary conditions keep the freestream value of the new alpha
+        uniform_value = target['internalField']
+        for _, patch in target['boundaryField'].items():
+            for key, value in patch.items():
+                if value == '$internalField':
+                    patch[key] = uniform_value
+        target['internalField'] = new_entry
+        foamDict.write(target, case_dir + '/0/' + field)
+
+
+# Function to get the controlDict entries of a storage profile
+# Input:
+#   storage - Name of the profile in STORAGE_PROFILES
+#   conv_window - Window of the convergence check (None: keep the writeInterval of the template)
+def storage_entries(storage, conv_window=None):
+    profile = dict(STORAGE_PROFILES[storage])
+    if profile["writeInterval"] == "window":
+        profile["writeInterval"] = conv_window
+    return {key: value for key, value in profile.items() if value is not None}
+
+
+# Function to set the storage profile of an existing case
+def apply_storage(case_dir, storage, conv_window=None):
+    control = foamDict.read(case_dir + '/system/controlDict')
+    for key, value in storage_entries(storage, conv_window).items():
+        control[key] = value
+    foamDict.write(control, case_dir + '/system/controlDict')
+
+
+# Function to load the solver presets (see SOLVER_PRESETS)
+def load_solver_presets(presets_file=SOLVER_PRESETS):
+    if not os.path.exists(presets_file):
+        return {}
+    with open(presets_file, 'r') as f:
+        return json.load(f)
+
+
+# Function to find the solver preset of a geometry family and a Re number
+# Output:
+#   name - Preset of the family whose Re band contains Re, tuned at the closest Re (None if there is none)
+def find_solver_preset(family, Re, presets_file=SOLVER_PRESETS):
+    presets = load_solver_presets(presets_file)
+    names = [name for name, preset in presets.items()
+             if preset["family"] == family and preset["Re_band"][0] <= Re <= preset["Re_band"][1]]
+    if not names:
+        return None
+    return min(names, key=lambda name: abs(np.log(presets[name]["Re"] / Re)))
+
+
+# Function to get the fvSolution entries of a solver preset
+# Output:
+#   entries - Dictionary {path in fvSolution: value}, e.g. {"relaxationFactors/fields/p": 0.5}
+def solver_entries(solver, presets_file=SOLVER_PRESETS):
+    presets = load_solver_presets(presets_file)
+    if solver not in presets:
+        raise ValueError(f"Unknown solver preset {solver} (see {presets_file})")
+    return presets[solver]["entries"]
+
+
+# Function to set entries of the system/fvSolution of a case (see solver_entries)
+def apply_solver(case_dir, entries):
+    solution = foamDict.read(case_dir + '/system/fvSolution')
+    for path, value in entries.items():
+        solution.set(path, value)
+    foamDict.write(solution, case_dir + '/system/fvSolution')
+
+
+# Function to check the format of a field file (ascii, binary or compressed)
+def field_format(path):
+    if os.path.exists(path + '.gz'):
+        return 'compressed'
+    with open(path, 'rb') as f:
+        header = f.read(2048).decode('ascii', 'replace')
+    match = re.search(r'format\s+(\w+)\s*;', header)
+    return match.group(1) if match else 'ascii'
+
+
+# Function to convert the last time of a case to uncompressed ascii (no-op if it already is)
+# The fields of a binary or compressed case are read by seed_fields and by the post-processing scripts.
+def ascii_fields(case_dir):
+    time_dir = last_time_dir(case_dir)
+    if all(field_format(time_dir + '/' + field) == 'ascii'
+           for field in ['U', 'p', 'nut', 'nuTilda'] if os.path.exists(time_dir + '/' + field) or os.path.exists(time_dir + '/' + field + '.gz')):
+        return
+    apply_storage(case_dir, "ascii")
+    subprocess.run(['foamFormatConvert -latestTime > log.foamFormatConvert'], shell=True, cwd=case_dir)
+    # Remove the compressed files replaced by the ascii ones
+    for name in os.listdir(time_dir):
+        if name.endswith('.gz') and os.path.exists(time_dir + '/' + name.removesuffix('.gz')):
+            os.remove(time_dir + '/' + name)
+
+
+# Function to initialise the 0/ fields of a case from the converged case of the same alpha on a coarser mesh
+# Input:
+#   coarse_dir - Converged case on the coarse mesh
+#   case_dir - Case to initialise, its 0/ already holds the uniform fields of its alpha
+#   method - see MAP_METHOD
+def map_fields(coarse_dir, case_dir, method=MAP_METHOD):
+    if method == "mapFields":
+        # Same domain and patches: consistent mapping of the last time onto the 0/ of the case
+        source = os.path.relpath(coarse_dir, case_dir)
+        subprocess.run([f'mapFields {source} -consistent -sourceTime latestTime > log.mapFields 2>&1'], shell=True, cwd=case_dir)
+    elif method == "python":
+        seed_fields(coarse_dir, case_dir, 0, mapped_cells(coarse_dir, case_dir))
+    else:
+        raise ValueError(f"Unknown mapping method {method}")
 
-    # Write it in polar.csv
-    with open(csv_polar, 'a', newline='') as csvfile:
-        csv_writer = csv.writer(csvfile)
-        csv_writer.writerow(last_line_values)
 
-    return ()
+# Function to find the nearest cell of a coarse mesh of each cell of a fine mesh (cell centres in the plane
+# of the airfoil), saved in the fine mesh case as cellMap_<coarse mesh case>.npy for the other angles of attack
+# Input:
+#   coarse_dir, case_dir - Cases of the two meshes (constant/polyMesh linked to their mesh case)
+# Output:
+#   cells - Coarse cell of each fine cell
+def mapped_cells(coarse_dir, case_dir):
+    coarse_mesh = os.path.dirname(os.path.dirname(os.path.realpath(coarse_dir + "/constant/polyMesh")))
+    fine_mesh = os.path.dirname(os.path.dirname(os.path.realpath(case_dir + "/constant/polyMesh")))
+    map_file = fine_mesh + "/cellMap_" + os.path.basename(coarse_mesh) + ".npy"
+    if os.path.exists(map_file):
+        cells = np.load(map_file)
+        # A mesh written again since the map was saved
+        if len(cells) == cell_count(fine_mesh) and cells.max() < cell_count(coarse_mesh):
+            return cells
+    coarse_centres = foamMesh.cell_centres(foamMesh.read(coarse_mesh))
+    fine_centres = foamMesh.cell_centres(foamMesh.read(fine_mesh))
+    cells = foamMesh.nearest(coarse_centres[:, :2], fine_centres[:, :2])
+    # Cases starting together on a new pair of meshes compute the same map, each writes its own file
+    tmp_file = map_file + ".tmp" + str(os.getpid())
+    with open(tmp_file, 'wb') as f:
+        np.save(f, cells)
+    os.replace(tmp_file, map_file)
+    return cells
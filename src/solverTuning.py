@@ -0,0 +1,183 @@
+import LEIairfoilMesh
+import caseManager
+import caseTelemetry
+import designSweep
+import foamDict
+import meshCache
+import runOpenFoam
+import argparse
+import json
+import os
+import time
+
+# Tuning of the solver settings (system/fvSolution) for a geometry family and a Re band: short trial solves
+# of a representative angle of attack are ranked by their wall time to converge the force coefficients, and
+# the best settings are saved as a named preset of runOpenFoam.SOLVER_PRESETS, selected by the sweeps
+# (solver_preset of main_compute_polars and designSweep).
+TUNING_DIR = "openFoam/tuning"      # trial cases, removed once timed
+# Values tried for the entries of fvSolution, one entry at a time from the best settings so far (see tune)
+SEARCH_SPACE = {
+    "relaxationFactors/fields/p": [0.3, 0.4, 0.5],
+    "relaxationFactors/equations/U": [0.7, 0.8, 0.9],
+    "relaxationFactors/equations/nuTilda": [0.7, 0.8, 0.9],
+    "solvers/p/smoother": ["GaussSeidel", "DIC", "DICGaussSeidel"],
+    "solvers/p/relTol": [0.05, 0.1, 0.2],
+    "solvers/p/nCellsInCoarsestLevel": [10, 100, 500],
+    "solvers/p/mergeLevels": [1, 2],
+    "solvers/U/nSweeps": [1, 2, 4],
+    "solvers/nuTilda/nSweeps": [1, 2, 4],
+}
+MAX_ITERATIONS = 3000   # endTime of the trials, a trial not converged by then is not ranked
+AGREEMENT = 1e-2        # relative difference of Cl and Cd with the template settings above which a trial is rejected
+MIN_GAIN = 0.05         # reduction of the wall time below which the best settings are kept (timing noise)
+RE_SPREAD = 2           # a preset applies from Re / RE_SPREAD to Re * RE_SPREAD
+
+
+# Function to run a trial solve of one angle of attack with fvSolution entries
+# Output:
+#   result - Dictionary: entries, state (converged, done: endTime reached, diverged, stalled or failed),
+#            wall time (s), iterations, Cl and Cd (None if the trial failed)
+def trial(U, alpha, entries, mesh_case, case_root, conv_window=300, conv_tol=1e-3, max_iterations=MAX_ITERATIONS, ncores=1):
+    case_dir = runOpenFoam.setup_case(U, alpha, mesh_case, case_root, "binary", conv_window)
+    runOpenFoam.apply_solver(case_dir, entries)
+    control = foamDict.read(case_dir + '/system/controlDict')
+    control['endTime'] = max_iterations
+    foamDict.write(control, case_dir + '/system/controlDict')
+
+    result = {"entries": entries, "state": None, "wall_time": None, "iterations": None, "Cl": None, "Cd": None}
+    start = time.perf_counter()
+    try:
+        window_values = runOpenFoam.run_solver(case_dir, ncores, conv_window, conv_tol)
+        result["wall_time"] = time.perf_counter() - start
+        row = runOpenFoam.read_result(case_dir, alpha, window_values)
+        with open(case_dir + "/" + caseTelemetry.STATUS_FILE, 'r') as f:
+            result["state"] = json.load(f)["state"]
+        result.update(iterations=float(row[1]), Cl=float(row[4]), Cd=float(row[3]))
+    except RuntimeError as error:
+        # Diverged, stalled or failed case killed by the monitor ("<case_dir> <state>: <reason>")
+        result["wall_time"] = time.perf_counter() - start
+        result["state"] = str(error).split(":")[0].split()[-1]
+    caseManager.remove(case_dir)
+    return result
+
+
+# Function to check if a trial reached the tolerance with the coefficients of the reference settings
+def valid(result, reference, agreement=AGREEMENT):
+    if result["state"] != "converged":
+        return False
+    if reference is None or reference["Cl"] is None:
+        return True
+    return all(abs(result[coeff] - reference[coeff]) <= agreement * abs(reference[coeff]) for coeff in ["Cl", "Cd"])
+
+
+# Function to tune the solver settings on a representative angle of attack of a geometry
+# Coordinate search: starting from the template settings, the values of each entry of the search space
+# are tried from the best settings so far, replaced by the fastest valid trial if it is faster by MIN_GAIN.
+# The trials run one after the other so that their wall times are comparable.
+# Input:
+#   name - Name of the preset
+#   family - Geometry family of the preset (e.g. the case name of its polars)
+#   U, Re - Inflow speed and Re number of the trials
+#   alpha - Angle of attack of the trials (degrees)
+#   mesh_case - Mesh of the geometry
+#   search_space - see SEARCH_SPACE
+#   max_trials - Maximum number of trials, the template settings included
+#   conv_window, conv_tol - Force-coefficient tolerance the trials are timed to (see runOpenFoam.compute_alpha)
+#   max_iterations - see MAX_ITERATIONS
+#   ncores - Cores of each trial
+# Output:
+#   preset - Entry of runOpenFoam.SOLVER_PRESETS, with the trials ranked by wall time
+def tune(name, family, U, Re, alpha, mesh_case, search_space=SEARCH_SPACE, max_trials=25, conv_window=300, conv_tol=1e-3,
+         max_iterations=MAX_ITERATIONS, ncores=1, agreement=AGREEMENT):
+    template = foamDict.read(runOpenFoam.TEMPLATE + '/system/fvSolution')
+    case_root = TUNING_DIR + "/" + name
+    trials = []
+
+    def run(entries):
+        result = trial(U, alpha, entries, mesh_case, case_root, conv_window, conv_tol, max_iterations, ncores)
+        trials.append(result)
+        print(f"[{len(trials)}/{max_trials}] {result['state']} in {result['wall_time']:.1f} s"
+              + (f", {result['iterations']:.0f} iterations (Cl = {result['Cl']:.4f}, Cd = {result['Cd']:.4f})" if result["Cl"] is not None else "")
+              + ": " + (" ".join(f"{path}={value}" for path, value in entries.items()) or "template settings"))
+        return result
+
+    reference = run({})
+    best = reference
+    for path, values in search_space.items():
+        current = foamDict.format_value(best["entries"][path]) if path in best["entries"] else template.get(path)
+        for value in values:
+            if len(trials) >= max_trials:
+                break
+            if foamDict.format_value(value) != current:
+                run(dict(best["entries"], **{path: value}))
+        candidates = [result for result in trials if valid(result, reference, agreement)]
+        if candidates:
+            fastest = min(candidates, key=lambda result: result["wall_time"])
+            if not valid(best, reference, agreement) or fastest["wall_time"] < (1 - MIN_GAIN) * best["wall_time"]:
+                best = fastest
+
+    ranked = sorted(trials, key=lambda result: (not valid(result, reference, agreement), result["wall_time"]))
+    speedup = reference["wall_time"] / best["wall_time"] if valid(best, reference, agreement) and valid(reference, None) else None
+    preset = {"family": family, "Re": Re, "Re_band": [Re / RE_SPREAD, Re * RE_SPREAD], "entries": best["entries"],
+              "alpha": alpha, "mesh_case": mesh_case, "conv_window": conv_window, "conv_tol": conv_tol,
+              "speedup": speedup, "tuned": time.time(), "trials": ranked}
+    print_ranking(name, ranked, reference, agreement)
+    return preset
+
+
+# Function to print the trials of a tuning, fastest valid first
+def print_ranking(name, ranked, reference, agreement=AGREEMENT):
+    print(f"Solver tuning {name}: {len(ranked)} trials")
+    for k, result in enumerate(ranked):
+        iterations = f"{result['iterations']:6.0f}" if result["iterations"] is not None else f"{'-':>6s}"
+        print(f"{k + 1:3d} {result['wall_time']:8.1f} s {iterations} it  {result['state']:9s}"
+              f"{' rejected' if result['state'] == 'converged' and not valid(result, reference, agreement) else ''}  "
+              + (" ".join(f"{path.split('/', 1)[1]}={value}" for path, value in result["entries"].items()) or "template settings"))
+
+
+# Function to save a preset in the presets file (see runOpenFoam.SOLVER_PRESETS), replacing a preset of the same name
+def save_preset(name, preset, presets_file=runOpenFoam.SOLVER_PRESETS):
+    presets = runOpenFoam.load_solver_presets(presets_file)
+    presets[name] = preset
+    os.makedirs(os.path.dirname(presets_file) or ".", exist_ok=True)
+    with open(presets_file + ".tmp", 'w') as f:
+        json.dump(presets, f, indent=1)
+    os.replace(presets_file + ".tmp", presets_file)
+
+
+# Command line interface:
+#   python src/solverTuning.py tune tuning.json
+#   python src/solverTuning.py list
+# The tuning file gives "family", "Re", "alpha", optionally the "name" of the preset (default <family>-Re<Re>),
+# the "sample" of the geometry (overriding designSweep.DEFAULTS, meshed for the y+ "yplus" as the Re bands
+# of designSweep), "max_trials", "conv_window", "conv_tol", "max_iterations" and "cores_per_case".
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Tuning of the solver settings of the OpenFoam cases")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    tune_parser = subparsers.add_parser("tune", help="tune the settings of a geometry family and Re band")
+    tune_parser.add_argument("tuning_file")
+    subparsers.add_parser("list", help="list the presets")
+    args = parser.parse_args()
+
+    if args.command == "tune":
+        with open(args.tuning_file, 'r') as f:
+            tuning = json.load(f)
+        Re = tuning["Re"]
+        name = tuning.get("name", f"{tuning['family']}-Re{Re:.2g}")
+        _, yh, ep = LEIairfoilMesh.reynolds_bands([Re], designSweep.rho, designSweep.nu, tuning.get("yplus", designSweep.YPLUS))[0]
+        params = designSweep.geometry_params(dict({"yh": yh, "ep": ep}, **tuning.get("sample", {}), Re=Re))
+        mesh_case = meshCache.get_mesh(*[params[parameter] for parameter in meshCache.MESH_PARAMETERS])
+        preset = tune(name, tuning["family"], params["U"], Re, tuning["alpha"], mesh_case,
+                      max_trials=tuning.get("max_trials", 25), conv_window=tuning.get("conv_window", 300),
+                      conv_tol=tuning.get("conv_tol", 1e-3), max_iterations=tuning.get("max_iterations", MAX_ITERATIONS),
+                      ncores=tuning.get("cores_per_case", 1))
+        save_preset(name, preset)
+        print(f"Preset {name} saved in {runOpenFoam.SOLVER_PRESETS}"
+              + (f", {preset['speedup']:.2f}x faster than the template settings" if preset["speedup"] is not None else ""))
+    else:
+        presets = runOpenFoam.load_solver_presets()
+        for name, preset in presets.items():
+            speedup = f"{preset['speedup']:.2f}x" if preset["speedup"] is not None else "-"
+            print(f"{name}  {preset['family']}  Re {preset['Re_band'][0]:.3g}-{preset['Re_band'][1]:.3g}  {speedup:>6s}  "
+                  + (" ".join(f"{path}={value}" for path, value in preset["entries"].items()) or "template settings"))
+        print(f"{len(presets)} presets")
@@ -0,0 +1,197 @@
+import caseManager
+import foamDict
+import foamMesh
+import runOpenFoam
+import argparse
+import functools
+import glob
+import os
+import subprocess
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+
+# Surface pressure and skin friction on the airfoil of the finished cases: p and wallShearStress of the last
+# time on the airfoil patch, as Cp and Cf at the face centres, saved in
+# SURFACE_DIR/<geometry hash>/Re_<Re>/AOA_<alpha>.npz (layout of caseManager.CASES_DIR)
+# to compare the distributions and locate the separation without opening the cases.
+SURFACE_DIR = "results/surface"
+PATCH = "airfoil"
+P_INF = 0.0     # kinematic pressure of the freestream (internalField of openFoam/Cas_de_base/0/p)
+# Command computing the wall shear stress of a case written without it
+WALL_SHEAR_STRESS = 'foamPostProcess -solver incompressibleFluid -func wallShearStress -latestTime > log.wallShearStress 2>&1'
+
+
+# Function to get the geometry of a patch of a mesh, read once per mesh and process
+# Output:
+#   centres - Face centres (faces, 3)
+#   normals - Unit normals of the faces towards the fluid (faces, 3)
+#   cells - Cell of each face (for the zeroGradient values)
+@functools.lru_cache(maxsize=4)
+def patch_geometry(mesh_case, patch=PATCH):
+    mesh = foamMesh.read(mesh_case)
+    start, n_faces = {name: (start, n) for name, start, n in mesh["patches"]}[patch]
+    centres, areas = foamMesh.face_geometry(mesh["points"], mesh["faces"][start:start + n_faces])
+    # The area vectors of the boundary faces point out of the domain
+    normals = -areas / np.linalg.norm(areas, axis=1)[:, None]
+    return centres, normals, mesh["owner"][start:start + n_faces]
+
+
+# Function to read a field of the last time of a case on a patch
+# Output:
+#   values - Array (faces, components), None if the field was not written
+def patch_field(time_dir, field, cells, patch=PATCH):
+    if not os.path.exists(time_dir + '/' + field):
+        return None
+    with open(time_dir + '/' + field, 'r') as f:
+        text = f.read()
+    _, end, internal = runOpenFoam.find_internal_field(text)
+    values = runOpenFoam.find_patch_value(text, patch, end)
+    if values is None:
+        # zeroGradient: value of the cells of the faces
+        values = internal[cells] if internal is not None else np.zeros((len(cells), 1))
+    return np.broadcast_to(values, (len(cells), values.shape[1]))
+
+
+# Function to find the separation on one side of the airfoil
+# Input:
+#   x, Cf - Chordwise positions and skin friction of the faces of the side
+# Output:
+#   x_separation - Position of the first reversed flow (Cf < 0) downstream of attached flow, NaN if none
+def separation(x, Cf):
+    order = np.argsort(x)
+    x, Cf = x[order], Cf[order]
+    attached = np.flatnonzero(Cf > 0)
+    if len(attached) == 0:
+        return np.nan
+    reversed_flow = np.flatnonzero(Cf[attached[0]:] < 0)
+    return x[attached[0] + reversed_flow[0]] if len(reversed_flow) > 0 else np.nan
+
+
+# Function to compute the surface pressure and skin friction of a case (directory, not archived)
+# Cp = (p - P_INF) / (U^2 / 2) and Cf = -tau.t / (U^2 / 2) with the kinematic pressure and wall shear stress of the
+# incompressible solver, t the unit tangent of the surface towards the trailing edge (Cf < 0: reversed flow).
+# Output:
+#   surface - Dictionary: x, y (face centres), nx, ny (normals towards the fluid), upper (suction side), Cp, Cf
+#             (NaN without wallShearStress), time and magUInf of the case, separation_upper and separation_lower
+def case_surface(case_dir, patch=PATCH):
+    time_dir = runOpenFoam.last_time_dir(case_dir)
+    if not any(os.path.exists(time_dir + '/wallShearStress' + suffix) for suffix in ['', '.gz']):
+        subprocess.run([WALL_SHEAR_STRESS], shell=True, cwd=case_dir)
+    # Fields written in binary or compressed
+    runOpenFoam.ascii_fields(case_dir)
+    mesh_case = os.path.dirname(os.path.dirname(os.path.realpath(case_dir + '/constant/polyMesh')))
+    centres, normals, cells = patch_geometry(mesh_case, patch)
+    U = float(foamDict.read(case_dir + '/system/controlDict').get('functions/forces/magUInf'))
+    q = 0.5 * U ** 2
+
+    p = patch_field(time_dir, 'p', cells, patch)[:, 0]
+    tau = patch_field(time_dir, 'wallShearStress', cells, patch)
+    tangent = np.array([1.0, 0.0, 0.0]) - normals[:, [0]] * normals
+    tangent = tangent / np.maximum(np.linalg.norm(tangent, axis=1), 1e-12)[:, None]
+    Cf = -np.einsum('ij,ij->i', tau, tangent) / q if tau is not None else np.full(len(cells), np.nan)
+    upper = normals[:, 1] > 0
+    surface = {"x": centres[:, 0], "y": centres[:, 1], "nx": normals[:, 0], "ny": normals[:, 1], "upper": upper,
+               "Cp": (p - P_INF) / q, "Cf": Cf, "time": float(os.path.basename(time_dir)), "magUInf": U}
+    surface["separation_upper"] = separation(surface["x"][upper], Cf[upper])
+    surface["separation_lower"] = separation(surface["x"][~upper], Cf[~upper])
+    return surface
+
+
+# Function to extract the surface data of a finished case into an npz file (extracted if it was archived)
+# Output:
+#   summary - Dictionary: case directory, output file, Cp_min and separation positions (None if the case is gone)
+def extract_case(case_dir, output):
+    restored = caseManager.restore(case_dir)
+    if restored is None:
+        return None
+    try:
+        surface = case_surface(case_dir)
+    finally:
+        if restored:
+            caseManager.remove(case_dir)
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    arrays = {name: value.astype(np.float32) if isinstance(value, np.ndarray) and value.dtype != bool else value
+              for name, value in surface.items()}
+    with open(output + ".tmp", 'wb') as f:
+        np.savez(f, **arrays)
+    os.replace(output + ".tmp", output)
+    return {"case_dir": case_dir, "output": output, "Cp_min": float(np.min(surface["Cp"])),
+            "separation_upper": surface["separation_upper"], "separation_lower": surface["separation_lower"]}
+
+
+# Function to extract the surface data of finished cases in parallel
+# Input:
+#   case_dirs - Case directories (archived or not) under cases_dir, None for all the done cases of the caseManager index
+#   workers - Number of cases extracted at the same time (default: all the cores)
+#   force - Extract again the cases whose npz file is more recent than the case
+# Output:
+#   summaries - Summaries of extract_case of the extracted cases
+def extract(case_dirs=None, workers=None, force=False, cases_dir=caseManager.CASES_DIR, surface_dir=SURFACE_DIR):
+    if case_dirs is None:
+        index = caseManager.update_index(lambda index: dict(index), cases_dir)
+        case_dirs = [entry["case_dir"] for entry in index.values() if entry["state"] == "done"]
+    jobs = []
+    for case_dir in case_dirs:
+        output = surface_dir + "/" + os.path.relpath(case_dir, cases_dir) + ".npz"
+        case_paths = [path for path in [case_dir] + [case_dir + "." + archive for archive in caseManager.ARCHIVE_MODES]
+                      if os.path.exists(path)]
+        if not force and case_paths and os.path.exists(output) and os.path.getmtime(output) >= max(map(os.path.getmtime, case_paths)):
+            continue
+        jobs.append((case_dir, output))
+    print(f"Extracting the surface data of {len(jobs)} cases ({len(case_dirs) - len(jobs)} up to date)")
+
+    summaries = []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        # Cases of the same mesh together, so that the workers reuse the geometry read by patch_geometry
+        jobs.sort(key=lambda job: os.path.dirname(job[0]))
+        futures = [pool.submit(extract_case, case_dir, output) for case_dir, output in jobs]
+        for (case_dir, _), future in zip(jobs, futures):
+            try:
+                summary = future.result()
+            except (OSError, ValueError) as error:
+                print(f"{case_dir}: {error!r}")
+                continue
+            if summary is None:
+                print(f"{case_dir}: removed")
+                continue
+            summaries.append(summary)
+            print(f"{case_dir}: Cp min {summary['Cp_min']:.3f}, separation upper x = {summary['separation_upper']:.3f}, "
+                  f"lower x = {summary['separation_lower']:.3f}")
+    return summaries
+
+
+# Function to load the surface data of a case
+# Input:
+#   geometry_hash, Re, alpha - Case (see polarStore.geometry_hash and caseManager.case_root)
+# Output:
+#   surface - Dictionary of case_surface
+def load(geometry_hash, Re, alpha, surface_dir=SURFACE_DIR):
+    with np.load(f"{surface_dir}/{geometry_hash}/Re_{Re:.6g}/AOA_{alpha}.npz") as data:
+        return {name: data[name] if data[name].ndim > 0 else data[name].item() for name in data.files}
+
+
+# Command line interface:
+#   python src/surfaceData.py extract [case directories] [--workers 4] [--force]
+#   python src/surfaceData.py list
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Surface pressure and skin friction of the finished cases")
+    parser.add_argument("--cases-dir", default=caseManager.CASES_DIR)
+    parser.add_argument("--surface-dir", default=SURFACE_DIR)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    extract_parser = subparsers.add_parser("extract", help="extract the cases (default: all the done cases of the index)")
+    extract_parser.add_argument("case_dirs", nargs="*")
+    extract_parser.add_argument("--workers", type=int)
+    extract_parser.add_argument("--force", action="store_true", help="extract again the cases already extracted")
+    subparsers.add_parser("list", help="list the extracted cases with their minimum Cp and separation positions")
+    args = parser.parse_args()
+
+    if args.command == "extract":
+        extract([case_dir.rstrip("/").removesuffix(".tar.gz").removesuffix(".tar") for case_dir in args.case_dirs] or None,
+                args.workers, args.force, args.cases_dir, args.surface_dir)
+    else:
+        paths = sorted(glob.glob(args.surface_dir + "/*/Re_*/AOA_*.npz"))
+        for path in paths:
+            with np.load(path) as data:
+                print(f"{os.path.relpath(path, args.surface_dir)[:-4]}  Cp min {data['Cp'].min():7.3f}  "
+                      f"separation x upper {float(data['separation_upper']):.3f} lower {float(data['separation_lower']):.3f}")
+        print(f"{len(paths)} cases")
@@ -0,0 +1,297 @@
+import designSweep
+import polarStore
+import sweepScheduler
+import glob
+import numpy as np
+import os
+
+# Inputs and outputs of the surrogate model
+INPUTS = ["Alpha", "Depth", "tube_size", "at", "TE_angle"]
+OUTPUTS = ["Cl", "Cd", "Cm"]
+TARGETS = {"Cl": 0.02, "Cd": 0.002}     # standard deviation of the prediction to stop the sampling
+
+# Model fitted on the whole store by predict_polar {inputs: (part files, model)}
+_models = {}
+
+
+# Class of a Gaussian process regression with a squared exponential kernel
+# (one length scale per input, inputs scaled to [0, 1] and output standardised)
+# The hyperparameters maximise the log marginal likelihood.
+class GaussianProcess:
+    def __init__(self, length_scales=None, noise=None):
+        self.length_scales = length_scales
+        self.noise = noise
+
+    def _kernel(self, X1, X2):
+        d = (X1[:, None, :] - X2[None, :, :]) / self.length_scales
+        return np.exp(-0.5 * np.sum(d ** 2, axis=2))
+
+    def _factorize(self):
+        K = self._kernel(self.X, self.X) + (self.noise + 1e-10) * np.eye(len(self.X))
+        self.L = np.linalg.cholesky(K)
+        self.weights = np.linalg.solve(self.L.T, np.linalg.solve(self.L, self.y))
+
+    def log_likelihood(self):
+        return -0.5 * self.y @ self.weights - np.sum(np.log(np.diag(self.L))) - 0.5 * len(self.y) * np.log(2 * np.pi)
+
+    # Function to fit the model
+    # Input:
+    #   X - Inputs (number of points, number of inputs)
+    #   y - Output (number of points)
+    def fit(self, X, y):
+        X = np.asarray(X, dtype=float)
+        y = np.asarray(y, dtype=float)
+        self.x_min = X.min(axis=0)
+        self.x_span = np.where(np.ptp(X, axis=0) > 0, np.ptp(X, axis=0), 1.0)
+        self.y_mean = y.mean()
+        self.y_std = y.std() if y.std() > 0 else 1.0
+        self.X = (X - self.x_min) / self.x_span
+        self.y = (y - self.y_mean) / self.y_std
+        if self.length_scales is None or self.noise is None:
+            self._optimize()
+        else:
+            self._factorize()
+        return self
+
+    def _try(self, length_scales, noise):
+        self.length_scales, self.noise = length_scales, noise
+        try:
+            self._factorize()
+        except np.linalg.LinAlgError:
+            return -np.inf
+        return self.log_likelihood()
+
+    # Search of the hyperparameters: common length scale and noise on a grid, then one length scale at a time
+    def _optimize(self, n_rounds=3):
+        n_inputs = self.X.shape[1]
+        best = (-np.inf, None, None)
+        for scale in [0.05, 0.1, 0.2, 0.4, 0.8, 1.6]:
+            for noise in [1e-6, 1e-4, 1e-2]:
+                value = self._try(np.full(n_inputs, scale), noise)
+                if value > best[0]:
+                    best = (value, np.full(n_inputs, scale), noise)
+        for _ in range(n_rounds):
+            for i in range(n_inputs):
+                for factor in [0.5, 0.7, 1.4, 2.0]:
+                    length_scales = best[1].copy()
+                    length_scales[i] = length_scales[i] * factor
+                    value = self._try(length_scales, best[2])
+                    if value > best[0]:
+                        best = (value, length_scales, best[2])
+        self._try(best[1], best[2])
+
+    # Function to predict the output
+    # Output:
+    #   mean, std - Mean and standard deviation of the prediction at each point
+    def predict(self, X):
+        Xn = (np.atleast_2d(np.asarray(X, dtype=float)) - self.x_min) / self.x_span
+        Ks = self._kernel(Xn, self.X)
+        mean = Ks @ self.weights
+        v = np.linalg.solve(self.L, Ks.T)
+        var = np.maximum(1 + self.noise - np.sum(v ** 2, axis=0), 0)
+        return self.y_mean + self.y_std * mean, self.y_std * np.sqrt(var)
+
+    # Function to add points to the model with the same hyperparameters
+    # (used with the predicted values to spread a batch of new points)
+    def condition(self, X, y):
+        model = GaussianProcess(self.length_scales, self.noise)
+        model.x_min, model.x_span, model.y_mean, model.y_std = self.x_min, self.x_span, self.y_mean, self.y_std
+        model.X = np.vstack((self.X, (np.atleast_2d(X) - self.x_min) / self.x_span))
+        model.y = np.concatenate((self.y, (np.asarray(y) - self.y_mean) / self.y_std))
+        model._factorize()
+        return model
+
+
+# Class of the surrogate model of the coefficients: one Gaussian process per output
+class Surrogate:
+    def __init__(self, inputs=INPUTS, outputs=OUTPUTS):
+        self.inputs = list(inputs)
+        self.outputs = list(outputs)
+        self.models = {}
+
+    # Function to fit the model on rows of the polar store (see polarStore.load and polarStore.query)
+    def fit(self, data):
+        if len(data) < 2:
+            raise ValueError("the surrogate needs at least 2 points")
+        X = np.column_stack([data[name] for name in self.inputs])
+        for output in self.outputs:
+            self.models[output] = GaussianProcess().fit(X, data[output])
+        return self
+
+    # Function to predict the coefficients
+    # Input:
+    #   X - Inputs (number of points, number of inputs)
+    # Output:
+    #   prediction - Dictionary {output: mean, output + "_std": standard deviation}
+    def predict(self, X):
+        prediction = {}
+        for output, model in self.models.items():
+            prediction[output], prediction[output + "_std"] = model.predict(X)
+        return prediction
+
+
+# Function to predict the polar of a geometry from the polar store, without running OpenFoam
+# The model fitted on the whole store is kept until new results are stored.
+# Input:
+#   alphas - Angles of attack (degrees)
+#   geometry - Values of the inputs other than Alpha (default: designSweep.DEFAULTS)
+#   model - Surrogate to use (default: fitted on the whole store)
+# Output:
+#   polar - Dictionary {"Alpha", "Cl", "Cl_std", "Cd", "Cd_std", "Cm", "Cm_std"} of arrays
+# Example: predict_polar(np.arange(0, 20, 0.5), Depth=10, tube_size=8)
+def predict_polar(alphas, model=None, store_dir=polarStore.STORE_DIR, **geometry):
+    if model is None:
+        model = store_model(store_dir)
+    alphas = np.asarray(alphas, dtype=float)
+    X = np.column_stack([alphas if name == "Alpha" else np.full(len(alphas), float(geometry.get(name, designSweep.DEFAULTS[name])))
+                         for name in model.inputs])
+    polar = {"Alpha": alphas}
+    polar.update(model.predict(X))
+    return polar
+
+
+# Function to get the surrogate fitted on the whole polar store (fitted again only if the store changed)
+def store_model(store_dir=polarStore.STORE_DIR, inputs=INPUTS):
+    parts = sorted(glob.glob(store_dir + "/part-*[0-9].npz"))
+    key = (store_dir, tuple(inputs))
+    if key not in _models or _models[key][0] != parts:
+        data = polarStore.load(store_dir, columns=list(inputs) + OUTPUTS)
+        _models[key] = (parts, Surrogate(inputs).fit(data))
+    return _models[key][1]
+
+
+# Function to choose the next points to compute among candidates: highest standard deviation
+# of the model, each chosen point is added to the model with its predicted value so that
+# the points of a batch are spread
+# Input:
+#   model - GaussianProcess of the output the sampling is driven by
+#   candidates - Candidate inputs (number of candidates, number of inputs)
+#   n - Number of points
+#   groups - Group of each candidate (e.g. the geometry), all the candidates of a group are chosen
+#            together and the score of a group is the max std of its candidates (default: each candidate alone)
+# Output:
+#   chosen - Indices of the chosen groups (candidates), max_std - max std of the candidates before the choice
+def next_points(model, candidates, n, groups=None):
+    if len(candidates) == 0:
+        return [], 0.0
+    if groups is None:
+        groups = np.arange(len(candidates))
+    chosen = []
+    max_std = None
+    for _ in range(n):
+        mean, std = model.predict(candidates)
+        scores = np.full(groups.max() + 1, -1.0)
+        np.maximum.at(scores, groups, std)
+        scores[chosen] = -1
+        if max_std is None:
+            max_std = scores.max()
+        best = int(np.argmax(scores))
+        if scores[best] <= 0:
+            break
+        chosen.append(best)
+        model = model.condition(candidates[groups == best], mean[groups == best])
+    return chosen, max_std
+
+
+# Function to compute a polar with adaptive angles of attack
+# The Gaussian process of Cl and Cd over alpha is fitted to the cases computed so far, the next
+# batch is taken where the prediction is the most uncertain (near stall), until the standard
+# deviation is below the targets everywhere or max_cases cases have been computed.
+# Input:
+#   U - Inflow speed
+#   alpha_range - (min, max) angles of attack (degrees)
+#   initial - First angles of attack computed
+#   resolution - Step of the candidate angles of attack (degrees)
+#   targets - Standard deviation allowed {output: value}
+#   max_cases - Maximum number of cases
+#   batch - Number of cases computed at once (default: the workers of the sweep)
+#   known - Rows already computed for this geometry and Re [alpha, Time, Cm, Cd, Cl, Cl(f), Cl(r)]
+#   the others - see sweepScheduler.run_sweep
+# Output:
+#   rows, timings, seeds - as sweepScheduler.run_sweep, for the computed cases in alpha order
+def adaptive_polar(U, alpha_range=(0, 20), initial=(0, 8, 16), resolution=0.5, targets=TARGETS, max_cases=15, batch=None,
+                   known=(), cores_per_case=1, conv_window=300, conv_tol=1e-3, mesh_case="openFoam/mesh", storage="ascii",
+                   case_root="openFoam", coarse_mesh_case=None, solver=None):
+    if batch is None:
+        batch = max(1, (os.cpu_count() or 1) // cores_per_case)
+    candidates = np.arange(alpha_range[0], alpha_range[1] + resolution / 2, resolution)
+    computed = {}
+    attempted = set()
+    known_rows = {row[0]: row for row in known}
+    next_alphas = [alpha for alpha in initial if alpha not in known_rows]
+    while True:
+        if next_alphas:
+            attempted.update(next_alphas)
+            rows, timings, _ = sweepScheduler.run_sweep(U, next_alphas, None, batch, cores_per_case, False, conv_window,
+                                                        conv_tol, mesh_case, storage, case_root, coarse_mesh_case, solver)
+            for row, elapsed in zip(rows, timings):
+                computed[row[0]] = (row, elapsed)
+        if len(computed) >= max_cases:
+            print(f"Adaptive polar: {max_cases} cases computed, stopping")
+            break
+        # Fit the model of Cl and Cd on all the rows of the polar, choose where they are the most uncertain
+        all_rows = np.array(list(known_rows.values()) + [row for row, _ in computed.values()], dtype=float)
+        if len(all_rows) == 0:
+            print("Adaptive polar: no case computed, stopping")
+            break
+        # The failed angles of attack are not tried again
+        remaining = candidates[~np.isin(candidates, all_rows[:, 0]) & ~np.isin(candidates, list(attempted))]
+        if len(remaining) == 0:
+            print("Adaptive polar: all the candidate angles of attack computed or failed, stopping")
+            break
+        chosen = set()
+        max_stds = {}
+        for output, column in [("Cl", 4), ("Cd", 3)]:
+            model = GaussianProcess().fit(all_rows[:, [0]], all_rows[:, column])
+            picks, max_stds[output] = next_points(model, remaining[:, None], min(batch, max_cases - len(computed)))
+            if max_stds[output] > targets[output]:
+                chosen.update(remaining[picks].tolist())
+        print("Adaptive polar: max std " + ", ".join(f"{k} {v:.4f}" for k, v in max_stds.items()))
+        if not chosen:
+            break
+        next_alphas = sorted(chosen)[:max_cases - len(computed)]
+    alphas = sorted(computed)
+    return [computed[alpha][0] for alpha in alphas], [computed[alpha][1] for alpha in alphas], [None] * len(alphas)
+
+
+# Function to sample geometries adaptively: the geometries whose polar is the most uncertain
+# for the surrogate are computed by batches with designSweep.run_design_sweep
+# Input:
+#   name - Name of the sweep (journal and case name of the rows of the store used by the model)
+#   bounds - Ranges of the geometry inputs {name: (min, max)}
+#   alphas - Angles of attack of each geometry
+#   batch - Number of geometries per iteration
+#   max_geometries - Maximum number of geometries
+#   target - Standard deviation of Cl allowed
+#   n_candidates - Number of random candidate geometries per iteration
+# Output:
+#   model - Surrogate fitted on the computed geometries
+def adaptive_design(name, bounds, alphas, batch=4, max_geometries=40, target=TARGETS["Cl"], n_candidates=300, seed=0,
+                    n_workers=None, cores_per_case=1, conv_window=300, conv_tol=1e-3, storage="compressed"):
+    rng = np.random.default_rng(seed)
+    names = sorted(bounds)
+    low = np.array([bounds[k][0] for k in names])
+    high = np.array([bounds[k][1] for k in names])
+    inputs = ["Alpha"] + names
+
+    def random_geometries(n):
+        # Latin hypercube in the bounds
+        u = (np.argsort(rng.random((n, len(names))), axis=0) + rng.random((n, len(names)))) / n
+        return np.round(low + u * (high - low), 2)
+
+    samples = [dict(zip(names, map(float, geometry))) for geometry in random_geometries(batch)]
+    while True:
+        designSweep.run_design_sweep(name, samples, alphas, n_workers, cores_per_case, conv_window, conv_tol, storage)
+        data = polarStore.query(polarStore.load(columns=inputs + OUTPUTS + ["case_name"]), case_name=name)
+        model = Surrogate(inputs).fit(data)
+        if len(samples) >= max_geometries:
+            print(f"Adaptive design {name}: {len(samples)} geometries computed, stopping")
+            return model
+        geometries = random_geometries(n_candidates)
+        candidates = np.column_stack((np.tile(alphas, n_candidates), np.repeat(geometries, len(alphas), axis=0)))
+        groups = np.repeat(np.arange(n_candidates), len(alphas))
+        picks, max_std = next_points(model.models["Cl"], candidates, min(batch, max_geometries - len(samples)), groups)
+        print(f"Adaptive design {name}: {len(samples)} geometries, max std of Cl {max_std:.4f}")
+        if max_std <= target:
+            return model
+        samples = samples + [dict(zip(names, map(float, geometries[k]))) for k in picks]
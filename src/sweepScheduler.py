@@ -0,0 +1,187 @@
+import runOpenFoam
+import os
+import csv
+import time
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+
+# Function run by each worker: compute one angle of attack and time it
+# With a coarse mesh, the angle of attack is first solved on it (from the seed of the continuation, in
+# case_root/coarse) and the fine case starts from its fields mapped on the fine mesh (see runOpenFoam.map_fields).
+# Output:
+#   row - Row of compute_alpha on the fine mesh
+#   elapsed - Wall time of the case, both levels included (s)
+#   coarse - Row and wall time of the coarse level (None without coarse mesh or if it failed)
+def run_case(U, alpha, ncores, seed_alpha=None, conv_window=None, conv_tol=1e-3, mesh_case="openFoam/mesh", storage="ascii",
+             case_root="openFoam", coarse_mesh_case=None, solver=None):
+    start = time.perf_counter()
+    coarse = None
+    init_case = None
+    if coarse_mesh_case is not None:
+        try:
+            coarse_row = runOpenFoam.compute_alpha(U, alpha, None, ncores, seed_alpha, conv_window, conv_tol, coarse_mesh_case,
+                                                   case_root + "/coarse", storage, solver=solver)
+            coarse = (coarse_row, time.perf_counter() - start)
+            init_case = case_root + "/coarse/AOA_" + str(alpha)
+        except RuntimeError as error:
+            print(f"AOA_{alpha} failed on the coarse mesh ({error}), the fine case starts from uniform fields")
+        seed_alpha = None
+    row = runOpenFoam.compute_alpha(U, alpha, None, ncores, seed_alpha, conv_window, conv_tol, mesh_case, case_root, storage,
+                                    init_case=init_case, solver=solver)
+    return row, time.perf_counter() - start, coarse
+
+
+# Function to order the angles of attack into continuation chains
+# Each chain marches away from the angle closest to 0 so that every case
+# starts from the converged fields of its neighbour, the first case of a
+# chain starts from uniform fields.
+# Input:
+#   alphas - Sorted angles of attack
+#   n_chains - Number of chains to run at the same time
+# Output:
+#   chains - List of lists of angles of attack
+def continuation_chains(alphas, n_chains):
+    pivot = min(range(len(alphas)), key=lambda i: abs(alphas[i]))
+    sides = [alphas[pivot:], alphas[:pivot][::-1]]
+    sides = [side for side in sides if len(side) > 0]
+    chains = []
+    for side in sides:
+        # Share the chains between the two sides according to their length
+        n_side = max(1, round(n_chains * len(side) / len(alphas)))
+        n_side = min(n_side, len(side))
+        for k in range(n_side):
+            chains.append(side[k * len(side) // n_side:(k + 1) * len(side) // n_side])
+    return chains
+
+
+# Function to run the angles of attack of a polar in parallel
+# Input:
+#   U - Inflow speed
+#   range_AOA - Angles of attack to compute (degrees)
+#   csv_polar - Polar file, the rows are appended in alpha order (None for no file)
+#   n_workers - Number of cases run at the same time (default: cores / cores_per_case)
+#   cores_per_case - Number of cores given to each case (decomposePar/mpirun when > 1)
+#   continuation - Start each case from the converged neighbouring alpha
+#   conv_window - Sliding window of the convergence check in iterations (None to run to endTime)
+#   conv_tol - Relative band of Cl, Cd and Cm over the window to stop a case
+#   mesh_case - Case holding the converted polyMesh of the geometry
+#   storage - Storage profile of the cases (see runOpenFoam.STORAGE_PROFILES)
+#   case_root - Directory of the AOA_<alpha> cases (see caseManager.case_root)
+#   coarse_mesh_case - Coarser mesh of the geometry solved first for each alpha (None: fine mesh only, see run_case),
+#                      the continuation is then done on the coarse mesh
+#   solver - Solver preset of the cases (see runOpenFoam.SOLVER_PRESETS, None for the template settings)
+# Output:
+#   rows - Rows of compute_alpha in alpha order (the failed cases are left out)
+#   timings - Wall time of each case (s)
+#   seeds - Angle of attack each case started from (None for a uniform start)
+def run_sweep(U, range_AOA, csv_polar, n_workers=None, cores_per_case=1, continuation=False, conv_window=None, conv_tol=1e-3,
+              mesh_case="openFoam/mesh", storage="ascii", case_root="openFoam", coarse_mesh_case=None, solver=None):
+    # Keep integer angles as int for the AOA_<alpha> directory names
+    alphas = sorted(int(alpha) if float(alpha).is_integer() else float(alpha) for alpha in range_AOA)
+    if n_workers is None:
+        n_workers = max(1, (os.cpu_count() or 1) // cores_per_case)
+    n_workers = min(n_workers, len(alphas))
+    if continuation:
+        chains = continuation_chains(alphas, n_workers)
+    else:
+        chains = [[alpha] for alpha in alphas]
+    print(f"Running {len(alphas)} cases in {len(chains)} chains on {n_workers} workers x {cores_per_case} cores")
+
+    rows = {}
+    timings = {}
+    coarse = {}
+    seeds = {}
+    failed = []
+    next_index = 0  # index of the next alpha to write in the polar file
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=n_workers) as pool:
+        # Submit the first case of each chain, the next one is submitted when its seed is done
+        futures = {}
+        for chain in chains:
+            seeds[chain[0]] = None
+            futures[pool.submit(run_case, U, chain[0], cores_per_case, None, conv_window, conv_tol, mesh_case, storage,
+                                 case_root, coarse_mesh_case, solver)] = (chain, 0)
+        while futures:
+            done, _ = wait(futures, return_when=FIRST_COMPLETED)
+            for future in done:
+                chain, k = futures.pop(future)
+                alpha = chain[k]
+                try:
+                    rows[alpha], timings[alpha], coarse[alpha] = future.result()
+                    print(f"[{len(rows)}/{len(alphas)}] AOA_{alpha} done in {timings[alpha]:.1f} s, "
+                          f"{rows[alpha][1]:.0f} iterations (Cl = {rows[alpha][4]:.4f}, Cd = {rows[alpha][3]:.4f}), "
+                          f"elapsed {time.perf_counter() - start:.1f} s")
+                except RuntimeError as error:
+                    # Diverged, stalled or failed case killed by the monitor (see caseTelemetry)
+                    failed.append(alpha)
+                    print(f"AOA_{alpha} failed: {error}")
+                if k + 1 < len(chain):
+                    # The next case of the chain starts from uniform fields if its seed failed
+                    seed = None if alpha in failed else alpha
+                    seeds[chain[k + 1]] = seed
+                    futures[pool.submit(run_case, U, chain[k + 1], cores_per_case, seed, conv_window, conv_tol, mesh_case, storage,
+                                         case_root, coarse_mesh_case, solver)] = (chain, k + 1)
+
+            # Write the rows that are now complete in alpha order
+            if csv_polar is not None:
+                with open(csv_polar, 'a', newline='') as csvfile:
+                    csv_writer = csv.writer(csvfile)
+                    while next_index < len(alphas) and (alphas[next_index] in rows or alphas[next_index] in failed):
+                        if alphas[next_index] in rows:
+                            csv_writer.writerow(rows[alphas[next_index]])
+                        next_index = next_index + 1
+
+    print(f"Sweep done in {time.perf_counter() - start:.1f} s (sum of case times {sum(timings.values()):.1f} s, "
+          f"{sum(timings.values()) * cores_per_case / 3600:.3g} core-hours)" + (f", failed cases: {failed}" if failed else ""))
+
+    if coarse_mesh_case is not None:
+        report_levels(rows, timings, coarse, cores_per_case, runOpenFoam.cell_count(coarse_mesh_case), runOpenFoam.cell_count(mesh_case),
+                      None if csv_polar is None else csv_polar.removesuffix('.csv') + '_levels.csv')
+    elif continuation:
+        report_iterations(chains, seeds, rows, None if csv_polar is None else csv_polar.removesuffix('.csv') + '_iterations.csv')
+    alphas = [alpha for alpha in alphas if alpha in rows]
+    return [rows[alpha] for alpha in alphas], [timings[alpha] for alpha in alphas], [seeds[alpha] for alpha in alphas]
+
+
+# Function to report the iterations saved by the continuation of each chain
+# The reference of a chain is the iteration count of its last case with a uniform start
+# (its first case, or the case following a failed one). The failed cases are left out.
+def report_iterations(chains, seeds, rows, csv_file=None):
+    lines = []
+    for chain in chains:
+        reference = None
+        for alpha in chain:
+            if alpha not in rows:
+                continue
+            iterations = rows[alpha][1]
+            if seeds[alpha] is None or reference is None:
+                reference = iterations
+            lines.append([alpha, seeds[alpha], iterations, reference, reference - iterations])
+            print(f"AOA_{alpha}: {iterations:.0f} iterations, {reference - iterations:.0f} saved by continuation")
+    if csv_file is not None:
+        with open(csv_file, 'w', newline='') as file:
+            writer = csv.writer(file)
+            writer.writerow(["Alpha", "Seed alpha", "Iterations", "Uniform start iterations", "Saved iterations"])
+            writer.writerows(lines)
+
+
+# Function to report the iterations and core-hours of each level of a coarse-to-fine sweep
+# The cost of the coarse iterations is also given in fine iterations (ratio of the numbers of cells).
+def report_levels(rows, timings, coarse, cores_per_case, coarse_cells, fine_cells, csv_file=None):
+    lines = []
+    for alpha in sorted(rows):
+        coarse_iterations, coarse_time = (coarse[alpha][0][1], coarse[alpha][1]) if coarse[alpha] is not None else (0, 0)
+        iterations = rows[alpha][1]
+        lines.append([alpha, coarse_iterations, iterations, iterations + coarse_iterations * coarse_cells / fine_cells,
+                      coarse_time * cores_per_case / 3600, (timings[alpha] - coarse_time) * cores_per_case / 3600])
+        print(f"AOA_{alpha}: {coarse_iterations:.0f} coarse + {iterations:.0f} fine iterations "
+              f"({lines[-1][3]:.0f} fine equivalent)")
+    print(f"Coarse mesh {coarse_cells} cells, fine mesh {fine_cells} cells: {sum(line[1] for line in lines):.0f} coarse + "
+          f"{sum(line[2] for line in lines):.0f} fine iterations, {sum(line[4] for line in lines):.3g} + "
+          f"{sum(line[5] for line in lines):.3g} core-hours")
+    if csv_file is not None:
+        with open(csv_file, 'w', newline='') as file:
+            writer = csv.writer(file)
+            writer.writerow(["Alpha", "Coarse iterations", "Fine iterations", "Fine equivalent iterations",
+                             "Coarse core-hours", "Fine core-hours"])
+            writer.writerows(lines)
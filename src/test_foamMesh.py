@@ -0,0 +1,145 @@
+import foamMesh
+import sys
+import tempfile
+import numpy as np
+
+# Checks of the polyMesh written by foamMesh without OpenFoam: the meshes of a box in hexahedra and in
+# tetrahedra, with their cells shuffled, are built, renumbered by Reverse Cuthill-McKee and written and read
+# back in binary and ascii. Run after a change of foamMesh: python src/test_foamMesh.py
+
+# Box meshed by the checks (cells along x, y and z)
+hex_cells = (12, 8, 1)
+tet_cells = (4, 3, 2)
+size = (2.0, 1.0, 0.1)
+seed = 0    # shuffling of the cells
+
+
+# Function to mesh a box in hexahedra (gmsh node order), or in 6 tetrahedra per hexahedron around the
+# diagonal 0-6 (the same diagonal in all the hexahedra, so that the faces match), half of the cells inverted
+# Output:
+#   points, cells, patches - Inputs of foamMesh.build, one patch per side of the box (xmin, xmax...)
+def box_mesh(n, tetrahedra=False):
+    nx, ny, nz = n
+    x, y, z = [np.linspace(0, length, count + 1) for length, count in zip(size, n)]
+    points = np.stack(np.meshgrid(x, y, z, indexing='ij'), axis=-1).reshape(-1, 3)
+    node = lambda i, j, k: (i * (ny + 1) + j) * (nz + 1) + k
+    i, j, k = [index.ravel() for index in np.meshgrid(np.arange(nx), np.arange(ny), np.arange(nz), indexing='ij')]
+    hexes = np.stack([node(i, j, k), node(i + 1, j, k), node(i + 1, j + 1, k), node(i, j + 1, k),
+                      node(i, j, k + 1), node(i + 1, j, k + 1), node(i + 1, j + 1, k + 1), node(i, j + 1, k + 1)], axis=1)
+    hexes = hexes[np.random.default_rng(seed).permutation(len(hexes))]
+    if tetrahedra:
+        local = [[0, 1, 2, 6], [0, 2, 3, 6], [0, 3, 7, 6], [0, 7, 4, 6], [0, 4, 5, 6], [0, 5, 1, 6]]
+        nodes = np.concatenate([hexes[:, tet] for tet in local])
+        # Every other cell inverted (as gmsh may give them), the faces are oriented by build
+        nodes[::2] = nodes[::2][:, [0, 2, 1, 3]]
+        cells = [(4, nodes)]
+    else:
+        hexes[::2] = hexes[::2][:, [4, 5, 6, 7, 0, 1, 2, 3]]
+        cells = [(5, hexes)]
+
+    # Boundary faces: the faces of the cells lying on a side of the box
+    element_type, nodes = cells[0]
+    faces = np.concatenate([nodes[:, face] for face in foamMesh.CELL_FACES[element_type]])
+    faces = np.unique(np.sort(faces, axis=1), axis=0)
+    patches = []
+    for axis, name in enumerate("xyz"):
+        for side, value in [("min", 0.0), ("max", size[axis])]:
+            on_side = np.all(np.isclose(points[faces, axis], value), axis=1)
+            patches.append((name + side, foamMesh._pad(faces[on_side])))
+    return points, cells, patches
+
+
+# Function to compute the volumes of the cells of a mesh (divergence theorem on the faces)
+def cell_volumes(mesh):
+    centres, areas = foamMesh.face_geometry(mesh["points"], mesh["faces"])
+    flux = np.einsum('ij,ij->i', centres, areas) / 3
+    n_internal = len(mesh["neighbour"])
+    return (np.bincount(mesh["owner"], flux, minlength=mesh["n_cells"])
+            - np.bincount(mesh["neighbour"], flux[:n_internal], minlength=mesh["n_cells"]))
+
+
+# Function to check the structure and the geometry of a polyMesh
+# Output:
+#   errors - List of the failed checks
+def check_mesh(mesh, n_cells):
+    errors = []
+    owner, neighbour, faces = mesh["owner"], mesh["neighbour"], mesh["faces"]
+    n_internal = len(neighbour)
+    if mesh["n_cells"] != n_cells or set(np.concatenate((owner, neighbour)).tolist()) != set(range(n_cells)):
+        errors.append("cells missing")
+
+    # Upper triangular order: owner < neighbour, internal faces by owner then neighbour
+    if np.any(owner[:n_internal] >= neighbour):
+        errors.append("owner not lower than neighbour")
+    if np.any(np.lexsort((neighbour, owner[:n_internal])) != np.arange(n_internal)):
+        errors.append("internal faces not in upper triangular order")
+    # Patches: contiguous after the internal faces and covering the boundary faces
+    start = n_internal
+    for name, patch_start, n_faces in mesh["patches"]:
+        if patch_start != start:
+            errors.append(f"patch {name} starts at {patch_start} instead of {start}")
+        start = patch_start + n_faces
+    if start != len(faces):
+        errors.append("boundary faces outside the patches")
+
+    # Orientation: the area vectors point out of the owner (towards the neighbour)
+    face_centres, areas = foamMesh.face_geometry(mesh["points"], faces)
+    cell_centres = foamMesh.cell_centres(mesh)
+    direction = np.concatenate((cell_centres[neighbour], face_centres[n_internal:])) - cell_centres[owner]
+    if np.any(np.einsum('ij,ij->i', areas, direction) <= 0):
+        errors.append("faces oriented into their owner")
+    # Closed cells and volume of the box
+    closed = np.column_stack([np.bincount(owner, areas[:, k], minlength=n_cells)
+                              - np.bincount(neighbour, areas[:n_internal, k], minlength=n_cells) for k in range(3)])
+    if np.abs(closed).max() > 1e-12:
+        errors.append("cells not closed")
+    volumes = cell_volumes(mesh)
+    if np.any(volumes <= 0):
+        errors.append(f"{np.sum(volumes <= 0)} cells of negative volume")
+    if not np.isclose(volumes.sum(), np.prod(size)):
+        errors.append(f"volume {volumes.sum():g} instead of {np.prod(size):g}")
+    return errors
+
+
+# Function to check that a mesh is read back as written
+def check_read_back(mesh, binary):
+    with tempfile.TemporaryDirectory() as mesh_case:
+        foamMesh.write(mesh, mesh_case, binary=binary)
+        read = foamMesh.read(mesh_case)
+    errors = [name + " differs" for name in ["points", "faces", "owner", "neighbour"] if not np.array_equal(read[name], mesh[name])]
+    if read["n_cells"] != mesh["n_cells"] or read["patches"] != mesh["patches"]:
+        errors.append("cells or patches differ")
+    return errors
+
+
+# Function to run the checks on a box mesh
+# Output:
+#   failed - Number of failed checks
+def run_checks(name, n, tetrahedra):
+    points, cells, patches = box_mesh(n, tetrahedra)
+    n_cells = len(cells[0][1])
+    mesh = foamMesh.build(points, cells, patches)
+    n_internal = len(mesh["neighbour"])
+    renumbered, cell_map = foamMesh.renumber(mesh, foamMesh.rcm(mesh["owner"][:n_internal], mesh["neighbour"], n_cells))
+    band = foamMesh.bandwidth(mesh["owner"][:n_internal], mesh["neighbour"], n_cells)
+    new_band = foamMesh.bandwidth(renumbered["owner"][:n_internal], renumbered["neighbour"], n_cells)
+
+    checks = {
+        "build": check_mesh(mesh, n_cells),
+        "renumber": check_mesh(renumbered, n_cells)
+                    + ([] if np.array_equal(np.sort(cell_map), np.arange(n_cells)) else ["cell map is not a permutation"])
+                    + ([] if np.allclose(cell_volumes(renumbered)[cell_map], cell_volumes(mesh)) else ["volumes of the cells changed"])
+                    + ([] if new_band[0] < band[0] and new_band[1] < band[1] else [f"bandwidth {band} -> {new_band}"]),
+        "binary": check_read_back(renumbered, True),
+        "ascii": check_read_back(renumbered, False),
+    }
+    print(f"{name}: {n_cells} cells, {n_internal} internal faces, bandwidth {band[0]} -> {new_band[0]}, "
+          f"profile {band[1]} -> {new_band[1]}")
+    for check, errors in checks.items():
+        print(f"  {check:9s} " + ("ok" if not errors else "FAILED: " + ", ".join(errors)))
+    return sum(len(errors) > 0 for errors in checks.values())
+
+
+if __name__ == "__main__":
+    failed = run_checks("hexahedra", hex_cells, False) + run_checks("tetrahedra", tet_cells, True)
+    sys.exit(1 if failed else 0)
@@ -1,4 +1,7 @@
 import LEIairfoilMesh
+import meshCheck
+import runOpenFoam
+import foamDict
 import subprocess
 import os
 import numpy as np
@@ -49,33 +52,10 @@ def update_mesh(U, Corde_length, Depth, tube_size, at, Seam_angle, Sail_angle, n
     subprocess.run(['gmshToFoam mesh.msh'], shell=True, cwd=repertory)
     
     # Evaluate the quality of the mesh
-    subprocess.run(['checkMesh'], shell=True, cwd=repertory)
+    meshCheck.optimise_mesh(repertory, renumbering=None, on_bad_mesh="flag")
 
     # Modify the boundary dictionary
-    f = open(repertory + '/constant/polyMesh/boundary', 'r+')
-    t = f.readlines()
-    new_lines = []
-    replace = [
-        '        type            empty;\n', 
-        '        physicalType    empty;\n', 
-        '        type            wall;\n',
-        '        physicalType    wall;\n',
-        '        type            patch;\n',
-        '        physicalType    inlet;\n',
-        '        type            patch;\n',
-        '        physicalType    outlet;\n'
-    ]
-    k = 0
-    for line in t:
-        if 'patch' in line:
-            new_lines = np.append(new_lines, replace[k])
-            k = k + 1
-        else:
-            new_lines = np.append(new_lines, line)
-    f.close()
-    f = open(repertory + '/constant/polyMesh/boundary', 'w')
-    f.writelines(new_lines)
-    f.close()
+    runOpenFoam.patch_boundary(repertory)
 
     # Change the wind direction (equivalent to changing the AOA)
     v = U  # wind speed
@@ -83,34 +63,15 @@ def update_mesh(U, Corde_length, Depth, tube_size, at, Seam_angle, Sail_angle, n
     vy = v * np.sin(alpha * np.pi / 180)
     
     # Modify the 0/U dictionary
-    f = open(repertory + '/0/U', 'r+')
-    t = f.readlines()
-    new_lines = []
-    for line in t:
-        if 'uniform' in line:
-            new_lines = np.append(new_lines, 'internalField   uniform (' + str(vx) + ' ' + str(vy) + ' ' + '0);\n')
-        else:
-            new_lines = np.append(new_lines, line)
-    f.close()
-    f = open(repertory + '/0/U', 'w')
-    f.writelines(new_lines)
-    f.close()
+    field = foamDict.read(repertory + '/0/U')
+    field['internalField'] = 'uniform ' + foamDict.format_value((vx, vy, 0))
+    foamDict.write(field, repertory + '/0/U')
 
     # Change the direction of liftDir/dragDir
-    f = open(repertory + '/system/controlDict', 'r+')
-    t = f.readlines()
-    new_lines = []
-    for line in t:
-        if 'liftDir' in line:
-            new_lines = np.append(new_lines, '        liftDir     (' + str(-np.sin(alpha * np.pi / 180)) + ' ' + str(np.cos(alpha * np.pi / 180)) + ' ' + '0);\n')
-        elif 'dragDir' in line:
-            new_lines = np.append(new_lines, '        dragDir     (' + str(np.cos(alpha * np.pi / 180)) + ' ' + str(np.sin(alpha * np.pi / 180)) + ' ' + '0);\n')
-        else:
-            new_lines = np.append(new_lines, line)
-    f.close()
-    f = open(repertory + '/system/controlDict', 'w')
-    f.writelines(new_lines)
-    f.close()
+    control = foamDict.read(repertory + '/system/controlDict')
+    control.set('functions/forces/liftDir', (-np.sin(alpha * np.pi / 180), np.cos(alpha * np.pi / 180), 0))
+    control.set('functions/forces/dragDir', (np.cos(alpha * np.pi / 180), np.sin(alpha * np.pi / 180), 0))
+    foamDict.write(control, repertory + '/system/controlDict')
 
     # Run simpleFoam (commented out in the original code)
     # subprocess.run(['foamRun', '>', 'log'], shell=True, cwd=repertory)
@@ -118,4 +79,5 @@ def update_mesh(U, Corde_length, Depth, tube_size, at, Seam_angle, Sail_angle, n
     return ()
 
 # Call the update_mesh function with the defined parameters
-update_mesh(Va, Corde_length, Depth, tube_size, at, Seam_angle, Sail_angle, nb_pts, alpha, lc_prof, lc_init, xmax, ymax, ep, yh)
+if __name__ == "__main__":
+    update_mesh(Va, Corde_length, Depth, tube_size, at, Seam_angle, Sail_angle, nb_pts, alpha, lc_prof, lc_init, xmax, ymax, ep, yh)